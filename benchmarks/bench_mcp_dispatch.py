@@ -0,0 +1,80 @@
+"""
+bench_mcp_dispatch.py — cold vs warm MCP tool dispatch
+
+Usage (from the project root):
+    python benchmarks/bench_mcp_dispatch.py [--iterations 10000]
+
+"cold" numbers are measured in a fresh interpreter per tool, so they include
+importing the tool module the first time it is resolved.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+# Importing src.* initializes the configured DB; keep it (and the cold-import
+# subprocesses, which inherit the environment) off the source tree
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="bench_mcp_"), "bench.db")
+
+COLD_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import src.mcp as mcp
+t1 = time.perf_counter()
+mcp.resolve_tool({tool!r})
+t2 = time.perf_counter()
+print(f"{{(t1 - t0) * 1000:.3f}} {{(t2 - t1) * 1000:.3f}}")
+"""
+
+
+def cold(tool: str):
+    """(import src.mcp ms, first resolve ms) in a fresh interpreter."""
+    out = subprocess.run(
+        [sys.executable, "-c", COLD_SNIPPET.format(tool=tool)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout.strip().splitlines()[-1]
+    import_ms, resolve_ms = out.split()
+    return float(import_ms), float(resolve_ms)
+
+
+def warm(iterations: int):
+    """Average µs per run_call of a no-network tool once it is resolved."""
+    import contextlib
+    import io
+    from src.mcp import run_call
+
+    call = {"tool": "calendar.create_event", "args": {"title": "bench"}}
+    run_call(call)
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            run_call(call)
+        elapsed = time.perf_counter() - t0
+    return elapsed / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=10000)
+    args = parser.parse_args()
+
+    from src.mcp import TOOL_MAP
+
+    print(f"{'tool':<26} {'import src.mcp (ms)':>20} {'cold resolve (ms)':>18}")
+    for tool in TOOL_MAP:
+        try:
+            import_ms, resolve_ms = cold(tool)
+            print(f"{tool:<26} {import_ms:>20.2f} {resolve_ms:>18.2f}")
+        except subprocess.CalledProcessError as e:
+            print(f"{tool:<26} {'failed':>20} ({e.stderr.strip().splitlines()[-1]})")
+
+    print(f"\nwarm run_call (calendar.create_event): {warm(args.iterations):.2f} µs/call")
+
+
+if __name__ == "__main__":
+    main()
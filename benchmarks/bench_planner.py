@@ -0,0 +1,295 @@
+"""
+bench_planner.py — planner latency and accuracy against a stub Ollama server
+
+Usage (from the project root):
+    python benchmarks/bench_planner.py [--token-latency-ms 40] [--prompt-latency-ms 250]
+                                       [--deadline 8] [--corpus benchmarks/planner_corpus.jsonl]
+                                       [--repeat 1] [-v]
+
+Every instruction in the corpus is run through planner.parse_command and the
+/remind reminder path (rule fast path, then planner.plan_within). Model calls go to a
+local HTTP server that speaks Ollama's streaming /api/generate: it waits
+--prompt-latency-ms, then streams the corpus' expected plan a few characters
+per token with --token-latency-ms between tokens, followed by filler text the
+planner should never wait for. Nothing needs a real model, Telegram or Gmail;
+tasks are written to a throwaway SQLite file.
+
+Reported per path: p50/p95/max time until the user is answered, fast-path
+hit rate and how many model calls missed PLANNER_DEADLINE_SECONDS
+(--deadline). Accuracy is only scored for plans the deterministic code
+answered with (nl_rules fast path, or nl_rules.guess_reminder past the
+deadline) — the stub serves the expected plans, so scoring its answers would
+only measure the corpus against itself. A low deadline therefore shows how
+often the guesses are right.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+PATHS = ("parse_command", "remind")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+
+def load_corpus(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def expected_rule(case, now: datetime.datetime) -> str:
+    """The RRULE a case should produce when planned at ``now``."""
+    if "rrule" in case:
+        return case["rrule"]
+    once = case["once"]
+    if "in_minutes" in once:
+        when = now + datetime.timedelta(minutes=once["in_minutes"])
+    else:
+        hour, minute = map(int, (once.get("time") or once["next_time"]).split(":"))
+        offset = once.get("day_offset", 0)
+        if "weekday" in once:
+            offset = (WEEKDAYS.index(once["weekday"]) - now.weekday()) % 7
+        when = (now + datetime.timedelta(days=offset)).replace(hour=hour, minute=minute, second=0)
+        if "next_time" in once and when <= now:
+            when += datetime.timedelta(days=1)
+        elif "weekday" in once and when <= now:
+            when += datetime.timedelta(days=7)
+    return f"RRULE:FREQ=ONCE;RUN_AT={when.replace(microsecond=0).isoformat()}"
+
+
+def _rule_parts(rule: str):
+    parts = {}
+    for item in (rule or "").replace("RRULE:", "").split(";"):
+        if "=" in item:
+            k, v = item.split("=", 1)
+            parts[k.strip().upper()] = v.strip().upper()
+    return parts
+
+
+def rules_match(got: str, want: str, slack_seconds: int = 120) -> bool:
+    """Compare RRULEs part by part; RUN_AT may differ by the time the run itself took."""
+    g, w = _rule_parts(got), _rule_parts(want)
+    g_at, w_at = g.pop("RUN_AT", None), w.pop("RUN_AT", None)
+    if g != w:
+        return False
+    if g_at or w_at:
+        try:
+            delta = datetime.datetime.fromisoformat(g_at) - datetime.datetime.fromisoformat(w_at)
+        except (TypeError, ValueError):
+            return False
+        return abs(delta.total_seconds()) <= slack_seconds
+    return True
+
+
+class StubOllama:
+    """
+    Answers /api/generate with the corpus' expected plan for the prompt's
+    instruction, so the planner parses realistic output. Not a model under test.
+    """
+
+    FILLER = [" ", "Hope", " this", " helps", "!", " Let", " me", " know", "."]
+
+    def __init__(self, corpus, now_fn, prompt_latency: float, token_latency: float):
+        self.answers = {c["text"].strip().lower(): c for c in corpus}
+        self.now_fn = now_fn
+        self.prompt_latency = prompt_latency
+        self.token_latency = token_latency
+        self.requests = 0
+        self.tokens_sent = 0
+        self.tokens_skipped = 0
+        self._lock = threading.Lock()
+
+    def answer(self, prompt: str) -> str:
+        inputs = re.findall(r"Input:\s*(.+?)\s*\nOutput:", prompt)
+        case = self.answers.get(inputs[-1].strip().strip('"').lower()) if inputs else None
+        if case is None:
+            plan = {"task_type": "reminder", "schedule_rule": "RRULE:FREQ=DAILY;INTERVAL=1", "text": "?"}
+        else:
+            plan = {"task_type": case["task_type"], "schedule_rule": expected_rule(case, self.now_fn()),
+                    "text": case["text"]}
+        return json.dumps(plan)
+
+    def tokens(self, prompt: str):
+        text = self.answer(prompt)
+        return [text[i:i + 4] for i in range(0, len(text), 4)] + self.FILLER
+
+    def serve(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+                with stub._lock:
+                    stub.requests += 1
+                if not body.get("prompt"):  # warm-up
+                    self._send_json({"response": "", "done": True})
+                    return
+                time.sleep(stub.prompt_latency)
+                tokens = stub.tokens(body["prompt"])
+                if not body.get("stream"):
+                    time.sleep(stub.token_latency * len(tokens))
+                    self._send_json({"response": "".join(tokens), "done": True})
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                sent = 0
+                try:
+                    for token in tokens:
+                        time.sleep(stub.token_latency)
+                        self._chunk({"response": token, "done": False})
+                        sent += 1
+                    self._chunk({"response": "", "done": True})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the planner hung up once the plan was complete
+                with stub._lock:
+                    stub.tokens_sent += sent
+                    stub.tokens_skipped += len(tokens) - sent
+
+            def _chunk(self, obj):
+                data = (json.dumps(obj) + "\n").encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def _send_json(self, obj):
+                data = json.dumps(obj).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def run_case(path: str, text: str):
+    """(plan the user is answered with, Future of a late LLM plan or None)."""
+    from src import nl_rules, planner
+
+    if path == "parse_command":
+        return planner.parse_command(text), None
+    plan = nl_rules.parse_reminder(text, source="remind")
+    if plan:
+        return plan, None
+    typed, late = planner.plan_within(planner.reminder_prompt(text))
+    if late is not None:
+        # Past the deadline /remind answers with a guess; the late plan corrects it afterwards
+        return nl_rules.guess_reminder(text), late
+    return (typed.to_dict() if typed else None), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "benchmarks", "planner_corpus.jsonl"))
+    parser.add_argument("--token-latency-ms", type=float, default=40.0)
+    parser.add_argument("--prompt-latency-ms", type=float, default=250.0)
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="PLANNER_DEADLINE_SECONDS for the run (default: from the environment)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("-v", "--verbose", action="store_true", help="list every wrong scored plan")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    db_dir = tempfile.mkdtemp(prefix="bench_planner_")
+    stub = StubOllama(corpus, lambda: datetime.datetime.now(tz), args.prompt_latency_ms / 1000,
+                      args.token_latency_ms / 1000)
+    server = stub.serve()
+
+    # src.config reads these at import time
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(db_dir, "bench.db")
+    os.environ["LLM_CACHE_ENABLED"] = "0"  # every LLM case should reach the stub
+    os.environ["OLLAMA_WARMUP"] = "0"
+    if args.deadline is not None:
+        os.environ["PLANNER_DEADLINE_SECONDS"] = str(args.deadline)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from src import db, nl_rules, planner
+        db.init_db()
+    tz = nl_rules.TZ
+
+    results = {path: [] for path in PATHS}  # (seconds, answered by, task_type ok, rrule ok, case, plan)
+    deadline_misses = {path: 0 for path in PATHS}
+    for _ in range(args.repeat):
+        for case in corpus:
+            for path in case.get("paths", PATHS):
+                late, misses_before, requests_before = None, planner.DEADLINE_STATS["late"], stub.requests
+                with contextlib.redirect_stdout(io.StringIO()):
+                    t0 = time.perf_counter()
+                    try:
+                        plan, late = run_case(path, case["text"])
+                    except Exception as e:
+                        plan = {"error": repr(e)}
+                    elapsed = time.perf_counter() - t0
+                    missed = planner.DEADLINE_STATS["late"] - misses_before
+                    answered_by = "guess" if missed else "model" if stub.requests > requests_before else "rules"
+                    if late is not None:
+                        late.result()  # let the stub go idle before the next case
+                    deadline_misses[path] += missed
+                plan = plan or {}
+                want = expected_rule(case, datetime.datetime.now(tz))
+                results[path].append((elapsed, answered_by, plan.get("task_type") == case["task_type"],
+                                      rules_match(plan.get("schedule_rule"), want), case, plan))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        planner._LLM_POOL.shutdown(wait=True)  # late parse_command corrections finish quietly
+
+    fast = nl_rules.stats()
+    print(f"corpus: {len(corpus)} instructions x{args.repeat}   "
+          f"stub: {args.prompt_latency_ms:.0f} ms prompt + {args.token_latency_ms:.0f} ms/token")
+    print(f"\n{'path':<14} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} "
+          f"{'fast-path':>10} {'late LLM':>9} {'scored':>7} {'task_type':>10} {'rrule':>8}")
+    for path, rows in results.items():
+        if not rows:
+            continue
+        ms = [r[0] * 1000 for r in rows]
+        hit_rate = (fast.get(path) or {}).get("hit_rate")
+        scored = [r for r in rows if r[1] != "model"]
+        share = (lambda i: f"{sum(r[i] for r in scored) / len(scored):.0%}") if scored else (lambda i: "—")
+        print(f"{path:<14} {len(rows):>4} {percentile(ms, 50):>9.1f} {percentile(ms, 95):>9.1f} {max(ms):>9.1f} "
+              f"{(f'{hit_rate:.0%}' if hit_rate is not None else '—'):>10} {deadline_misses[path]:>9} "
+              f"{len(scored):>7} {share(2):>10} {share(3):>8}")
+    print("\ntask_type/rrule: share right among the 'scored' plans (fast path and deadline guesses); "
+          "stub-served plans are not scored")
+    print(f"\nstub: {stub.requests} requests, {stub.tokens_sent} tokens streamed, "
+          f"{stub.tokens_skipped} skipped by early stream close")
+
+    if args.verbose:
+        for path, rows in results.items():
+            for _, answered_by, type_ok, rule_ok, case, plan in rows:
+                if answered_by != "model" and not (type_ok and rule_ok):
+                    print(f"✗ [{path}/{answered_by}] {case['text']!r}: "
+                          f"got {plan.get('task_type')} {plan.get('schedule_rule')}, "
+                          f"want {case['task_type']} {case.get('rrule') or case.get('once')}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
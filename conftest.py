@@ -0,0 +1,19 @@
+"""Shared pytest fixtures for the root-level test_*.py scripts."""
+
+import os
+import tempfile
+
+import pytest
+
+# src.db creates its schema on import: keep that out of the source tree
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="ai_agent_tests_"), "import.db")
+
+
+@pytest.fixture
+def tmp_db(tmp_path, monkeypatch):
+    """Point src.db at a fresh SQLite file with the full schema."""
+    from src import db
+
+    monkeypatch.setattr(db, "DB_FILE", str(tmp_path / "test.db"))
+    db.init_db()
+    return db.DB_FILE
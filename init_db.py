@@ -28,10 +28,15 @@ CREATE TABLE IF NOT EXISTS task (
     params_json TEXT,
     schedule_rule TEXT,
     enabled INTEGER DEFAULT 1,
+    status TEXT NOT NULL DEFAULT 'active',
+    tool TEXT,
+    text TEXT,
     created_at TEXT DEFAULT (datetime('now')),
     updated_at TEXT DEFAULT (datetime('now'))
 );
 
+CREATE INDEX IF NOT EXISTS idx_task_status ON task (status, enabled);
+
 CREATE TABLE IF NOT EXISTS run (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     task_id INTEGER,
@@ -69,6 +74,75 @@ CREATE TABLE IF NOT EXISTS order_chat_session (
     store_chat_id TEXT,
     active INTEGER DEFAULT 1
 );
+
+CREATE TABLE IF NOT EXISTS scheduler_lease (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS job_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id INTEGER NOT NULL,
+    scheduled_at TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    worker TEXT,
+    last_error TEXT,
+    enqueued_at REAL,
+    finished_at REAL,
+    UNIQUE (task_id, scheduled_at)
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_queue_claim ON job_queue (status, scheduled_at);
+
+CREATE TABLE IF NOT EXISTS tool_execution (
+    idempotency_key TEXT PRIMARY KEY,
+    task_id INTEGER,
+    tool TEXT,
+    status TEXT NOT NULL,
+    output_json TEXT,
+    error_text TEXT,
+    executions INTEGER NOT NULL DEFAULT 1,
+    started_at REAL,
+    finished_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used);
+
+CREATE TABLE IF NOT EXISTS broadcast (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    parse_mode TEXT,
+    created_by TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    cursor_id INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    delivered INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    owner TEXT,
+    lease_until REAL,
+    created_at REAL,
+    updated_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS email_summary_cache (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
 """)
 
 conn.commit()
@@ -15,10 +15,15 @@ CREATE TABLE IF NOT EXISTS task (
     params_json TEXT,
     schedule_rule TEXT,
     enabled INTEGER DEFAULT 1,
+    status TEXT NOT NULL DEFAULT 'active',  -- active | completed (fired one-shot)
+    tool TEXT,                              -- first call's tool (denormalized for list views)
+    text TEXT,                              -- first call's text/item (denormalized for list views)
     created_at TEXT DEFAULT (datetime('now')),
     updated_at TEXT DEFAULT (datetime('now'))
 );
 
+CREATE INDEX IF NOT EXISTS idx_task_status ON task (status, enabled);
+
 
 -- 🧾 Run Table (for logging task executions)
 CREATE TABLE IF NOT EXISTS run (
@@ -70,3 +75,78 @@ CREATE TABLE IF NOT EXISTS note (
     created_at TEXT NOT NULL,
     pinned INTEGER DEFAULT 0
 );
+
+-- 🔒 Scheduler Lease (only the holder's scheduler fires jobs)
+CREATE TABLE IF NOT EXISTS scheduler_lease (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+-- 📥 Job Queue (scheduler enqueues due tasks, worker processes claim them)
+CREATE TABLE IF NOT EXISTS job_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id INTEGER NOT NULL,
+    scheduled_at TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',  -- queued | running | done | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    worker TEXT,
+    last_error TEXT,
+    enqueued_at REAL,
+    finished_at REAL,
+    UNIQUE (task_id, scheduled_at)
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_queue_claim ON job_queue (status, scheduled_at);
+
+-- 🔑 Tool Executions (idempotency keys: a redelivered call becomes a no-op)
+CREATE TABLE IF NOT EXISTS tool_execution (
+    idempotency_key TEXT PRIMARY KEY,  -- <task id>@<fire time>:<call id>
+    task_id INTEGER,
+    tool TEXT,
+    status TEXT NOT NULL,             -- running | done | failed
+    output_json TEXT,
+    error_text TEXT,
+    executions INTEGER NOT NULL DEFAULT 1,
+    started_at REAL,
+    finished_at REAL
+);
+
+-- 🧠 LLM Cache (Ollama answers keyed by model + normalized prompt)
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,  -- sha256(model + normalized prompt)
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used);
+
+-- 📣 Broadcasts (admin fan-out; cursor_id makes them resumable)
+CREATE TABLE IF NOT EXISTS broadcast (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    parse_mode TEXT,
+    created_by TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending | running | done
+    cursor_id INTEGER NOT NULL DEFAULT 0,   -- last user_registry.id sent
+    total INTEGER,
+    delivered INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    owner TEXT,                              -- run currently sending it (claim token)
+    lease_until REAL,                        -- owner's claim expires at; another run may then resume it
+    created_at REAL,
+    updated_at REAL
+);
+
+-- 📨 Email summary cache (one-line summaries per message, reused by later digests)
+CREATE TABLE IF NOT EXISTS email_summary_cache (
+    key TEXT PRIMARY KEY,  -- sha256(model + message text)
+    model TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
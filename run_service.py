@@ -1,20 +1,48 @@
 # -*- coding: utf-8 -*-
+import argparse
+import multiprocessing
 from src.db import init_db
-from src.scheduler import start, register_all_tasks
-from src.config import TELEGRAM_CHAT_ID
+from src.scheduler import start
+from src.job_queue import run_worker
+from src.config import WORKER_PROCESSES
 from src.utils import setup_logger
 logger = setup_logger()
 logger.info("Service started successfully")
 
 
-if __name__ == '__main__':
-    init_db()
-    register_all_tasks(TELEGRAM_CHAT_ID)
-    start()
-    print('Scheduler started. Press Ctrl+C to exit.')
-    import time
+def run_workers(count: int):
+    """Start ``count`` worker processes and wait for them (Ctrl+C stops all)."""
+    procs = [
+        multiprocessing.Process(target=run_worker, name=f"worker-{i + 1}", daemon=True)
+        for i in range(count)
+    ]
+    for p in procs:
+        p.start()
+    print(f'👷 {count} worker process(es) running. Press Ctrl+C to exit.')
     try:
-        while True:
-            time.sleep(10)
+        for p in procs:
+            p.join()
     except KeyboardInterrupt:
-        print('Shutting down')
\ No newline at end of file
+        for p in procs:
+            p.terminate()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="AI Micro Agent scheduler service")
+    parser.add_argument(
+        "--mode", choices=["all", "scheduler", "worker"], default="all",
+        help="all: schedule and run jobs in-process; scheduler: only enqueue due tasks "
+             "into job_queue; worker: run queued jobs",
+    )
+    parser.add_argument("--workers", type=int, default=WORKER_PROCESSES,
+                        help="number of worker processes for --mode worker")
+    args = parser.parse_args()
+
+    init_db()
+    if args.mode == "worker":
+        run_workers(args.workers)
+    else:
+        # start() registers every enabled task, takes part in the scheduler lease
+        # election and blocks until Ctrl+C
+        start(enqueue=args.mode == "scheduler")
+    print('Shutting down')
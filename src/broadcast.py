@@ -0,0 +1,189 @@
+# src/broadcast.py
+"""
+Admin broadcasts to every registered chat.
+
+Recipients are streamed from user_registry in id-ordered pages and each page is
+sent through messaging.send_many_async. After every page the broadcast row
+records its cursor (last user_registry id sent) and counters, so a broadcast
+interrupted by a crash resumes after the last finished page instead of
+starting over.
+
+A run first claims the row (owner token + lease, renewed with every page), so
+two processes resuming the same interrupted broadcast can't both send it; a
+claim whose process died is taken over once BROADCAST_LEASE_SECONDS pass.
+"""
+import asyncio
+import time
+import uuid
+
+from src.db import get_conn
+from src.config import BROADCAST_LEASE_SECONDS, BROADCAST_PAGE_SIZE
+from src.tools.messaging import close_async_session, send_many_async
+
+
+def _ensure_table(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS broadcast (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            parse_mode TEXT,
+            created_by TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            cursor_id INTEGER NOT NULL DEFAULT 0,
+            total INTEGER,
+            delivered INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            owner TEXT,
+            lease_until REAL,
+            created_at REAL,
+            updated_at REAL
+        )
+        """
+    )
+
+
+def create_broadcast(text: str, created_by: str = None, parse_mode: str = None) -> int:
+    """Record a new broadcast (status 'pending') and return its id."""
+    conn = get_conn()
+    cur = conn.cursor()
+    _ensure_table(cur)
+    cur.execute("SELECT COUNT(*) FROM user_registry")
+    total = cur.fetchone()[0]
+    now = time.time()
+    cur.execute(
+        "INSERT INTO broadcast (text, parse_mode, created_by, total, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (text, parse_mode, created_by, total, now, now),
+    )
+    conn.commit()
+    broadcast_id = cur.lastrowid
+    conn.close()
+    return broadcast_id
+
+
+def get_broadcast(broadcast_id: int):
+    """Return the broadcast row as a dict, or None."""
+    conn = get_conn()
+    cur = conn.cursor()
+    _ensure_table(cur)
+    cur.execute(
+        "SELECT id, text, parse_mode, created_by, status, cursor_id, total, delivered, failed, last_error "
+        "FROM broadcast WHERE id = ?",
+        (broadcast_id,),
+    )
+    row = cur.fetchone()
+    conn.close()
+    if not row:
+        return None
+    keys = ("id", "text", "parse_mode", "created_by", "status", "cursor_id", "total", "delivered", "failed", "last_error")
+    return dict(zip(keys, row))
+
+
+def unfinished_broadcasts(claimable: bool = False):
+    """
+    Ids of broadcasts that were pending or interrupted mid-run. With ``claimable``
+    only those no live run holds (see claim_broadcast).
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    _ensure_table(cur)
+    query = "SELECT id FROM broadcast WHERE status IN ('pending', 'running')"
+    if claimable:
+        cur.execute(query + " AND (lease_until IS NULL OR lease_until < ?) ORDER BY id", (time.time(),))
+    else:
+        cur.execute(query + " ORDER BY id")
+    ids = [r[0] for r in cur.fetchall()]
+    conn.close()
+    return ids
+
+
+def _next_page(cursor_id: int, page_size: int):
+    conn = get_conn()
+    cur = conn.cursor()
+    # Keyset pagination: cheap on the primary key however far into the registry we are
+    cur.execute(
+        "SELECT id, chat_id FROM user_registry WHERE id > ? ORDER BY id LIMIT ?",
+        (cursor_id, page_size),
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def claim_broadcast(broadcast_id: int, owner: str, lease_seconds: float = BROADCAST_LEASE_SECONDS) -> bool:
+    """
+    Take an unfinished broadcast for ``owner`` unless another run holds a live
+    lease on it. A single conditional UPDATE, so concurrent resumers can't both win.
+    """
+    now = time.time()
+    conn = get_conn()
+    cur = conn.cursor()
+    _ensure_table(cur)
+    cur.execute(
+        "UPDATE broadcast SET status = 'running', owner = ?, lease_until = ?, updated_at = ? "
+        "WHERE id = ? AND status IN ('pending', 'running') AND (lease_until IS NULL OR lease_until < ?)",
+        (owner, now + lease_seconds, now, broadcast_id, now),
+    )
+    claimed = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    return claimed
+
+
+def _save_progress(broadcast_id: int, owner: str, status: str, cursor_id: int, delivered: int, failed: int,
+                   last_error=None) -> bool:
+    """Record a finished page and renew the lease; False if ``owner`` lost the claim."""
+    now = time.time()
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE broadcast SET status = ?, cursor_id = ?, delivered = delivered + ?, failed = failed + ?, "
+        "last_error = COALESCE(?, last_error), lease_until = ?, updated_at = ? WHERE id = ? AND owner = ?",
+        (status, cursor_id, delivered, failed, last_error,
+         None if status == "done" else now + BROADCAST_LEASE_SECONDS, now, broadcast_id, owner),
+    )
+    saved = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    return saved
+
+
+async def _run_broadcast(broadcast_id: int, page_size: int, progress):
+    owner = uuid.uuid4().hex
+    if not claim_broadcast(broadcast_id, owner):
+        print(f"📣 Broadcast {broadcast_id} is finished or being sent by another run; skipping.")
+        return None
+    b = get_broadcast(broadcast_id)
+    cursor_id = b["cursor_id"]
+    try:
+        while True:
+            page = _next_page(cursor_id, page_size)
+            if not page:
+                break
+            result = await send_many_async([chat_id for _, chat_id in page], b["text"], b["parse_mode"])
+            cursor_id = page[-1][0]
+            last_error = result["failed"][-1][1] if result["failed"] else None
+            if not _save_progress(broadcast_id, owner, "running", cursor_id, result["delivered"],
+                                  len(result["failed"]), last_error):
+                print(f"⚠️ Broadcast {broadcast_id}: lease lost to another run; stopping.")
+                return None
+            if progress:
+                progress(get_broadcast(broadcast_id))
+    finally:
+        await close_async_session()
+    _save_progress(broadcast_id, owner, "done", cursor_id, 0, 0)
+    return get_broadcast(broadcast_id)
+
+
+def run_broadcast(broadcast_id: int, page_size: int = BROADCAST_PAGE_SIZE, progress=None):
+    """
+    Send (or resume) a broadcast page by page. ``progress(row)`` is called after
+    each page. Returns the final broadcast row, or None if another run holds it.
+    """
+    print(f"📣 Running broadcast {broadcast_id}")
+    b = asyncio.run(_run_broadcast(broadcast_id, page_size, progress))
+    if b:
+        print(f"📣 Broadcast {broadcast_id}: {b['delivered']} delivered, {b['failed']} failed")
+    return b
@@ -14,8 +14,105 @@ IMAP_USER = os.getenv('IMAP_USER')
 IMAP_PASSWORD = os.getenv('IMAP_PASSWORD')
 OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'ollama-model')
+# Requests the Ollama server runs at once (match its OLLAMA_NUM_PARALLEL); extra calls queue by priority
+OLLAMA_MAX_PARALLEL = int(os.getenv('OLLAMA_MAX_PARALLEL', '2'))
+OLLAMA_TIMEOUT_SECONDS = float(os.getenv('OLLAMA_TIMEOUT_SECONDS', '90'))
+# How long Ollama keeps the model loaded after a request ("30m", "-1" = forever); warm-up loads it at startup
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+OLLAMA_WARMUP = os.getenv('OLLAMA_WARMUP', 'true').lower() in ('1', 'true', 'yes')
+# Longest a user waits on the model for a plan; after that they get a rule-based guess and the late answer corrects it
+PLANNER_DEADLINE_SECONDS = float(os.getenv('PLANNER_DEADLINE_SECONDS', '8'))
+# Model tiers: a small model for short JSON plans / per-message lines, a large one for digests.
+# Both default to OLLAMA_MODEL; OLLAMA_MODEL_ROUTES maps each LLM task to a tier.
+OLLAMA_MODEL_SMALL = os.getenv('OLLAMA_MODEL_SMALL') or OLLAMA_MODEL
+OLLAMA_MODEL_LARGE = os.getenv('OLLAMA_MODEL_LARGE') or OLLAMA_MODEL
+OLLAMA_MODEL_ROUTES = dict(
+    pair.split("=", 1) for pair in
+    os.getenv('OLLAMA_MODEL_ROUTES', 'plan=small,email_map=small,email_digest=large').replace(" ", "").split(",")
+    if "=" in pair
+)
+# Retry on the large tier when the small model's answer fails validation
+OLLAMA_ESCALATE = os.getenv('OLLAMA_ESCALATE', 'true').lower() in ('1', 'true', 'yes')
 TIMEZONE = os.getenv('TIMEZONE', 'Asia/Kolkata')
 QUIET_HOURS_START = os.getenv('QUIET_HOURS_START', '22:00')
 QUIET_HOURS_END = os.getenv('QUIET_HOURS_END', '07:00')
 AMOUNT_CAP = float(os.getenv('AMOUNT_CAP', '20000'))
-DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///src/ai_agent.db')
\ No newline at end of file
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///src/ai_agent.db')
+
+
+def _int_map(raw: str):
+    """Parse 'reminder=0,email_summary=600' style settings into {str: int}."""
+    out = {}
+    for pair in (raw or "").split(","):
+        if "=" in pair:
+            k, v = pair.split("=", 1)
+            try:
+                out[k.strip()] = int(v.strip())
+            except ValueError:
+                continue
+    return out
+
+
+# Scheduler load-shaping: per-task-type jitter (each fire moves up to ± that many seconds),
+# deterministic spread window (minutes) for herds of jobs sharing a wall-clock time,
+# and misfire / coalescing policy for jobs that could not start on time.
+SCHEDULER_JITTER_SECONDS = _int_map(os.getenv('SCHEDULER_JITTER_SECONDS', 'reminder=0,order=30,email_summary=60'))
+SCHEDULER_SPREAD_MINUTES = _int_map(os.getenv('SCHEDULER_SPREAD_MINUTES', 'email_summary=10'))
+SCHEDULER_MISFIRE_GRACE_SECONDS = int(os.getenv('SCHEDULER_MISFIRE_GRACE_SECONDS', '300'))
+SCHEDULER_COALESCE = os.getenv('SCHEDULER_COALESCE', 'true').lower() in ('1', 'true', 'yes')
+
+# Scheduler executor pools: "fast" (messaging), "io" (email/orders), "cpu" (PDF, process pool)
+SCHEDULER_POOL_FAST = int(os.getenv('SCHEDULER_POOL_FAST', '10'))
+SCHEDULER_POOL_IO = int(os.getenv('SCHEDULER_POOL_IO', '4'))
+SCHEDULER_POOL_CPU = int(os.getenv('SCHEDULER_POOL_CPU', '2'))
+
+# Scheduler leader lease: only the process holding the lease fires jobs
+SCHEDULER_LEASE_TTL_SECONDS = int(os.getenv('SCHEDULER_LEASE_TTL_SECONDS', '30'))
+SCHEDULER_INSTANCE_ID = os.getenv('SCHEDULER_INSTANCE_ID')  # default: <hostname>:<pid>
+
+# Metrics export (/metrics, /metrics.json); disabled unless a port is set
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Scheduler → worker job queue (run_service.py --mode scheduler / worker)
+JOB_QUEUE_LEASE_SECONDS = int(os.getenv('JOB_QUEUE_LEASE_SECONDS', '300'))
+JOB_QUEUE_MAX_ATTEMPTS = int(os.getenv('JOB_QUEUE_MAX_ATTEMPTS', '3'))
+JOB_QUEUE_POLL_SECONDS = float(os.getenv('JOB_QUEUE_POLL_SECONDS', '1'))
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '2'))
+# Finished run / tool_execution / job_queue rows are deleted after this many days (0 = keep forever)
+HISTORY_RETENTION_DAYS = float(os.getenv('HISTORY_RETENTION_DAYS', '30'))
+
+# Max concurrent MCP calls when a plan declares dependencies between its calls
+PLAN_MAX_PARALLEL = int(os.getenv('PLAN_MAX_PARALLEL', '4'))
+
+# Circuit breakers around MCP tool dependencies (telegram, imap, ...)
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', '30'))
+
+# MCP result cache: opt-in per tool, "tool=ttl_seconds" pairs (0 or absent = not cached)
+TOOL_CACHE_TTLS = _int_map(os.getenv('TOOL_CACHE_TTLS', 'email.summarize=300,email.digest=300'))
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv('TOOL_CACHE_MAX_ENTRIES', '256'))
+
+# Bulk sends (messaging.send_many, /broadcast). Telegram allows ~30 messages/s per bot.
+SEND_MANY_RATE_PER_SECOND = float(os.getenv('SEND_MANY_RATE_PER_SECOND', '25'))
+SEND_MANY_CONCURRENCY = int(os.getenv('SEND_MANY_CONCURRENCY', '10'))
+BROADCAST_PAGE_SIZE = int(os.getenv('BROADCAST_PAGE_SIZE', '200'))
+# A broadcast run renews its claim after every page; a dead run's claim is taken over after this long
+BROADCAST_LEASE_SECONDS = int(os.getenv('BROADCAST_LEASE_SECONDS', '120'))
+
+# Ollama plan cache (memory LRU + llm_cache table), keyed by model + normalized prompt
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv('LLM_CACHE_MEMORY_ENTRIES', '256'))
+LLM_CACHE_MAX_ROWS = int(os.getenv('LLM_CACHE_MAX_ROWS', '5000'))
+
+# Email digests: prompt size per model call (keep under the model's context window) and per-message summary reuse
+EMAIL_CHUNK_TOKENS = int(os.getenv('EMAIL_CHUNK_TOKENS', '1500'))
+EMAIL_SUMMARY_CACHE_TTL_SECONDS = int(os.getenv('EMAIL_SUMMARY_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+
+# Gmail: message GETs per batch request (Gmail allows 100, recommends <= 50) and an optional
+# discovery document URL (e.g. a local fake Gmail) instead of the bundled one
+GMAIL_BATCH_SIZE = max(1, min(100, int(os.getenv('GMAIL_BATCH_SIZE', '50'))))
+GMAIL_DISCOVERY_URL = os.getenv('GMAIL_DISCOVERY_URL')
+# Tries per message when Gmail rate-limits (429 / rateLimitExceeded) or fails (5xx) its part of a batch
+GMAIL_BATCH_ATTEMPTS = max(1, int(os.getenv('GMAIL_BATCH_ATTEMPTS', '4')))
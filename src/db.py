@@ -1,18 +1,19 @@
 import os
 import sqlite3
+import time
 from contextlib import closing
 from pathlib import Path
 from datetime import datetime
 import json
 
-from .config import DATABASE_URL
+from .config import DATABASE_URL, HISTORY_RETENTION_DAYS, JOB_QUEUE_LEASE_SECONDS
 
 # Example: DATABASE_URL = "sqlite:///ai_agent.db"
 DB_FILE = DATABASE_URL.replace("sqlite:///", "")
 
 
 def init_db():
-    schema_file = Path(__file__).parent / "schema.sql"  # <-- define schema_file path
+    schema_file = Path(__file__).parent.parent / "migrations" / "init_db.sql"
     if not Path(DB_FILE).exists():
         conn = sqlite3.connect(DB_FILE)
         with closing(conn):
@@ -20,6 +21,41 @@ def init_db():
             with open(schema_file, "r", encoding="utf-8") as f:
                 cur.executescript(f.read())
             conn.commit()
+    migrate_db()
+
+
+def migrate_db():
+    """Bring an existing database up to the current schema (idempotent)."""
+    conn = sqlite3.connect(DB_FILE)
+    with closing(conn):
+        cur = conn.cursor()
+        cur.execute("PRAGMA table_info(task)")
+        columns = {row[1] for row in cur.fetchall()}
+        if columns and "status" not in columns:
+            # 'active' tasks are restored at startup; fired one-shots become 'completed'
+            cur.execute("ALTER TABLE task ADD COLUMN status TEXT NOT NULL DEFAULT 'active'")
+        if columns:
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_task_status ON task (status, enabled)")
+        if columns and "tool" not in columns:
+            # Denormalized first-call tool/text so list views never decode params_json
+            cur.execute("ALTER TABLE task ADD COLUMN tool TEXT")
+            cur.execute("ALTER TABLE task ADD COLUMN text TEXT")
+            cur.execute(
+                """
+                UPDATE task SET
+                    tool = json_extract(params_json, '$.calls[0].tool'),
+                    text = COALESCE(json_extract(params_json, '$.calls[0].args.text'),
+                                    json_extract(params_json, '$.calls[0].args.item'))
+                WHERE json_valid(params_json)
+                """
+            )
+        cur.execute("PRAGMA table_info(broadcast)")
+        columns = {row[1] for row in cur.fetchall()}
+        if columns and "owner" not in columns:
+            # Claim columns: only one run may send (or resume) a broadcast at a time
+            cur.execute("ALTER TABLE broadcast ADD COLUMN owner TEXT")
+            cur.execute("ALTER TABLE broadcast ADD COLUMN lease_until REAL")
+        conn.commit()
 
 
 def get_conn():
@@ -42,6 +78,13 @@ def create_user(name: str, chat_id: str, timezone: str = "Asia/Kolkata"):
     return user_id
 
 
+def plan_columns(plan: dict):
+    """(tool, text) of a plan's first call, stored alongside params_json for list views."""
+    calls = plan.get("calls") or [{}]
+    args = calls[0].get("args", {})
+    return calls[0].get("tool"), args.get("text") or args.get("item")
+
+
 def create_task(
     user_id: int,
     task_type: str,
@@ -50,12 +93,13 @@ def create_task(
     enabled: int = 1,
 ):
     """Create a new task linked to a user."""
+    tool, text = plan_columns(plan)
     conn = get_conn()
     cur = conn.cursor()
     cur.execute(
-        "INSERT INTO task (user_id, type, params_json, schedule_rule, enabled) "
-        "VALUES (?, ?, ?, ?, ?)",
-        (user_id, task_type, json.dumps(plan), schedule_rule, enabled),
+        "INSERT INTO task (user_id, type, params_json, schedule_rule, enabled, tool, text) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (user_id, task_type, json.dumps(plan), schedule_rule, enabled, tool, text),
     )
     conn.commit()
     task_id = cur.lastrowid
@@ -63,6 +107,44 @@ def create_task(
     return task_id
 
 
+def complete_task(task_id: int) -> bool:
+    """
+    Mark a one-shot task as completed (and disabled) in a single UPDATE.
+    Returns False if it was already completed, so a duplicate fire is detectable.
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE task SET status = 'completed', enabled = 0, updated_at = datetime('now') "
+        "WHERE id = ? AND status = 'active'",
+        (task_id,),
+    )
+    completed = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    return completed
+
+
+def update_task_plan(task_id: int, task_type: str, plan: dict, schedule_rule: str) -> bool:
+    """
+    Replace an enabled task's type, plan and schedule in place (e.g. a late LLM
+    answer correcting a guessed schedule). Returns False if the task is gone
+    or was disabled meanwhile.
+    """
+    tool, text = plan_columns(plan)
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE task SET type = ?, params_json = ?, schedule_rule = ?, tool = ?, text = ?, "
+        "updated_at = datetime('now') WHERE id = ? AND enabled = 1",
+        (task_type, json.dumps(plan), schedule_rule, tool, text, task_id),
+    )
+    conn.commit()
+    updated = cur.rowcount > 0
+    conn.close()
+    return updated
+
+
 def list_tasks():
     """Return all tasks (helper; not heavily used right now)."""
     conn = get_conn()
@@ -76,6 +158,174 @@ def list_tasks():
     return rows
 
 
+def record_run(task_id: int, started_at: str, ended_at: str, ok: bool,
+               outputs=None, error_text: str = None, attempt: int = 1) -> int:
+    """Store one execution of a task in the run table. Returns the run id."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO run (task_id, started_at, ended_at, ok, outputs_json, error_text, attempt) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (task_id, started_at, ended_at, 1 if ok else 0,
+         json.dumps(outputs, default=str) if outputs is not None else None,
+         error_text, attempt),
+    )
+    conn.commit()
+    run_id = cur.lastrowid
+    conn.close()
+    return run_id
+
+
+# -------------------- Tool execution (idempotency) helpers --------------------
+def _ensure_execution_table(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS tool_execution (
+            idempotency_key TEXT PRIMARY KEY,
+            task_id INTEGER,
+            tool TEXT,
+            status TEXT NOT NULL,
+            output_json TEXT,
+            error_text TEXT,
+            executions INTEGER NOT NULL DEFAULT 1,
+            started_at REAL,
+            finished_at REAL
+        )
+        """
+    )
+
+
+def claim_execution(key: str, task_id: int = None, tool: str = None,
+                    stale_after: float = JOB_QUEUE_LEASE_SECONDS):
+    """
+    Claim the right to run the call identified by ``key``. Returns (claimed, status,
+    output): claimed is True for a first run, a retry of a failed one, or a call
+    left 'running' for over ``stale_after`` seconds (its process died; a job's
+    lease runs out as fast). Otherwise status is 'done' (with the stored output)
+    or 'running' (still in flight elsewhere, or only just crashed).
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    _ensure_execution_table(cur)
+    cur.execute(
+        """
+        INSERT INTO tool_execution (idempotency_key, task_id, tool, status, started_at)
+        VALUES (?, ?, ?, 'running', ?)
+        ON CONFLICT(idempotency_key) DO UPDATE SET
+            status = 'running', executions = executions + 1,
+            error_text = NULL, started_at = excluded.started_at
+        WHERE tool_execution.status = 'failed'
+           OR (tool_execution.status = 'running' AND tool_execution.started_at < ?)
+        """,
+        (key, task_id, tool, time.time(), time.time() - stale_after),
+    )
+    if cur.rowcount > 0:
+        conn.commit()
+        conn.close()
+        return True, "running", None
+    cur.execute("SELECT status, output_json FROM tool_execution WHERE idempotency_key = ?", (key,))
+    status, output_json = cur.fetchone()
+    conn.close()
+    return False, status, json.loads(output_json) if output_json else None
+
+
+def finish_execution(key: str, ok: bool, output=None, error_text: str = None):
+    """Record the outcome of a claimed execution ('done' or 'failed')."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE tool_execution SET status = ?, output_json = ?, error_text = ?, finished_at = ? "
+        "WHERE idempotency_key = ?",
+        ("done" if ok else "failed",
+         json.dumps(output, default=str) if ok and output is not None else None,
+         None if ok else str(error_text)[:500], time.time(), key),
+    )
+    conn.commit()
+    conn.close()
+
+
+def purge_history(retention_days: float = HISTORY_RETENTION_DAYS) -> dict:
+    """
+    Delete bookkeeping older than ``retention_days``: finished tool_execution and
+    run rows, and done/failed job_queue rows. Queued and running work is kept.
+    Returns {table: rows deleted}; does nothing when retention_days is 0.
+    """
+    if not retention_days:
+        return {}
+    cutoff = time.time() - retention_days * 86400
+    conn = get_conn()
+    cur = conn.cursor()
+    _ensure_execution_table(cur)
+    deleted = {}
+    cur.execute(
+        "DELETE FROM tool_execution WHERE COALESCE(finished_at, started_at) < ?",
+        (cutoff,),
+    )
+    deleted["tool_execution"] = cur.rowcount
+    # run.ended_at is a naive UTC ISO string, so it compares as text
+    cur.execute("DELETE FROM run WHERE ended_at < ?", (datetime.utcfromtimestamp(cutoff).isoformat(),))
+    deleted["run"] = cur.rowcount
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'job_queue'")
+    if cur.fetchone():
+        cur.execute("DELETE FROM job_queue WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+        deleted["job_queue"] = cur.rowcount
+    conn.commit()
+    conn.close()
+    if any(deleted.values()):
+        print(f"🧹 Purged history older than {retention_days:g} days: {deleted}")
+    return deleted
+
+
+# -------------------- Scheduler lease helpers --------------------
+def _ensure_lease_table(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scheduler_lease (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """
+    )
+
+
+def acquire_lease(name: str, holder: str, ttl_seconds: float) -> bool:
+    """
+    Take or renew the named lease for ``holder``. Returns True if ``holder`` owns it.
+
+    A single UPSERT does the check-and-set, so two processes racing for an expired
+    lease can never both win.
+    """
+    now = time.time()
+    conn = get_conn()
+    cur = conn.cursor()
+    _ensure_lease_table(cur)
+    cur.execute(
+        """
+        INSERT INTO scheduler_lease (name, holder, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+        WHERE scheduler_lease.holder = excluded.holder OR scheduler_lease.expires_at < ?
+        """,
+        (name, holder, now + ttl_seconds, now),
+    )
+    acquired = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    return acquired
+
+
+def release_lease(name: str, holder: str) -> bool:
+    """Give up the lease early (clean shutdown) so a follower can take over at once."""
+    conn = get_conn()
+    cur = conn.cursor()
+    _ensure_lease_table(cur)
+    cur.execute("DELETE FROM scheduler_lease WHERE name = ? AND holder = ?", (name, holder))
+    released = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    return released
+
+
 # Auto initialize database if missing
 init_db()
 
@@ -0,0 +1,245 @@
+# src/job_queue.py
+"""
+Durable work queue between the scheduler and worker processes.
+
+The scheduler only decides that a task is due and enqueues its id; workers claim
+rows atomically with a time-limited lease, run the task's calls through MCP and
+ack them. While a job runs its worker renews the lease, so a long job (an
+email digest waiting on several model calls) keeps it; if the worker dies the
+lease runs out and the row is handed to the next worker that polls.
+"""
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+from src.db import get_conn, complete_task
+from src.config import JOB_QUEUE_LEASE_SECONDS, JOB_QUEUE_MAX_ATTEMPTS, JOB_QUEUE_POLL_SECONDS
+
+
+def _ensure_table(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS job_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            scheduled_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_until REAL,
+            worker TEXT,
+            last_error TEXT,
+            enqueued_at REAL,
+            finished_at REAL,
+            UNIQUE (task_id, scheduled_at)
+        )
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_job_queue_claim ON job_queue (status, scheduled_at)")
+
+
+def enqueue_task(task_id: int, scheduled_at: str = None, fired_at: str = None) -> bool:
+    """
+    Queue one run of ``task_id``. ``scheduled_at`` identifies the run (default: the
+    run time the scheduler fired for, else now); enqueueing the same
+    (task, scheduled_at) twice is a no-op. Returns True if a row was added.
+    """
+    scheduled_at = scheduled_at or fired_at or datetime.now().astimezone().isoformat()
+    conn = get_conn()
+    cur = conn.cursor()
+    _ensure_table(cur)
+    cur.execute(
+        "INSERT OR IGNORE INTO job_queue (task_id, scheduled_at, enqueued_at) VALUES (?, ?, ?)",
+        (task_id, scheduled_at, time.time()),
+    )
+    added = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    if added:
+        print(f"📥 Queued task {task_id} (scheduled {scheduled_at})")
+    return added
+
+
+def claim_job(worker_id: str, lease_seconds: int = JOB_QUEUE_LEASE_SECONDS,
+              max_attempts: int = JOB_QUEUE_MAX_ATTEMPTS):
+    """
+    Atomically claim the oldest runnable job: queued, or running with an expired
+    lease (its worker crashed). A job whose workers kept dying is parked as
+    'failed' once it used up ``max_attempts``, like one that kept raising.
+    Returns (job_id, task_id, scheduled_at, attempts) or None.
+    """
+    now = time.time()
+    conn = get_conn()
+    cur = conn.cursor()
+    _ensure_table(cur)
+    cur.execute(
+        """
+        UPDATE job_queue
+        SET status = 'failed', last_error = 'lease expired on its last attempt', lease_until = NULL, finished_at = ?
+        WHERE status = 'running' AND lease_until < ? AND attempts >= ?
+        """,
+        (now, now, max_attempts),
+    )
+    if cur.rowcount > 0:
+        print(f"⚠️ {cur.rowcount} job(s) failed: their workers died on every attempt")
+    cur.execute(
+        """
+        UPDATE job_queue
+        SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1
+        WHERE id = (
+            SELECT id FROM job_queue
+            WHERE status = 'queued' OR (status = 'running' AND lease_until < ? AND attempts < ?)
+            ORDER BY scheduled_at, id
+            LIMIT 1
+        )
+        RETURNING id, task_id, scheduled_at, attempts
+        """,
+        (worker_id, now + lease_seconds, now, max_attempts),
+    )
+    row = cur.fetchone()
+    conn.commit()
+    conn.close()
+    return row
+
+
+def renew_lease(job_id: int, worker_id: str, lease_seconds: int = JOB_QUEUE_LEASE_SECONDS) -> bool:
+    """Extend a claimed job's lease. False if it was lost to another worker."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE job_queue SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+        (time.time() + lease_seconds, job_id, worker_id),
+    )
+    renewed = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    return renewed
+
+
+class LeaseHeartbeat:
+    """Renews a job's lease every lease/3 seconds in a daemon thread while the block runs."""
+
+    def __init__(self, job_id: int, worker_id: str, lease_seconds: int = JOB_QUEUE_LEASE_SECONDS):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(max(1.0, self.lease_seconds / 3)):
+            try:
+                if not renew_lease(self.job_id, self.worker_id, self.lease_seconds):
+                    print(f"⚠️ Job {self.job_id}: lease lost to another worker")
+                    return
+            except Exception as e:
+                print(f"⚠️ Job {self.job_id}: lease renewal failed: {e}")
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._loop, name=f"lease-{self.job_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def ack_job(job_id: int, worker_id: str) -> bool:
+    """Mark a claimed job done. False if the lease was lost to another worker."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE job_queue SET status = 'done', finished_at = ?, lease_until = NULL "
+        "WHERE id = ? AND worker = ? AND status = 'running'",
+        (time.time(), job_id, worker_id),
+    )
+    acked = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    return acked
+
+
+def fail_job(job_id: int, worker_id: str, error: str, max_attempts: int = JOB_QUEUE_MAX_ATTEMPTS):
+    """Requeue a failed job, or park it as 'failed' once it used up its attempts."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE job_queue
+        SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+            last_error = ?, lease_until = NULL, finished_at = ?
+        WHERE id = ? AND worker = ? AND status = 'running'
+        """,
+        (max_attempts, str(error)[:500], time.time(), job_id, worker_id),
+    )
+    conn.commit()
+    conn.close()
+
+
+def queue_depth():
+    """Return {status: count} for the job queue."""
+    conn = get_conn()
+    cur = conn.cursor()
+    _ensure_table(cur)
+    cur.execute("SELECT status, COUNT(*) FROM job_queue GROUP BY status")
+    rows = dict(cur.fetchall())
+    conn.close()
+    return rows
+
+
+def run_job(job_id: int, task_id: int, scheduled_at: str, attempts: int):
+    """Run the task's calls through MCP (see orchestrator.run_recorded). Raises on failure."""
+    from src.orchestrator import fire_key, load_params_json, run_recorded
+    from src.plans import get_compiled
+
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT updated_at, schedule_rule, enabled, status FROM task WHERE id = ?", (task_id,))
+    row = cur.fetchone()
+    conn.close()
+    if not row:
+        print(f"⚠️ Job {job_id}: task {task_id} no longer exists; dropping it.")
+        return
+    updated_at, rule, enabled, status = row
+    if not enabled or status != "active":
+        print(f"ℹ️ Job {job_id}: task {task_id} was {'disabled' if not enabled else status}; skipping.")
+        return
+
+    plan = get_compiled(task_id, updated_at, loader=lambda: load_params_json(task_id))
+    print(f"⚙️ Worker dispatching via MCP (job {job_id}, attempt {attempts}): {[c.tool for c in plan.calls]}")
+    # Keyed by the scheduled time, so a redelivered job skips calls that already ran
+    one_shot = bool(rule and "FREQ=ONCE" in rule.upper())
+    run_recorded(task_id, plan.calls, run_key=fire_key(task_id, scheduled_at, one_shot))
+    if one_shot:
+        complete_task(task_id)
+
+
+def run_worker(worker_id: str = None, poll_seconds: float = JOB_QUEUE_POLL_SECONDS, stop_event=None,
+               lease_seconds: int = JOB_QUEUE_LEASE_SECONDS):
+    """Claim → run → ack loop for one worker process. Sleeps ``poll_seconds`` when idle."""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    print(f"👷 Worker {worker_id} started")
+    while not (stop_event and stop_event.is_set()):
+        try:
+            job = claim_job(worker_id, lease_seconds)
+        except Exception as e:
+            print(f"⚠️ Worker {worker_id} could not claim a job: {e}")
+            job = None
+        if not job:
+            time.sleep(poll_seconds)
+            continue
+
+        job_id, task_id, scheduled_at, attempts = job
+        try:
+            with LeaseHeartbeat(job_id, worker_id, lease_seconds):
+                run_job(job_id, task_id, scheduled_at, attempts)
+        except Exception as e:
+            print(f"❌ Job {job_id} (task {task_id}) failed: {e}")
+            fail_job(job_id, worker_id, e)
+            continue
+        if not ack_job(job_id, worker_id):
+            print(f"⚠️ Job {job_id} finished after its lease expired; it may be redelivered.")
+    print(f"👷 Worker {worker_id} stopped")
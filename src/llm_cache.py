@@ -0,0 +1,170 @@
+# src/llm_cache.py
+"""
+Two-tier cache for Ollama plan generation.
+
+Keys are sha256(model + variant + normalized prompt), so "Stretch  every
+morning" and "stretch every morning" share an entry, and a model change never
+serves another model's answer. The variant (tier and output format) keeps
+answers made under a different schema apart. Hits come from an in-process LRU first, then from the
+llm_cache table, which survives restarts. Entries expire after a TTL and the
+table is trimmed to a maximum row count, least recently used first.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from src.db import get_conn
+from src.config import (LLM_CACHE_MAX_ROWS, LLM_CACHE_MEMORY_ENTRIES, LLM_CACHE_TTL_SECONDS, OLLAMA_MODEL,
+                        OLLAMA_MODEL_LARGE, OLLAMA_MODEL_SMALL)
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    return _WS.sub(" ", prompt).strip().casefold()
+
+
+def cache_key(model: str, prompt: str, variant: str = "") -> str:
+    return hashlib.sha256(f"{model}\0{variant}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+def _ensure_table(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used)")
+
+
+class LLMCache:
+    def __init__(self, model: str, ttl: float = LLM_CACHE_TTL_SECONDS,
+                 memory_entries: int = LLM_CACHE_MEMORY_ENTRIES, max_rows: int = LLM_CACHE_MAX_ROWS):
+        self.model = model
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.max_rows = max_rows
+        self._memory = OrderedDict()  # key -> (expires_at, response)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._purge_other_models()
+
+    def _purge_other_models(self):
+        """Rows from models no longer configured (OLLAMA_MODEL or a tier changed) can never hit again."""
+        models = sorted({self.model, OLLAMA_MODEL, OLLAMA_MODEL_SMALL, OLLAMA_MODEL_LARGE})
+        try:
+            conn = get_conn()
+            cur = conn.cursor()
+            _ensure_table(cur)
+            cur.execute(f"DELETE FROM llm_cache WHERE model NOT IN ({','.join('?' * len(models))})", models)
+            if cur.rowcount > 0:
+                print(f"🧹 Dropped {cur.rowcount} cached plans from previous models")
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"⚠️ LLM cache unavailable: {e}")
+
+    def _remember(self, key, expires_at, response):
+        with self._lock:
+            self._memory[key] = (expires_at, response)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, prompt: str, variant: str = ""):
+        key = cache_key(self.model, prompt, variant)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] > now:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[1]
+        try:
+            conn = get_conn()
+            cur = conn.cursor()
+            _ensure_table(cur)
+            cur.execute(
+                "UPDATE llm_cache SET last_used = ?, hits = hits + 1 "
+                "WHERE key = ? AND created_at > ? RETURNING response, created_at",
+                (now, key, now - self.ttl),
+            )
+            row = cur.fetchone()
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"⚠️ LLM cache read failed: {e}")
+            row = None
+        if not row:
+            self.stats["misses"] += 1
+            return None
+        self.stats["disk_hits"] += 1
+        self._remember(key, row[1] + self.ttl, row[0])
+        return row[0]
+
+    def put(self, prompt: str, response: str, variant: str = ""):
+        key = cache_key(self.model, prompt, variant)
+        now = time.time()
+        self._remember(key, now + self.ttl, response)
+        try:
+            conn = get_conn()
+            cur = conn.cursor()
+            _ensure_table(cur)
+            cur.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, self.model, response, now, now),
+            )
+            self._writes += 1
+            if self._writes % 50 == 1:
+                self._evict(cur, now)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"⚠️ LLM cache write failed: {e}")
+
+    def _evict(self, cur, now):
+        cur.execute("DELETE FROM llm_cache WHERE created_at <= ?", (now - self.ttl,))
+        cur.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "  SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        )
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        conn = get_conn()
+        cur = conn.cursor()
+        _ensure_table(cur)
+        cur.execute("DELETE FROM llm_cache")
+        conn.commit()
+        conn.close()
+
+
+_caches = {}
+_cache_lock = threading.Lock()
+
+
+def get_cache(model: str = OLLAMA_MODEL) -> LLMCache:
+    """The process-wide cache for ``model`` (one per model tier in use)."""
+    with _cache_lock:
+        if model not in _caches:
+            _caches[model] = LLMCache(model)
+        return _caches[model]
+
+
+def all_stats():
+    """{model: stats} for every cache created so far."""
+    with _cache_lock:
+        return {model: dict(cache.stats) for model, cache in _caches.items()}
@@ -1,35 +1,271 @@
 # src/mcp.py
-from typing import Dict, Any
-from src.tools import (
-    gmail_oauth,
-    messaging,
-    payments,
-    email_tool,
-    calendar_tool,
-    email_summary,
-    orders
-)
-
-# ✅ MCP Tool Map
-TOOL_MAP = {
-    "messaging.send_message": messaging.send_message,
-    "email.summarize": email_tool.summarize_unread,
-    "calendar.create_event": calendar_tool.create_event,
-    "email.summary": email_summary.send_daily_email_summary,
-    "orders.place_order": orders.place_order,
+import asyncio
+import functools
+import importlib
+import inspect
+import threading
+from typing import Dict, Any, Callable
+
+from src.config import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS, TOOL_CACHE_MAX_ENTRIES, TOOL_CACHE_TTLS
+from src.resilience import NO_RETRY, RetryPolicy, acall_with_retry, breaker_for, call_with_retry
+from src.tool_cache import ResultCache, make_key
+
+# ✅ MCP Tool Map: tool name → "module:function".
+# Tool modules (and their Google/aiohttp dependencies) are only imported the first
+# time a tool is dispatched, so importing the MCP layer itself is nearly free.
+TOOL_MAP: Dict[str, Any] = {
+    "messaging.send_message": "src.tools.messaging:deliver_message",
+    "messaging.send_many": "src.tools.messaging:send_many",
+    "email.summarize": "src.tools.email_tool:summarize_unread",
+    "calendar.create_event": "src.tools.calendar_tool:create_event",
+    "email.summary": "src.tools.email_summary:send_daily_email_summary",
+    "email.digest": "src.tools.email_summary:build_email_digest",
+    "orders.place_order": "src.tools.orders:place_order",
+    "notes.export_pdf": "src.tools.pdf_export:export_notes",
+}
+
+# Async-native implementations used by arun_call when available. Tools without
+# one still work from arun_call: their sync function runs in the loop's executor.
+ASYNC_TOOL_MAP: Dict[str, Any] = {
+    "messaging.send_message": "src.tools.messaging:send_message_async",
+    "messaging.send_many": "src.tools.messaging:send_many_async",
+    "orders.place_order": "src.tools.orders:place_order_async",
 }
 
+# How each tool is retried and which dependency's circuit breaker guards it.
+# Tools not listed here run once with no breaker. Only the exception class names
+# in retry_on are treated as transient; everything else fails on the first try.
+TOOL_RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    # The tool itself sorts failures: only ones where the message surely wasn't
+    # delivered (connection refused, 429, 5xx) raise TelegramTransientError.
+    "messaging.send_message": RetryPolicy(
+        max_attempts=3, base_delay=0.5, max_delay=5.0, dependency="telegram",
+        retry_on=("TelegramTransientError",),
+    ),
+    # Not retried in-process: place_order has no way to tell whether the store was
+    # already messaged. Redelivered jobs are deduplicated by idempotency key instead.
+    "orders.place_order": RetryPolicy(
+        max_attempts=1, dependency="telegram",
+        retry_on=("ConnectionError", "Timeout", "ClientConnectionError", "TimeoutError"),
+    ),
+    "email.summarize": RetryPolicy(
+        max_attempts=3, base_delay=1.0, max_delay=10.0, dependency="imap",
+        retry_on=("abort", "OSError"),
+    ),
+    # Not retried either: the summary is sent to the user once it is fetched
+    "email.summary": RetryPolicy(
+        max_attempts=1, dependency="gmail",
+        retry_on=("TransportError", "ConnectionError", "TimeoutError"),
+    ),
+    "email.digest": RetryPolicy(
+        max_attempts=2, base_delay=1.0, dependency="gmail",
+        retry_on=("TransportError", "ConnectionError", "TimeoutError"),
+    ),
+}
+
+# Results of side-effect-free tools listed in TOOL_CACHE_TTLS (tool → seconds)
+# are reused for identical args until they expire; see src/tool_cache.py.
+RESULT_CACHE = ResultCache(TOOL_CACHE_MAX_ENTRIES)
+
+# Third-party packages can add tools by declaring entry points in this group, e.g.
+#   [project.entry-points."ai_micro_agent.tools"]
+#   "crm.create_lead" = "my_pkg.crm:create_lead"
+ENTRY_POINT_GROUP = "ai_micro_agent.tools"
+
+_resolved: Dict[str, Callable] = {}
+_resolved_async: Dict[str, Callable] = {}
+_lock = threading.Lock()
+_entry_points_loaded = False
+
+
+def register_tool(name: str, target, async_target=None):
+    """
+    Register (or replace) a tool as a callable or a lazy "module:function" string.
+    ``target`` may itself be an ``async def``; ``async_target`` optionally adds an
+    async-native variant for arun_call next to a sync ``target``.
+    """
+    with _lock:
+        TOOL_MAP[name] = target
+        _resolved.pop(name, None)
+        _resolved_async.pop(name, None)
+        if async_target is not None:
+            ASYNC_TOOL_MAP[name] = async_target
+        else:
+            ASYNC_TOOL_MAP.pop(name, None)
+
+
+def _load_entry_points():
+    """Add tools advertised through entry points (built-in names win on conflicts)."""
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    try:
+        from importlib.metadata import entry_points
+        for ep in entry_points(group=ENTRY_POINT_GROUP):
+            TOOL_MAP.setdefault(ep.name, ep.value)
+    except Exception as e:
+        print(f"⚠️ Could not load MCP tool entry points: {e}")
+
+
+def _import_target(target) -> Callable:
+    if callable(target):
+        return target
+    module_name, _, attr = target.partition(":")
+    fn = importlib.import_module(module_name)
+    for part in attr.split("."):
+        fn = getattr(fn, part)
+    return fn
+
+
+def resolve_tool(name: str) -> Callable:
+    """Return the callable for a tool name, importing its module on first use."""
+    fn = _resolved.get(name)
+    if fn is not None:
+        return fn
+    with _lock:
+        fn = _resolved.get(name)
+        if fn is not None:
+            return fn
+        if name not in TOOL_MAP:
+            _load_entry_points()
+        target = TOOL_MAP.get(name)
+        if target is None:
+            raise Exception(f"❌ Tool '{name}' not found in TOOL_MAP.")
+        fn = _resolved[name] = _import_target(target)
+        return fn
+
+
+def resolve_async_tool(name: str) -> Callable:
+    """Return the async-native variant of a tool if it has one, else its regular callable."""
+    fn = _resolved_async.get(name)
+    if fn is not None:
+        return fn
+    target = ASYNC_TOOL_MAP.get(name)
+    if target is None:
+        return resolve_tool(name)
+    with _lock:
+        fn = _resolved_async[name] = _import_target(target)
+        return fn
+
+
+def _policy_for(tool: str):
+    policy = TOOL_RETRY_POLICIES.get(tool, NO_RETRY)
+    breaker = breaker_for(policy.dependency, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+    return policy, breaker
+
+
+class ExecutionInProgress(RuntimeError):
+    """A keyed call is still marked running: in flight elsewhere, or its process just died."""
+
+
+def _claim(idempotency_key: str, task_id, tool: str):
+    """
+    (claimed, output) for a keyed call; an unclaimed 'done' call must not run again.
+    One still marked running raises ExecutionInProgress, so the job fails and is
+    redelivered (rather than acked without its call) until the row goes stale.
+    """
+    from src.db import claim_execution
+
+    claimed, status, output = claim_execution(idempotency_key, task_id, tool)
+    if not claimed:
+        if status != "done":
+            raise ExecutionInProgress(f"{tool}: {idempotency_key} is still marked running")
+        print(f"♻️ MCP skipping {tool}: {idempotency_key} already ran")
+    return claimed, output
+
+
+def _finish(idempotency_key: str, ok: bool, output=None, error=None):
+    from src.db import finish_execution
+
+    try:
+        finish_execution(idempotency_key, ok, output, error)
+    except Exception as e:
+        print(f"⚠️ Could not record tool execution {idempotency_key}: {e}")
+
+
+def run_call_with_attempts(call: Dict[str, Any], idempotency_key: str = None, task_id: int = None):
+    """
+    Run a single MCP call under its tool's retry policy and circuit breaker.
+    Returns (output, attempts used). If the call finally fails, the raised
+    exception carries the attempt count as ``.attempts`` when it was retried.
+
+    With an ``idempotency_key`` the call runs at most once per key: a repeat
+    (job redelivery, scheduler retry) returns the stored output with 0 attempts.
+    """
+    if idempotency_key:
+        claimed, output = _claim(idempotency_key, task_id, call.get("tool"))
+        if not claimed:
+            return output, 0
+        try:
+            output, attempts = run_call_with_attempts(call)
+        except Exception as e:
+            _finish(idempotency_key, False, error=e)
+            raise
+        _finish(idempotency_key, True, output)
+        return output, attempts
+
+    tool = call.get("tool")
+    args = call.get("args", {})
+    fn = getattr(call, "fn", None) or resolve_tool(tool)  # compiled plans carry it resolved
+    policy, breaker = _policy_for(tool)
+
+    def _call():
+        print(f"⚙️ MCP executing tool: {tool} with args: {args}")
+        if inspect.iscoroutinefunction(fn):
+            return call_with_retry(lambda: asyncio.run(fn(**args)), policy, breaker)
+        return call_with_retry(lambda: fn(**args), policy, breaker)
+
+    ttl = TOOL_CACHE_TTLS.get(tool)
+    if ttl:
+        return RESULT_CACHE.get_or_call(make_key(tool, args), ttl, _call)
+    return _call()
+
+
 def run_call(call: Dict[str, Any]):
     """
     Run a single MCP call. Each call dict must have:
       { "tool": "<tool_name>", "args": {...} }
+    ``async def`` tools are driven to completion on a private event loop.
+    Transient failures are retried per TOOL_RETRY_POLICIES.
+    """
+    return run_call_with_attempts(call)[0]
+
+
+async def arun_call(call: Dict[str, Any], idempotency_key: str = None, task_id: int = None):
+    """
+    Async counterpart of run_call. Async-native tools are awaited directly, so one
+    event loop can keep many calls in flight; sync tools run in the loop's default
+    executor so they never block the loop. Retries back off with asyncio.sleep.
+    ``idempotency_key`` works as in run_call_with_attempts.
     """
     tool = call.get("tool")
     args = call.get("args", {})
-    fn = TOOL_MAP.get(tool)
-
-    if not fn:
-        raise Exception(f"❌ Tool '{tool}' not found in TOOL_MAP.")
+    if idempotency_key:
+        loop = asyncio.get_running_loop()
+        claimed, output = await loop.run_in_executor(None, _claim, idempotency_key, task_id, tool)
+        if not claimed:
+            return output
+        try:
+            output = await arun_call(call)
+        except Exception as e:
+            await loop.run_in_executor(None, _finish, idempotency_key, False, None, e)
+            raise
+        await loop.run_in_executor(None, _finish, idempotency_key, True, output)
+        return output
+    if TOOL_CACHE_TTLS.get(tool):
+        # Cached tools go through run_call so they share its single-flight cache
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, run_call, call)
+    fn = resolve_async_tool(tool)
+    policy, breaker = _policy_for(tool)
 
-    print(f"⚙️ MCP executing tool: {tool} with args: {args}")
-    return fn(**args)
+    print(f"⚙️ MCP executing tool (async): {tool} with args: {args}")
+    if inspect.iscoroutinefunction(fn):
+        result, _ = await acall_with_retry(lambda: fn(**args), policy, breaker)
+        return result
+    loop = asyncio.get_running_loop()
+    result, _ = await acall_with_retry(
+        lambda: loop.run_in_executor(None, functools.partial(fn, **args)), policy, breaker
+    )
+    return result
@@ -0,0 +1,129 @@
+# src/metrics.py
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the histogram buckets; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class Histogram:
+    """Fixed-bucket, thread-safe latency histogram (Prometheus-style cumulative export)."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        value = max(0.0, float(value))
+        with self._lock:
+            i = 0
+            while i < len(self.buckets) and value > self.buckets[i]:
+                i += 1
+            self.counts[i] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def percentile(self, q: float):
+        """Bucket upper bound below which ``q`` (0..1) of the observations fall."""
+        with self._lock:
+            if not self.count:
+                return None
+            target = q * self.count
+            seen = 0
+            for i, c in enumerate(self.counts):
+                seen += c
+                if seen >= target:
+                    return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+            return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 3) if self.count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "max": round(self.max, 3),
+        }
+
+
+_histograms = {}
+_lock = threading.Lock()
+
+
+def histogram(name: str, label: str = "") -> Histogram:
+    """Get or create the histogram for (metric name, task type label)."""
+    key = (name, label or "")
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = Histogram()
+        return h
+
+
+def observe(name: str, value: float, label: str = ""):
+    histogram(name, label).observe(value)
+
+
+def snapshot():
+    """Return {metric: {label: summary}} for every histogram."""
+    with _lock:
+        items = list(_histograms.items())
+    out = {}
+    for (name, label), h in sorted(items):
+        out.setdefault(name, {})[label or "all"] = h.summary()
+    return out
+
+
+def render_prometheus():
+    """Render all histograms in the Prometheus text exposition format."""
+    with _lock:
+        items = sorted(_histograms.items())
+    lines = []
+    typed = set()
+    for (name, label), h in items:
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        lbl = f'task_type="{label}",' if label else ""
+        with h._lock:
+            cumulative = 0
+            for bound, c in zip(h.buckets + ("+Inf",), h.counts):
+                cumulative += c
+                lines.append(f'{name}_bucket{{{lbl}le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{lbl.rstrip(',')}}} {h.total}")
+            lines.append(f"{name}_count{{{lbl.rstrip(',')}}} {h.count}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, ctype = json.dumps(snapshot(), indent=2), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, ctype = render_prometheus(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1"):
+    """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"📈 Metrics exported on http://{host}:{port}/metrics")
+    return server
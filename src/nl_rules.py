@@ -0,0 +1,294 @@
+# src/nl_rules.py
+"""
+Deterministic fast path for natural-language schedules.
+
+Common time expressions ("every 2 hours", "every day at 9am", "on weekdays at
+8:30", "every mon and thu at 6pm", "tomorrow at 5", "on friday at 5pm", "this
+weekend", "tonight at 9", "in 30 minutes") are turned into RRULEs by precompiled regex tables, so /remind,
+/emailsummary and planner.parse_command only call the LLM for phrasings these
+rules don't cover. Every lookup is counted per caller so the hit rate can be
+watched in /metrics.
+"""
+import datetime
+import re
+import threading
+
+import pytz
+
+from src.config import TIMEZONE
+
+TZ = pytz.timezone(TIMEZONE)
+
+_DAYS = {
+    "mon": "MO", "monday": "MO", "tue": "TU", "tues": "TU", "tuesday": "TU",
+    "wed": "WE", "wednesday": "WE", "thu": "TH", "thur": "TH", "thurs": "TH", "thursday": "TH",
+    "fri": "FR", "friday": "FR", "sat": "SA", "saturday": "SA", "sun": "SU", "sunday": "SU",
+}
+_DAY = r"(?:mon|tue|tues|wed|thu|thur|thurs|fri|sat|sun)(?:day|nesday|sday|urday|rsday)?s?"
+_ONE_DAY = r"(?:mon|tue|tues|wed|thu|thur|thurs|fri|sat|sun)(?:day|nesday|sday|urday|rsday)?"
+_DAY_WORD = re.compile(rf"\b{_DAY}\b")
+_WEEKDAY_INDEX = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+_FREQ = {"second": "SECONDLY", "minute": "MINUTELY", "min": "MINUTELY", "hour": "HOURLY",
+         "hr": "HOURLY", "day": "DAILY", "week": "WEEKLY"}
+_UNIT = r"(?P<unit>seconds?|secs?|minutes?|mins?|hours?|hrs?|days?|weeks?)"
+# Named times of day used when no clock time is given
+_PART_OF_DAY = {"morning": (8, 0), "afternoon": (14, 0), "evening": (18, 0), "night": (21, 0)}
+# Said next to one of these, a clock time without am/pm is in the afternoon/evening
+_PM_PARTS = ("afternoon", "evening", "night")
+_THIS_PART = r"(?:tonight|this\s+(?:morning|afternoon|evening))"
+_WEEK_PART = re.compile(r"\bweek(?:day|end)s?\b")
+
+_TIME = (
+    r"(?:at\s+)?(?P<time>noon|midnight|"
+    r"\d{1,2}(?::\d{2})?\s*(?:am|pm|a\.m\.|p\.m\.)|"
+    r"\d{1,2}:\d{2}|"
+    r"(?<=at\s)\d{1,2}(?!\s*(?:st|nd|rd|th|%)))"
+)
+_AT_TIME = rf"(?:\s+{_TIME})?"
+_TIME_ANYWHERE = re.compile(rf"\b{_TIME}\b")
+
+# (name, compiled pattern) — tried in order, first match wins
+RULES = [
+    ("interval", re.compile(rf"\bevery\s+(?P<num>\d+)\s*{_UNIT}\b")),
+    # Recurring only when said so: "every/each weekend", "on weekends" (not "this weekend")
+    ("weekdays", re.compile(rf"\b(?:(?:every|each)\s+(?P<which>weekdays?|weekends?)|on\s+(?P<plural>weekdays|weekends))"
+                            rf"{_AT_TIME}\b")),
+    ("days_of_week", re.compile(
+        rf"\b(?:every|each|weekly\s+on)\s+(?P<days>{_DAY}(?:\s*(?:,|and|&)\s*{_DAY})*){_AT_TIME}\b")),
+    ("daily_at", re.compile(rf"\b(?:every\s*day|everyday|daily|each\s+day){_AT_TIME}\b")),
+    ("part_of_day", re.compile(rf"\bevery\s+(?P<part>morning|afternoon|evening|night){_AT_TIME}\b")),
+    ("every_unit", re.compile(rf"\bevery\s+{_UNIT}\b")),
+    ("in_delay", re.compile(rf"\bin\s+(?P<num>\d+|an?|one)\s*{_UNIT}\b")),
+    ("this_weekend", re.compile(rf"\bthis\s+weekend(?:\s+(?P<part>morning|afternoon|evening|night))?{_AT_TIME}\b")),
+    ("tomorrow", re.compile(rf"\btomorrow(?:\s+(?P<part>morning|afternoon|evening|night))?{_AT_TIME}\b")),
+    # "on friday at 5pm" / "next tue" — one run, on the next such day
+    ("on_day", re.compile(
+        rf"\b(?:on\s+|next\s+|this\s+)?(?P<day>{_ONE_DAY})\b(?:\s+(?P<part>morning|afternoon|evening|night))?"
+        rf"{_AT_TIME}\b")),
+    ("today_at", re.compile(
+        rf"\b(?:today\s+|(?P<part>{_THIS_PART})\s+)?{_TIME}(?:\s+(?:today|(?P<part_after>{_THIS_PART})))?\b")),
+]
+
+# Lower-confidence readings, only used when the model misses its deadline
+# (planner.plan_within); the late model answer can still correct them.
+# Limited to rules the scheduler can run (no MONTHLY/YEARLY, one BYHOUR).
+GUESSES = [
+    ("every_other", re.compile(rf"\b(?:every|each)\s+(?:other|second)\s+{_UNIT}\b")),
+    ("fortnightly", re.compile(r"\b(?:every\s+)?fortnight(?:ly)?\b")),
+    ("hourly", re.compile(r"\b(?:hourly|each\s+hour|once\s+an\s+hour)\b")),
+    ("daily", re.compile(r"\b(?:daily|once\s+a\s+day|each\s+day|every\s+single\s+day)\b")),
+    ("weekly", re.compile(r"\b(?:weekly|once\s+a\s+week|each\s+week)\b")),
+]
+
+_LEADING = re.compile(r"^\s*(?:please\s+)?(?:remind\s+me\s+(?:to\s+)?|to\s+)", re.IGNORECASE)
+_TRAILING = re.compile(r"[\s,.;:!-]+$")
+
+
+class ScheduleMatch:
+    """A recognized schedule: the RRULE, which rule produced it and the leftover text."""
+
+    __slots__ = ("rule", "kind", "text")
+
+    def __init__(self, rule: str, kind: str, text: str):
+        self.rule = rule
+        self.kind = kind
+        self.text = text
+
+    @property
+    def one_shot(self) -> bool:
+        return "FREQ=ONCE" in self.rule
+
+
+def parse_time(token: str, part: str = None):
+    """
+    '9am' / '9:30 pm' / '17:00' / 'noon' / '7' → (hour, minute), or None.
+    ``part`` is the part of day said with it ("tonight", "evening", "this
+    morning", ...): "tonight at 8" is 20:00 and "morning at 6" is 06:00.
+    """
+    if not token:
+        return None
+    t = token.lower().replace(".", "").replace(" ", "")
+    if t == "noon":
+        return 12, 0
+    if t == "midnight":
+        return 0, 0
+    m = re.fullmatch(r"(\d{1,2})(?::(\d{2}))?(am|pm)?", t)
+    if not m:
+        return None
+    hour, minute, ampm = int(m.group(1)), int(m.group(2) or 0), m.group(3)
+    part = part or ""
+    if not ampm and hour < 12 and any(p in part for p in _PM_PARTS):
+        hour += 12
+    elif not ampm and not m.group(2) and 1 <= hour <= 6 and "morning" not in part:
+        hour += 12  # a bare "at 5" means 5pm; nobody schedules reminders for 5am that way
+    if ampm == "pm" and hour < 12:
+        hour += 12
+    elif ampm == "am" and hour == 12:
+        hour = 0
+    if hour > 23 or minute > 59:
+        return None
+    return hour, minute
+
+
+def _unit_freq(unit: str) -> str:
+    for prefix, freq in _FREQ.items():
+        if unit.startswith(prefix):
+            return freq
+    return "DAILY"
+
+
+def _once(dt: datetime.datetime) -> str:
+    return f"RRULE:FREQ=ONCE;RUN_AT={dt.replace(microsecond=0).isoformat()}"
+
+
+def _day_code(token: str):
+    return _DAYS.get(token.rstrip("s")) or _DAYS.get(token[:3])
+
+
+def _rule_for(kind: str, m, now: datetime.datetime):
+    g = m.groupdict()
+    hm = parse_time(g.get("time"), g.get("part") or g.get("part_after"))
+    if kind == "interval":
+        return f"RRULE:FREQ={_unit_freq(g['unit'])};INTERVAL={int(g['num'])}"
+    if kind == "every_unit":
+        return f"RRULE:FREQ={_unit_freq(g['unit'])};INTERVAL=1"
+    if kind == "daily_at":
+        hour, minute = hm or (9, 0)
+        return f"RRULE:FREQ=DAILY;BYHOUR={hour};BYMINUTE={minute}"
+    if kind == "part_of_day":
+        hour, minute = hm or _PART_OF_DAY[g["part"]]
+        return f"RRULE:FREQ=DAILY;BYHOUR={hour};BYMINUTE={minute}"
+    if kind == "weekdays":
+        hour, minute = hm or (9, 0)
+        days = "MO,TU,WE,TH,FR" if (g["which"] or g["plural"]).startswith("weekday") else "SA,SU"
+        return f"RRULE:FREQ=WEEKLY;BYDAY={days};BYHOUR={hour};BYMINUTE={minute}"
+    if kind == "days_of_week":
+        days = []
+        for token in re.findall(_DAY, g["days"]):
+            code = _day_code(token)
+            if code and code not in days:
+                days.append(code)
+        if not days:
+            return None
+        hour, minute = hm or (9, 0)
+        return f"RRULE:FREQ=WEEKLY;BYDAY={','.join(days)};BYHOUR={hour};BYMINUTE={minute}"
+    if kind == "in_delay":
+        num = 1 if g["num"] in ("a", "an", "one") else int(g["num"])
+        freq = _unit_freq(g["unit"])
+        seconds = {"SECONDLY": 1, "MINUTELY": 60, "HOURLY": 3600, "DAILY": 86400, "WEEKLY": 604800}[freq]
+        return _once(now + datetime.timedelta(seconds=num * seconds))
+    if kind == "this_weekend":
+        hour, minute = hm or _PART_OF_DAY.get(g.get("part") or "morning", (9, 0))
+        when = (now + datetime.timedelta(days=max(0, 5 - now.weekday()))).replace(hour=hour, minute=minute, second=0)
+        while when <= now and when.weekday() < 6:
+            when += datetime.timedelta(days=1)  # said on Saturday after that time: Sunday
+        if when <= now:
+            return None  # Sunday, already past it: unclear which weekend is meant; leave it to the model
+        return _once(when)
+    if kind == "tomorrow":
+        hour, minute = hm or _PART_OF_DAY.get(g.get("part") or "morning", (9, 0))
+        when = (now + datetime.timedelta(days=1)).replace(hour=hour, minute=minute, second=0)
+        return _once(when)
+    if kind == "on_day":
+        if not hm and not g.get("part") and _TIME_ANYWHERE.search(m.string):
+            return None  # "friday, call mom at 5pm": the time isn't next to the day; leave it to the model
+        hour, minute = hm or _PART_OF_DAY.get(g.get("part") or "morning", (9, 0))
+        ahead = (_WEEKDAY_INDEX[_day_code(g["day"])] - now.weekday()) % 7
+        when = (now + datetime.timedelta(days=ahead)).replace(hour=hour, minute=minute, second=0)
+        if when <= now:
+            when += datetime.timedelta(days=7)  # "on monday" said on a Monday evening means next week
+        return _once(when)
+    if kind == "today_at":
+        if not hm or _DAY_WORD.search(m.string) or _WEEK_PART.search(m.string):
+            return None  # "friday 5pm" is not today; a weekday the rules above didn't place goes to the model
+        when = now.replace(hour=hm[0], minute=hm[1], second=0)
+        if when <= now:
+            when += datetime.timedelta(days=1)  # "at 7am" said at 8am means tomorrow
+        return _once(when)
+    return None
+
+
+def _guess_rule(kind: str, m):
+    if kind == "every_other":
+        return f"RRULE:FREQ={_unit_freq(m.group('unit'))};INTERVAL=2"
+    if kind == "fortnightly":
+        return "RRULE:FREQ=WEEKLY;INTERVAL=2"
+    return f"RRULE:FREQ={kind.upper()};INTERVAL=1"
+
+
+def _leftover(text: str, m) -> str:
+    rest = (text[:m.start()] + " " + text[m.end():]).strip()
+    rest = _LEADING.sub("", rest)
+    rest = _TRAILING.sub("", re.sub(r"\s{2,}", " ", rest))
+    return rest
+
+
+def parse_schedule(text: str, now: datetime.datetime = None):
+    """Return a ScheduleMatch for the first time expression in ``text``, or None."""
+    now = now or datetime.datetime.now(TZ)
+    lowered = text.lower()
+    for kind, pattern in RULES:
+        m = pattern.search(lowered)
+        if not m:
+            continue
+        rule = _rule_for(kind, m, now)
+        if rule:
+            return ScheduleMatch(rule, kind, _leftover(text, m))
+    return None
+
+
+def parse_reminder(text: str, now: datetime.datetime = None, source: str = "remind"):
+    """
+    Fast-path a reminder instruction into a planner-shaped dict
+    ({task_type, schedule_rule, text}), or None to fall back to the LLM.
+    """
+    match = parse_schedule(text, now)
+    if not match or not match.text:
+        record(source, False)
+        return None
+    record(source, True, match.kind)
+    return {"task_type": "reminder", "schedule_rule": match.rule, "text": match.text[:1].upper() + match.text[1:]}
+
+
+def guess_reminder(text: str):
+    """
+    Best deterministic reading of a reminder the precise rules didn't place
+    (planner-shaped dict), or None. Used as a stand-in while the LLM is late.
+    """
+    lowered = text.lower()
+    for kind, pattern in GUESSES:
+        m = pattern.search(lowered)
+        if m:
+            rest = _leftover(text, m)
+            if rest:
+                return {"task_type": "reminder", "schedule_rule": _guess_rule(kind, m),
+                        "text": rest[:1].upper() + rest[1:]}
+    return None
+
+
+# -------------------- telemetry --------------------
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def record(source: str, hit: bool, kind: str = None):
+    """Count one fast-path lookup for ``source`` (e.g. 'remind', 'emailsummary', 'parse_command')."""
+    with _stats_lock:
+        s = _stats.setdefault(source, {"hits": 0, "fallbacks": 0, "by_rule": {}})
+        if hit:
+            s["hits"] += 1
+            if kind:
+                s["by_rule"][kind] = s["by_rule"].get(kind, 0) + 1
+        else:
+            s["fallbacks"] += 1
+
+
+def stats():
+    """{source: {hits, fallbacks, hit_rate, by_rule}} since startup."""
+    with _stats_lock:
+        out = {}
+        for source, s in _stats.items():
+            total = s["hits"] + s["fallbacks"]
+            out[source] = dict(s, by_rule=dict(s["by_rule"]),
+                               hit_rate=round(s["hits"] / total, 3) if total else None)
+        return out
@@ -0,0 +1,263 @@
+# src/ollama_client.py
+"""
+Shared client for the local Ollama server.
+
+Every model call in the process goes through here: one keep-alive HTTP pool
+(requests for sync callers, a per-loop aiohttp session for async ones) and one
+PriorityGate that caps in-flight generations at OLLAMA_MAX_PARALLEL, the
+number of requests the model server actually runs in parallel. When the gate
+is full, waiting interactive calls (a user's /remind) are let in before
+scheduled work such as email digests.
+
+route() picks a model per task from two tiers (OLLAMA_MODEL_SMALL for short
+JSON plans, OLLAMA_MODEL_LARGE for digests); escalation() moves a task to the
+large tier when the small model's answer fails validation. Request times are
+recorded per tier.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import threading
+import time
+import weakref
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+from src import metrics
+from src.config import (OLLAMA_ESCALATE, OLLAMA_KEEP_ALIVE, OLLAMA_MAX_PARALLEL, OLLAMA_MODEL, OLLAMA_MODEL_LARGE,
+                        OLLAMA_MODEL_ROUTES, OLLAMA_MODEL_SMALL, OLLAMA_TIMEOUT_SECONDS, OLLAMA_URL)
+
+# Lower runs first
+INTERACTIVE = 0
+BACKGROUND = 10
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class PriorityGate:
+    """A counting semaphore that hands free slots to the lowest (priority, arrival) waiter."""
+
+    def __init__(self, slots: int):
+        self.slots = max(1, slots)
+        self.in_use = 0
+        self._waiters = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, priority: int = INTERACTIVE):
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            while self.in_use >= self.slots or self._waiters[0] != ticket:
+                self._cond.wait()
+            heapq.heappop(self._waiters)
+            self.in_use += 1
+            self._cond.notify_all()
+
+    async def acquire_async(self, priority: int = INTERACTIVE):
+        """
+        acquire() for coroutines: the wait runs in an executor thread, which can't be
+        interrupted. If the awaiting coroutine is cancelled meanwhile, the slot the
+        thread eventually gets is handed straight back instead of leaking.
+        """
+        handoff = threading.Lock()
+        state = {"held": False, "abandoned": False}
+
+        def _acquire():
+            self.acquire(priority)
+            with handoff:
+                if state["abandoned"]:
+                    self.release()
+                else:
+                    state["held"] = True
+
+        fut = asyncio.get_running_loop().run_in_executor(None, _acquire)
+        try:
+            await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            with handoff:
+                state["abandoned"] = True
+                if state["held"]:
+                    self.release()
+            raise
+
+    def release(self):
+        with self._cond:
+            self.in_use -= 1
+            self._cond.notify_all()
+
+    def waiting(self) -> int:
+        with self._cond:
+            return len(self._waiters)
+
+
+GATE = PriorityGate(OLLAMA_MAX_PARALLEL)
+
+# -------------------- model tiers --------------------
+TIERS = {"small": OLLAMA_MODEL_SMALL, "large": OLLAMA_MODEL_LARGE}
+ESCALATIONS = {}  # task -> answers retried on the large tier
+
+
+def route(task: str):
+    """(tier, model) for an LLM task ("plan", "email_map", "email_digest", ...) per OLLAMA_MODEL_ROUTES."""
+    tier = OLLAMA_MODEL_ROUTES.get(task, "large")
+    return tier, TIERS.get(tier, OLLAMA_MODEL)
+
+
+def escalation(task: str, tier: str):
+    """
+    The (tier, model) to retry on after ``tier`` produced an invalid answer for
+    ``task``, or None when escalation is off or there is no bigger model.
+    """
+    if not OLLAMA_ESCALATE or tier == "large" or TIERS["large"] == TIERS.get(tier):
+        return None
+    ESCALATIONS[task] = ESCALATIONS.get(task, 0) + 1
+    print(f"⬆️ {task}: {tier} model answer failed validation; retrying on the large model")
+    return "large", TIERS["large"]
+
+
+def _tier_label(model):
+    model = model or OLLAMA_MODEL
+    for tier, name in TIERS.items():
+        if name == model:
+            return tier
+    return model
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Process-wide requests session with a keep-alive pool sized to the gate."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(4, OLLAMA_MAX_PARALLEL))
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+_async_sessions = weakref.WeakKeyDictionary()
+
+
+async def get_async_session() -> aiohttp.ClientSession:
+    """Shared aiohttp session for the running loop (keep-alive to Ollama)."""
+    loop = asyncio.get_running_loop()
+    session = _async_sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=OLLAMA_TIMEOUT_SECONDS))
+        _async_sessions[loop] = session
+    return session
+
+
+async def close_async_session():
+    """Close the running loop's Ollama session (call before the loop shuts down)."""
+    session = _async_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def _payload(prompt, model, stream, extra):
+    payload = {"model": model or OLLAMA_MODEL, "prompt": prompt, "stream": stream}
+    if OLLAMA_KEEP_ALIVE:
+        payload["keep_alive"] = OLLAMA_KEEP_ALIVE
+    payload.update({k: v for k, v in extra.items() if v is not None})
+    return payload
+
+
+class _Slot:
+    """Hold a gate slot for the duration of a request and time the wait and the call."""
+
+    def __init__(self, priority, model=None):
+        self.priority = priority
+        self.label = _PRIORITY_NAMES.get(priority, str(priority))
+        self.tier = _tier_label(model)
+
+    def __enter__(self):
+        t0 = time.perf_counter()
+        GATE.acquire(self.priority)
+        self.started = time.perf_counter()
+        metrics.observe("ollama_queue_wait_seconds", self.started - t0, self.label)
+        return self
+
+    def __exit__(self, *exc):
+        GATE.release()
+        elapsed = time.perf_counter() - self.started
+        metrics.observe("ollama_request_seconds", elapsed, self.label)
+        metrics.observe("ollama_tier_seconds", elapsed, self.tier)
+
+
+def iter_generate(prompt: str, model: str = None, priority: int = INTERACTIVE,
+                  timeout: float = OLLAMA_TIMEOUT_SECONDS, **extra):
+    """
+    Stream a generation, yielding each response fragment as Ollama produces it.
+    Closing the generator early closes the HTTP stream, which stops Ollama.
+    """
+    with _Slot(priority, model):
+        with get_session().post(f"{OLLAMA_URL}/api/generate", json=_payload(prompt, model, True, extra),
+                                stream=True, timeout=timeout) as res:
+            res.raise_for_status()
+            for line in res.iter_lines():
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    return
+
+
+def generate(prompt: str, model: str = None, priority: int = INTERACTIVE,
+             timeout: float = OLLAMA_TIMEOUT_SECONDS, **extra) -> str:
+    """Blocking, non-streamed generation. Returns the full response text."""
+    with _Slot(priority, model):
+        res = get_session().post(f"{OLLAMA_URL}/api/generate", json=_payload(prompt, model, False, extra),
+                                 timeout=timeout)
+        res.raise_for_status()
+        return res.json().get("response", "")
+
+
+async def agenerate(prompt: str, model: str = None, priority: int = INTERACTIVE,
+                    timeout: float = OLLAMA_TIMEOUT_SECONDS, **extra) -> str:
+    """Async generate. The gate is shared with sync callers (see PriorityGate.acquire_async)."""
+    label = _PRIORITY_NAMES.get(priority, str(priority))
+    t0 = time.perf_counter()
+    await GATE.acquire_async(priority)
+    started = time.perf_counter()
+    metrics.observe("ollama_queue_wait_seconds", started - t0, label)
+    try:
+        session = await get_async_session()
+        async with session.post(f"{OLLAMA_URL}/api/generate", json=_payload(prompt, model, False, extra),
+                                timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            resp.raise_for_status()
+            data = await resp.json(content_type=None)
+            return data.get("response", "")
+    finally:
+        GATE.release()
+        elapsed = time.perf_counter() - started
+        metrics.observe("ollama_request_seconds", elapsed, label)
+        metrics.observe("ollama_tier_seconds", elapsed, _tier_label(model))
+
+
+def warm_up(model: str = None) -> bool:
+    """
+    Load the model into memory ahead of the first real request: an empty prompt
+    makes Ollama load it and hold it for keep_alive. Returns True on success.
+    Defaults to the model that plans /remind.
+    """
+    model = model or route("plan")[1]
+    t0 = time.perf_counter()
+    try:
+        generate("", model=model, priority=BACKGROUND)
+    except Exception as e:
+        print(f"⚠️ Ollama warm-up failed: {e}")
+        return False
+    print(f"🔥 Ollama model {model or OLLAMA_MODEL} warmed up in {time.perf_counter() - t0:.1f}s")
+    return True
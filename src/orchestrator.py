@@ -1,9 +1,15 @@
 # src/orchestrator.py
 import json
+import time
 import traceback
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from src.mcp import run_call
-from src.db import get_conn
+from src.mcp import run_call_with_attempts
+from src.db import get_conn, complete_task, record_run
+from src import metrics
+from src.config import PLAN_MAX_PARALLEL
+from src.plans import CompiledPlan, forget, get_compiled
 
 
 def log_event(event_type: str, message: str):
@@ -34,22 +40,172 @@ def log_event(event_type: str, message: str):
         print(f"⚠️ Log insert failed: {e}")
 
 
-def run_task(task_row):
+def _resolve_args(args, outputs):
+    """Replace {"$from": "<call id>"[, "key": "<field>"]} values with that call's output."""
+    if isinstance(args, Mapping):
+        if "$from" in args:
+            value = outputs[args["$from"]]
+            key = args.get("key")
+            return value.get(key) if key and isinstance(value, dict) else value
+        return {k: _resolve_args(v, outputs) for k, v in args.items()}
+    if isinstance(args, list):
+        return [_resolve_args(v, outputs) for v in args]
+    return args
+
+
+def _plan_graph(calls):
+    """Return ({id: call}, {id: [dependency ids]}) and reject unknown ids or cycles."""
+    by_id, deps = {}, {}
+    for i, call in enumerate(calls):
+        cid = str(call.get("id", i))
+        if cid in by_id:
+            raise ValueError(f"Duplicate call id '{cid}' in plan")
+        by_id[cid] = call
+        deps[cid] = [str(d) for d in call.get("depends_on", [])]
+    for cid, ds in deps.items():
+        missing = [d for d in ds if d not in by_id]
+        if missing:
+            raise ValueError(f"Call '{cid}' depends on unknown call(s) {missing}")
+
+    # Kahn's algorithm: if we can't order every call there is a cycle
+    indegree = {cid: len(ds) for cid, ds in deps.items()}
+    ready = [cid for cid, n in indegree.items() if n == 0]
+    ordered = 0
+    while ready:
+        cid = ready.pop()
+        ordered += 1
+        for other, ds in deps.items():
+            if cid in ds:
+                indegree[other] -= 1
+                if indegree[other] == 0:
+                    ready.append(other)
+    if ordered != len(by_id):
+        raise ValueError("Plan calls have a dependency cycle")
+    return by_id, deps
+
+
+def run_calls(calls, max_workers: int = PLAN_MAX_PARALLEL, attempts: dict = None,
+              run_key: str = None, task_id: int = None):
+    """
+    Run a plan's MCP calls and return {call id: output}.
+
+    Plans without any "depends_on" run strictly in order, as they always have.
+    Otherwise each call may carry an "id" (defaults to its index) and a
+    "depends_on" list; calls whose dependencies are done run concurrently on a
+    bounded pool, and an arg of the form {"$from": "<id>"} receives that call's
+    output. The first failure stops new calls from starting and is re-raised.
+    If ``attempts`` is given it is filled with {call id: MCP attempts used}.
+    ``run_key`` identifies this fire of the task (see fire_key); each call then
+    gets the idempotency key "<run_key>:<call id>", so running the same fire
+    again skips calls that already completed. Without one every call runs.
+    """
+    attempts = {} if attempts is None else attempts
+
+    def _run(cid, call):
+        key = f"{run_key}:{cid}" if run_key else None
+        try:
+            output, attempts[cid] = run_call_with_attempts(call, key, task_id)
+        except Exception as e:
+            attempts[cid] = getattr(e, "attempts", 1)
+            raise
+        return output
+
+    if not any(call.get("depends_on") for call in calls):
+        outputs = {}
+        for i, call in enumerate(calls):
+            cid = str(call.get("id", i))
+            outputs[cid] = _run(cid, call)
+        return outputs
+
+    by_id, deps = _plan_graph(calls)
+    outputs, pending, running = {}, dict(by_id), {}
+    error = None
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="plan") as pool:
+        while pending or running:
+            if error is None:
+                for cid in [c for c in pending if all(d in outputs for d in deps[c])]:
+                    call = pending.pop(cid)
+                    resolved = {"tool": call.get("tool"), "args": _resolve_args(call.get("args", {}), outputs)}
+                    running[pool.submit(_run, cid, resolved)] = cid
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                cid = running.pop(fut)
+                try:
+                    outputs[cid] = fut.result()
+                except Exception as e:
+                    error = error or e
+    if error is not None:
+        raise error
+    return outputs
+
+
+def fire_key(task_id, fired_at=None, one_shot: bool = False):
+    """
+    Identify one fire of a task: "<task id>@<scheduled time>", where ``fired_at``
+    is the run time the scheduler fired the job for (see scheduler.FireTimeMixin).
+    One-shots fire once, so "<task id>@once". Without a scheduled time (manual or
+    ad-hoc runs) there is nothing to deduplicate against, so None.
+    """
+    if one_shot:
+        return f"{task_id}@once"
+    if fired_at is None:
+        return None
+    return f"{task_id}@{fired_at}"
+
+
+def run_recorded(task_id, calls, max_workers: int = PLAN_MAX_PARALLEL, run_key: str = None):
+    """
+    run_calls for a stored task that also writes a row to the run table (outputs
+    or error, and the most MCP attempts any call needed). Re-raises failures.
+    Calls are idempotent per ``run_key`` (see fire_key); without one they always run.
+    """
+    if task_id is None:
+        return run_calls(calls, max_workers)
+    attempts = {}
+    started_at = datetime.utcnow().isoformat()
+    try:
+        outputs = run_calls(calls, max_workers, attempts, run_key, task_id)
+    except Exception as e:
+        _safe_record_run(task_id, started_at, False, None, str(e), max(attempts.values(), default=1))
+        raise
+    _safe_record_run(task_id, started_at, True, outputs, None, max(attempts.values(), default=1))
+    return outputs
+
+
+def _safe_record_run(task_id, started_at, ok, outputs, error_text, attempt):
+    try:
+        record_run(task_id, started_at, datetime.utcnow().isoformat(), ok, outputs, error_text, attempt)
+    except Exception as e:
+        print(f"⚠️ Could not record run for task {task_id}: {e}")
+
+
+def run_task(task_row, task_id: int = None, run_key: str = None):
     """
     Executes a saved task from the DB via MCP.
-    Each task_row should have 'params_json' with calls[].
+    task_row is a CompiledPlan, a row dict with 'params_json', or the plan itself (calls[]).
+    With ``task_id`` the execution is recorded in the run table.
     """
+    started = time.perf_counter()
+    task_type = "unknown"
     try:
-        params_json = task_row.get("params_json")
-        if isinstance(params_json, str):
-            params = json.loads(params_json)
+        if isinstance(task_row, CompiledPlan):
+            task_type, calls = task_row.name, task_row.calls
         else:
-            params = params_json
+            if "calls" in task_row:
+                params = task_row
+            else:
+                params_json = task_row.get("params_json")
+                if isinstance(params_json, str):
+                    params = json.loads(params_json)
+                else:
+                    params = params_json
+            task_type = params.get("plan", "unknown")
+            calls = params.get("calls", [])
 
-        calls = params.get("calls", [])
-        for call in calls:
-            print(f"⚙️ Orchestrator dispatching MCP call: {call}")
-            run_call(call)  # 🔥 The MCP executes the tool dynamically
+        print(f"⚙️ Orchestrator dispatching {len(calls)} MCP call(s)")
+        run_recorded(task_id, calls, run_key=run_key)  # 🔥 The MCP executes the tools dynamically
         return True
     except Exception as e:
         print(f"❌ run_task failed: {e}")
@@ -60,32 +216,84 @@ def run_task(task_row):
         print(traceback.format_exc())
         log_event("FATAL", f"Critical orchestrator failure: {e}")
         return False
+    finally:
+        metrics.observe("run_task_seconds", time.perf_counter() - started, task_type)
+
+
+def _runnable(task_id, enabled, status) -> bool:
+    """False (and say why) for a task cancelled or completed since its job was scheduled."""
+    if enabled and status == "active":
+        return True
+    print(f"⏭️ Task {task_id} is {'disabled' if not enabled else status}; not running it.")
+    return False
+
+
+def task_is_runnable(task_id: int) -> bool:
+    """Whether a stored task is still enabled and active (a job may outlive a cancel in another process)."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT enabled, status FROM task WHERE id=?", (task_id,))
+    row = cur.fetchone()
+    conn.close()
+    return row is not None and _runnable(task_id, *row)
+
+
+def run_one_shot(task_id: int, plan):
+    """
+    Runs a FREQ=ONCE task and, only if it succeeded, marks it completed so it is
+    never restored (or fired) again. A task cancelled meanwhile is not run.
+    """
+    if not task_is_runnable(task_id):
+        return False
+    ok = run_task(plan, task_id, fire_key(task_id, one_shot=True))
+    if ok:
+        forget(task_id)
+        if not complete_task(task_id):
+            print(f"⚠️ One-shot task {task_id} was already completed.")
+    return ok
+
 
+def load_params_json(task_id: int):
+    """Raw params_json of a task ("{}" if it is gone)."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT params_json FROM task WHERE id=?", (task_id,))
+    row = cur.fetchone()
+    conn.close()
+    return row[0] if row else "{}"
 
-def run_task_from_db(task_id: int):
+
+def run_task_from_db(task_id: int, one_shot: bool = False, fired_at: str = None):
     """
     Utility to run a task directly from the database (used by scheduler or manual trigger).
+    One-shot tasks are marked completed after a successful run. ``fired_at`` (the
+    scheduled run time, filled in by the scheduler) makes the fire idempotent.
     """
     try:
         conn = get_conn()
         cur = conn.cursor()
-        cur.execute("SELECT params_json FROM task WHERE id=?", (task_id,))
+        cur.execute("SELECT enabled, status, updated_at FROM task WHERE id=?", (task_id,))
         row = cur.fetchone()
         conn.close()
 
         if not row:
             print(f"⚠️ Task ID {task_id} not found in DB.")
             return False
+        enabled, status, updated_at = row
+        if not _runnable(task_id, enabled, status):
+            return False
 
-        params_json = row[0]
         try:
-            task_plan = json.loads(params_json)
+            # params_json is only read and decoded when the compiled plan is stale
+            task_plan = get_compiled(task_id, updated_at, loader=lambda: load_params_json(task_id))
         except json.JSONDecodeError:
             print(f"⚠️ Task {task_id} has invalid JSON structure.")
             return False
 
         print(f"🗂 Running task from DB: ID={task_id}")
-        return run_task(task_plan)
+        if one_shot:
+            return run_one_shot(task_id, task_plan)
+        return run_task(task_plan, task_id, fire_key(task_id, fired_at))
 
     except Exception as e:
         print(f"⚠️ run_task_from_db error: {e}")
@@ -1,41 +1,237 @@
-import requests
 import json
 import re
-from .db import create_task
-from .config import OLLAMA_URL, OLLAMA_MODEL, TELEGRAM_CHAT_ID
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from .db import create_task, update_task_plan
+from . import nl_rules, ollama_client
+from .config import (OLLAMA_MODEL, TELEGRAM_CHAT_ID, LLM_CACHE_ENABLED, OLLAMA_MAX_PARALLEL,
+                     PLANNER_DEADLINE_SECONDS)
 
-def call_ollama(prompt: str):
-    """Call local Ollama and reconstruct streamed responses into one string."""
+TASK_TYPES = ("reminder", "bill_link", "email_summary", "order")
+
+# Sent as Ollama's "format": decoding is constrained to this shape, so the model
+# can only emit a plan object (no prose around it, no missing keys).
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "task_type": {"type": "string", "enum": list(TASK_TYPES)},
+        "schedule_rule": {"type": "string"},
+        "text": {"type": "string"},
+    },
+    "required": ["task_type", "schedule_rule", "text"],
+}
+
+
+class TaskPlan:
+    """A validated planner result (the PLAN_SCHEMA shape plus optional order extras)."""
+
+    __slots__ = ("task_type", "schedule_rule", "text", "extra")
+
+    def __init__(self, task_type: str, schedule_rule: str, text: str, extra: dict = None):
+        self.task_type = task_type
+        self.schedule_rule = schedule_rule
+        self.text = text
+        self.extra = extra or {}
+
+    @classmethod
+    def from_dict(cls, obj) -> "TaskPlan":
+        """Validate a decoded LLM object against PLAN_SCHEMA; raises ValueError."""
+        if not isinstance(obj, dict):
+            raise ValueError("plan is not a JSON object")
+        missing = [k for k in PLAN_SCHEMA["required"] if not isinstance(obj.get(k), str) or not obj[k].strip()]
+        if missing:
+            raise ValueError(f"plan is missing {missing}")
+        if obj["task_type"] not in TASK_TYPES:
+            raise ValueError(f"unknown task_type {obj['task_type']!r}")
+        rule = obj["schedule_rule"].strip()
+        if not rule.upper().startswith("RRULE:") or "FREQ=" not in rule.upper():
+            raise ValueError(f"schedule_rule {rule!r} is not an RRULE")
+        return cls(obj["task_type"], rule, obj["text"].strip(), obj.get("extra"))
+
+    def to_dict(self) -> dict:
+        plan = {"task_type": self.task_type, "schedule_rule": self.schedule_rule, "text": self.text}
+        if self.extra:
+            plan["extra"] = self.extra
+        return plan
+
+
+def plan_from_llm(prompt: str):
+    """
+    Ask the model for a schema-constrained plan. Returns a TaskPlan, or None.
+    Runs on the "plan" tier and escalates once to the large tier if that answer
+    doesn't validate.
+    """
+    tier, model = ollama_client.route("plan")
+    while True:
+        raw = call_ollama(prompt, format=PLAN_SCHEMA, model=model, tier=tier,
+                          validate=lambda out: TaskPlan.from_dict(extract_json_from_text(out)))
+        if not raw:
+            return None  # the call itself failed; a bigger model won't fix that
+        plan = _validated_plan(raw)
+        if plan is not None:
+            return plan
+        bigger = ollama_client.escalation("plan", tier)
+        if bigger is None:
+            return None
+        tier, model = bigger
+
+
+def _validated_plan(raw):
+    if not raw:
+        return None
     try:
-        payload = {"model": OLLAMA_MODEL, "prompt": prompt, "stream": True}
-        with requests.post(f"{OLLAMA_URL}/api/generate", json=payload, stream=True, timeout=60) as res:
-            output = ""
-            for line in res.iter_lines():
-                if not line:
-                    continue
-                try:
-                    data = json.loads(line)
-                    if "response" in data:
-                        output += data["response"]
-                except json.JSONDecodeError:
-                    continue
-            return output.strip()
+        return TaskPlan.from_dict(extract_json_from_text(raw))
+    except Exception as e:
+        print("⚠️ Failed to parse LLM response:", e)
+        return None
+
+
+# Runs plan_from_llm off the caller's thread so the caller can stop waiting;
+# queueing for the model itself still happens at ollama_client.GATE
+_LLM_POOL = ThreadPoolExecutor(max_workers=max(2, OLLAMA_MAX_PARALLEL * 2), thread_name_prefix="planner-llm")
+# plan_within outcomes since startup, shown in /metrics
+DEADLINE_STATS = {"in_time": 0, "late": 0}
+
+
+def plan_within(prompt: str, deadline: float = PLANNER_DEADLINE_SECONDS):
+    """
+    plan_from_llm with a deadline. Returns (plan, late):
+      - answered in time: (TaskPlan or None, None)
+      - deadline passed:  (None, Future) — the call keeps running and the
+        Future resolves to a TaskPlan or None; read it with late_plan().
+    """
+    future = _LLM_POOL.submit(plan_from_llm, prompt)
+    try:
+        plan = future.result(timeout=deadline)
+        DEADLINE_STATS["in_time"] += 1
+        return plan, None
+    except FuturesTimeout:
+        DEADLINE_STATS["late"] += 1
+        print(f"⏱️ No plan from Ollama within {deadline:g}s; answering without it")
+        return None, future
+
+
+def late_plan(future):
+    """The TaskPlan a late plan_within call produced, or None."""
+    try:
+        return future.result()
+    except Exception as e:
+        print("⚠️ Late Ollama plan failed:", e)
+        return None
+
+
+def call_ollama(prompt: str, use_cache: bool = LLM_CACHE_ENABLED, format=None, model: str = None,
+                tier: str = None, validate=None):
+    """
+    Call local Ollama and reconstruct streamed responses into one string.
+    ``format`` ("json" or a JSON schema) constrains the output. Answers that
+    ``validate`` accepts (default: they contain parseable JSON) are cached under
+    the prompt, tier and format (see src/llm_cache.py), so a repeated
+    instruction skips the model entirely.
+    """
+    model = model or OLLAMA_MODEL
+    cache = None
+    if use_cache:
+        from .llm_cache import get_cache
+        cache = get_cache(model)
+        variant = f"{tier or ''}\0{json.dumps(format, sort_keys=True)}"
+        cached = cache.get(prompt, variant)
+        if cached is not None:
+            print("⚡ Ollama plan served from cache")
+            return cached
+
+    output = _generate(prompt, format, model)
+    if cache is not None and output:
+        try:
+            if (validate or extract_json_from_text)(output) is not None:
+                cache.put(prompt, output, variant)
+        except Exception:
+            pass  # never cache an answer we couldn't use
+    return output
+
+
+def _generate(prompt: str, format=None, model: str = None):
+    try:
+        # Interactive priority: a user is waiting on this plan
+        stream = ollama_client.iter_generate(prompt, model=model, priority=ollama_client.INTERACTIVE, format=format)
+        extractor = JSONStreamExtractor()
+        output = ""
+        try:
+            for chunk in stream:
+                output += chunk
+                obj_text = extractor.feed(chunk)
+                if obj_text is not None:
+                    # The plan is complete: hang up so Ollama stops generating
+                    print("✂️ JSON plan complete; closing the Ollama stream early")
+                    return obj_text
+        finally:
+            stream.close()
+        return output.strip()
     except Exception as e:
         print("⚠️ Ollama call failed:", e)
         return None
 
 
+class JSONStreamExtractor:
+    """
+    Incrementally finds the first complete top-level {...} object in streamed text.
+    Braces inside JSON strings (and escaped quotes) are ignored, so feed() can
+    return the object's text the moment its closing brace arrives.
+    """
+
+    def __init__(self):
+        self.buf = []
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.started = False
+        self.done = False
+
+    def feed(self, chunk: str):
+        """Add text; returns the object's text once it is complete, else None."""
+        if self.done:
+            return None
+        for ch in chunk:
+            if not self.started:
+                if ch != "{":
+                    continue
+                self.started = True
+            self.buf.append(ch)
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.done = True
+                    return "".join(self.buf)
+        return None
+
+
 def extract_json_from_text(text: str):
     """
     Extract and parse the first valid JSON object from a text string.
     Handles messy LLM responses gracefully.
     """
-    # find first {...} block
-    match = re.search(r'\{[\s\S]*\}', text)
-    if not match:
-        raise ValueError("No JSON object found in text")
-
-    json_str = match.group(0)
+    # first balanced {...} block; text after it (chatter, a second object) is ignored
+    json_str = JSONStreamExtractor().feed(text)
+    if json_str is None:
+        match = re.search(r'\{[\s\S]*\}', text)
+        if not match:
+            raise ValueError("No JSON object found in text")
+        json_str = match.group(0)
+    else:
+        try:
+            return json.loads(json_str)
+        except json.JSONDecodeError:
+            pass  # fall through to the repairs below
 
     # remove trailing commas and comments (// style)
     json_str = re.sub(r'//.*', '', json_str)
@@ -104,6 +300,56 @@ def build_internal_plan(plan_obj):
     }
 
 
+def reminder_prompt(instruction: str) -> str:
+    """The prompt /remind sends when the rule fast path can't place the schedule."""
+    return (
+        "You are a JSON-only generator. Convert the user's instruction into a "
+        "single JSON object and output only that JSON object and nothing else. "
+        "The JSON must have exactly these keys: "
+        "\"task_type\" (one of 'reminder'|'bill_link'|'email_summary'), "
+        "\"schedule_rule\" (an iCalendar RRULE string like "
+        "'RRULE:FREQ=DAILY;BYHOUR=9;BYMINUTE=0'), "
+        "\"text\" (the message to send).\n\n"
+        f"Input: {instruction}\nOutput:"
+    )
+
+
+_NON_REMINDER = re.compile(r"\b(?:e-?mail|gmail|inbox|order|buy|bill|pay)\b", re.IGNORECASE)
+
+
+def _rule_parts(rule: str):
+    return {p.strip() for p in (rule or "").upper().replace("RRULE:", "").split(";") if p.strip()}
+
+
+def _store_plan(task_id: int, plan: dict) -> bool:
+    if not update_task_plan(task_id, plan["task_type"], build_internal_plan(plan), plan["schedule_rule"]):
+        return False
+    from .plans import forget
+    forget(task_id)
+    return True
+
+
+def correct_guessed_task(task_id: int, guessed: dict, typed, replace=None):
+    """
+    Apply a late LLM plan to a task created from a guess, if they disagree on
+    the task type or the schedule. ``replace(task_id, plan)`` stores the new
+    plan (default: rebuild the internal plan and update the task row).
+    Returns the applied plan, or None if nothing changed.
+    """
+    if typed is None:
+        print(f"⚠️ Late Ollama plan unusable; task {task_id} keeps its guessed schedule")
+        return None
+    plan = typed.to_dict()
+    if (plan["task_type"] == guessed["task_type"]
+            and _rule_parts(plan["schedule_rule"]) == _rule_parts(guessed["schedule_rule"])):
+        print(f"✅ Late Ollama plan agrees with task {task_id}")
+        return None
+    if not (replace or _store_plan)(task_id, plan):
+        return None
+    print(f"🔁 Task {task_id} corrected by late Ollama plan: {plan['task_type']} {plan['schedule_rule']}")
+    return plan
+
+
 def parse_command(command_text: str, user_id: int = 1):
     """Interpret a natural-language command and save as a structured task."""
     system_prompt = (
@@ -126,15 +372,20 @@ def parse_command(command_text: str, user_id: int = 1):
         f"Input: {command_text}\nOutput:"
     )
 
-    raw = call_ollama(system_prompt)
+    # Plain reminders with a recognizable schedule skip the model entirely
     plan = None
-    if raw:
-        try:
-            plan = extract_json_from_text(raw)
-        except Exception as e:
-            print("⚠️ Failed to parse LLM response:", e)
+    if not _NON_REMINDER.search(command_text):
+        plan = nl_rules.parse_reminder(command_text, source="parse_command")
+    else:
+        nl_rules.record("parse_command", False)
+    late = None
+    if not plan:
+        typed, late = plan_within(system_prompt)
+        plan = typed.to_dict() if typed else None
+    if not plan and late is not None:
+        plan = nl_rules.guess_reminder(command_text)
 
-    if not plan or not isinstance(plan, dict):
+    if not plan:
         # fallback
         plan = {
             "task_type": "reminder",
@@ -172,5 +423,7 @@ def parse_command(command_text: str, user_id: int = 1):
 
     task_id = create_task(user_id, plan["task_type"], internal, plan["schedule_rule"], 1)
     print(f"✅ Task created from natural language (id={task_id})")
+    if late is not None and plan["task_type"] != "order":
+        late.add_done_callback(lambda f: correct_guessed_task(task_id, plan, late_plan(f)))
     print(json.dumps(plan, indent=2))
     return plan
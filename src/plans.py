@@ -0,0 +1,82 @@
+# src/plans.py
+"""
+Compiled task plans.
+
+A task's params_json is decoded once, when the task is loaded or first fired,
+into a CompiledPlan whose calls hold the resolved MCP tool callable and
+read-only args. Later fires reuse it (keyed by task id and updated_at) instead
+of parsing JSON again.
+"""
+import copy
+import json
+import threading
+from types import MappingProxyType
+
+from src.mcp import resolve_tool
+
+
+class CompiledCall:
+    """One MCP call with its tool already resolved. Reads like the call dict it came from."""
+
+    __slots__ = ("id", "tool", "args", "depends_on", "fn")
+
+    def __init__(self, cid, tool, args, depends_on=(), fn=None):
+        self.id = cid
+        self.tool = tool
+        self.args = MappingProxyType(copy.deepcopy(dict(args or {})))
+        self.depends_on = tuple(depends_on or ())
+        self.fn = fn
+
+    def get(self, key, default=None):
+        # Lets run_calls / run_call treat compiled calls and plain dicts alike
+        value = getattr(self, key) if key in self.__slots__ else None
+        return default if value is None else value
+
+
+class CompiledPlan:
+    __slots__ = ("name", "calls", "tool", "text")
+
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = tuple(calls)
+        self.tool, self.text = (self.calls[0].tool, self.calls[0].args.get("text")) if self.calls else (None, None)
+
+
+def compile_plan(params) -> CompiledPlan:
+    """Decode (if needed) and compile a plan dict / params_json string."""
+    if isinstance(params, (str, bytes)):
+        params = json.loads(params)
+    calls = []
+    for i, call in enumerate(params.get("calls", [])):
+        tool = call.get("tool")
+        try:
+            fn = resolve_tool(tool)
+        except Exception:
+            fn = None  # unknown tool: let run_call raise its usual error when it fires
+        calls.append(CompiledCall(call.get("id", i), tool, call.get("args", {}), call.get("depends_on"), fn))
+    return CompiledPlan(params.get("plan", "unknown"), calls)
+
+
+_compiled = {}  # task id -> (updated_at, CompiledPlan)
+_lock = threading.Lock()
+
+
+def get_compiled(task_id: int, updated_at, params_json=None, loader=None) -> CompiledPlan:
+    """
+    Compiled plan for a task, rebuilt only when its updated_at changed.
+    ``params_json`` or ``loader()`` (returning it) supplies the JSON on a miss.
+    """
+    with _lock:
+        hit = _compiled.get(task_id)
+    if hit and hit[0] == updated_at:
+        return hit[1]
+    plan = compile_plan(params_json if params_json is not None else loader())
+    with _lock:
+        _compiled[task_id] = (updated_at, plan)
+    return plan
+
+
+def forget(task_id: int):
+    """Drop a task's compiled plan (task deleted or disabled)."""
+    with _lock:
+        _compiled.pop(task_id, None)
@@ -0,0 +1,174 @@
+# src/resilience.py
+import asyncio
+import random
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+
+class RetryPolicy:
+    """
+    How a tool is retried: up to ``max_attempts`` tries, sleeping an exponentially
+    growing, fully jittered delay (base_delay * 2**n, capped at max_delay) between
+    them. Only errors whose class (or a base class) is named in ``retry_on`` are
+    retried and count against the dependency's circuit breaker; anything else is a
+    bug or a permanent failure and is raised at once.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8.0, retry_on=(), dependency=None):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = tuple(retry_on)
+        self.dependency = dependency
+
+    def is_retryable(self, exc: BaseException) -> bool:
+        return any(cls.__name__ in self.retry_on for cls in type(exc).__mro__)
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number ``attempt`` (1-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive dependency failures and fails
+    fast for ``reset_timeout`` seconds; then lets one trial call through
+    (half-open) and closes again on success.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._trial_running):
+                raise CircuitOpenError(f"Circuit for '{self.name}' is open; failing fast")
+            if state == "half-open":
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def release_trial(self):
+        """A call ended without a verdict on the dependency (cancelled, interrupted)."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    print(f"🔌 Circuit for '{self.name}' opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(dependency: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+    """Shared circuit breaker for a dependency name (one per process), or None."""
+    if not dependency:
+        return None
+    with _breakers_lock:
+        br = _breakers.get(dependency)
+        if br is None:
+            br = _breakers[dependency] = CircuitBreaker(dependency, failure_threshold, reset_timeout)
+        return br
+
+
+def breaker_states():
+    """Return {dependency: state} for every breaker created so far."""
+    with _breakers_lock:
+        return {name: br.state for name, br in _breakers.items()}
+
+
+def call_with_retry(fn, policy: RetryPolicy, breaker: CircuitBreaker = None):
+    """Run ``fn()`` under ``policy``/``breaker``. Returns (result, attempts used)."""
+    attempt = 0
+    while True:
+        attempt += 1
+        if breaker:
+            breaker.before_call()
+        try:
+            result = fn()
+        except Exception as e:
+            if not policy.is_retryable(e):
+                if breaker:
+                    breaker.record_success()  # the dependency answered; the call itself was bad
+                raise
+            if breaker:
+                breaker.record_failure()
+            if attempt >= policy.max_attempts or (breaker and breaker.state == "open"):
+                e.attempts = attempt
+                raise
+            delay = policy.backoff(attempt)
+            print(f"🔁 Attempt {attempt} failed ({e}); retrying in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+        except BaseException:
+            if breaker:
+                breaker.release_trial()  # else a half-open breaker would wait for this trial forever
+            raise
+        if breaker:
+            breaker.record_success()
+        return result, attempt
+
+
+async def acall_with_retry(coro_fn, policy: RetryPolicy, breaker: CircuitBreaker = None):
+    """Async counterpart of call_with_retry for ``coro_fn()`` returning an awaitable."""
+    attempt = 0
+    while True:
+        attempt += 1
+        if breaker:
+            breaker.before_call()
+        try:
+            result = await coro_fn()
+        except Exception as e:
+            if not policy.is_retryable(e):
+                if breaker:
+                    breaker.record_success()
+                raise
+            if breaker:
+                breaker.record_failure()
+            if attempt >= policy.max_attempts or (breaker and breaker.state == "open"):
+                e.attempts = attempt
+                raise
+            delay = policy.backoff(attempt)
+            print(f"🔁 Attempt {attempt} failed ({e}); retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            if breaker:
+                breaker.release_trial()  # e.g. CancelledError
+            raise
+        if breaker:
+            breaker.record_success()
+        return result, attempt
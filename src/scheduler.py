@@ -1,16 +1,486 @@
 # src/scheduler.py
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
+from apscheduler.events import (
+    EVENT_JOB_SUBMITTED,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_ERROR,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_MAX_INSTANCES,
+)
+from apscheduler.job import Job
+from apscheduler.triggers.base import BaseTrigger
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from datetime import datetime, timedelta
+import copy
+import multiprocessing
+import os
+import socket
+import threading
+import time
 import pytz
 import logging
-from src.orchestrator import run_task
-from src.db import get_conn
+from src.orchestrator import run_task_from_db
+from src.job_queue import enqueue_task
+from src.db import get_conn, acquire_lease, purge_history, release_lease
+from src.config import (
+    SCHEDULER_JITTER_SECONDS,
+    SCHEDULER_SPREAD_MINUTES,
+    SCHEDULER_MISFIRE_GRACE_SECONDS,
+    SCHEDULER_COALESCE,
+    SCHEDULER_POOL_FAST,
+    SCHEDULER_POOL_IO,
+    SCHEDULER_POOL_CPU,
+    SCHEDULER_LEASE_TTL_SECONDS,
+    SCHEDULER_INSTANCE_ID,
+    METRICS_PORT,
+    METRICS_HOST,
+)
+from src.utils import short_hash
+from src import metrics
 import json
 import re
 
 logger = logging.getLogger("ai_agent")
 IST = pytz.timezone("Asia/Kolkata")
 
+# Defaults applied to every job: a late job still runs if it is at most
+# SCHEDULER_MISFIRE_GRACE_SECONDS late, and a backlog of missed runs collapses into one.
+JOB_DEFAULTS = {
+    "misfire_grace_time": SCHEDULER_MISFIRE_GRACE_SECONDS,
+    "coalesce": SCHEDULER_COALESCE,
+    "max_instances": 1,
+}
+
+# Which executor pool each task type runs on. Slow Gmail digests and store orders
+# must not be able to starve plain reminders, so they get their own pool; PDF
+# exports (/export_notes) render on a process pool.
+POOL_SIZES = {
+    "fast": SCHEDULER_POOL_FAST,
+    "io": SCHEDULER_POOL_IO,
+    "cpu": SCHEDULER_POOL_CPU,
+}
+TASK_EXECUTORS = {
+    "reminder": "fast",
+    "bill_link": "fast",
+    "order": "io",
+    "email_summary": "io",
+    "notes_export": "cpu",
+}
+
+
+def executor_for(task_type: str) -> str:
+    """Name of the executor pool a task type is routed to."""
+    return TASK_EXECUTORS.get(task_type or "reminder", "fast")
+
+
+class FireTimeMixin:
+    """
+    Executor mixin that tells a job which run time it fired for. A job opts in by
+    being added with ``kwargs={"fired_at": None}``; each submission then gets
+    ``fired_at`` set to the nominal run time (ISO string, jitter removed; the
+    latest one when missed runs are coalesced), which orchestrator.fire_key turns
+    into the fire's idempotency key. Every process derives the same key for the
+    same fire, so a fire the old leader completed is a no-op when a new leader
+    catches up on it, while two different fires are never folded together.
+    """
+
+    def _do_submit_job(self, job, run_times):
+        if "fired_at" in job.kwargs:
+            fired = Job.__new__(Job)
+            for slot in Job.__slots__:
+                if slot != "__weakref__" and hasattr(job, slot):
+                    setattr(fired, slot, getattr(job, slot))
+            fired.kwargs = {**job.kwargs, "fired_at": nominal_fire_time(job.trigger, run_times[-1]).isoformat()}
+            job = fired
+        return super()._do_submit_job(job, run_times)
+
+
+class FireTimeThreadPoolExecutor(FireTimeMixin, ThreadPoolExecutor):
+    pass
+
+
+class FireTimeProcessPoolExecutor(FireTimeMixin, ProcessPoolExecutor):
+    pass
+
+
+FIRE_TIME = {"fired_at": None}  # job kwargs for functions that take the fire time
+
+
+def build_executors():
+    """
+    Named executor pools for a scheduler. "default" only catches jobs added
+    without an explicit executor. Jobs on the "cpu" process pool must use a
+    picklable module-level function (e.g. orchestrator.run_task), not a closure.
+
+    The process pool starts its workers from a forkserver where available, else
+    spawns them. A plain fork would copy a process that already runs the lease,
+    broadcast, metrics and warm-up threads, and a child forked while one of them
+    held a lock (stdout, plans._lock, mcp._lock) could deadlock. Both methods
+    import the main script again, so scripts keep their startup under
+    ``if __name__ == "__main__"``.
+    """
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return {
+        "default": FireTimeThreadPoolExecutor(SCHEDULER_POOL_FAST),
+        "fast": FireTimeThreadPoolExecutor(POOL_SIZES["fast"]),
+        "io": FireTimeThreadPoolExecutor(POOL_SIZES["io"]),
+        "cpu": FireTimeProcessPoolExecutor(POOL_SIZES["cpu"],
+                                           pool_kwargs={"mp_context": multiprocessing.get_context(start_method)}),
+    }
+
+
+class PoolMetrics:
+    """
+    Per-pool queue depth, fed by scheduler events.
+
+    in_flight counts jobs submitted to a pool and not yet finished; anything above
+    the pool size is waiting for a free worker (queued).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._job_pools = {}
+        self._stats = {}
+
+    def _pool_stats(self, pool):
+        return self._stats.setdefault(pool, {
+            "in_flight": 0, "peak": 0, "completed": 0, "failed": 0, "missed": 0, "skipped": 0,
+        })
+
+    def track(self, job_id: str, pool: str):
+        """Remember which pool a job was added to (events only carry the job id)."""
+        with self._lock:
+            self._job_pools[job_id] = pool
+
+    def on_event(self, event):
+        with self._lock:
+            pool = self._job_pools.get(event.job_id, "default")
+            st = self._pool_stats(pool)
+            if event.code == EVENT_JOB_SUBMITTED:
+                st["in_flight"] += 1
+                st["peak"] = max(st["peak"], st["in_flight"])
+            elif event.code in (EVENT_JOB_EXECUTED, EVENT_JOB_ERROR):
+                st["in_flight"] = max(0, st["in_flight"] - 1)
+                st["completed" if event.code == EVENT_JOB_EXECUTED else "failed"] += 1
+            elif event.code == EVENT_JOB_MISSED:
+                st["missed"] += 1
+            elif event.code == EVENT_JOB_MAX_INSTANCES:
+                st["skipped"] += 1
+
+    def snapshot(self):
+        """Return {pool: {size, in_flight, queued, peak, completed, failed, missed, skipped}}."""
+        with self._lock:
+            out = {}
+            for pool, size in POOL_SIZES.items():
+                st = dict(self._pool_stats(pool))
+                st["size"] = size
+                st["queued"] = max(0, st["in_flight"] - size)
+                out[pool] = st
+            return out
+
+
+POOL_METRICS = PoolMetrics()
+
+
+class JobTimings:
+    """
+    Records, per task type, how late each job was handed to its pool relative to
+    its scheduled time (scheduler_fire_lag_seconds) and how long it took from
+    submission to completion, pool wait included (scheduler_job_seconds).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._job_types = {}
+        self._started = {}
+
+    def track(self, job_id: str, task_type: str):
+        with self._lock:
+            self._job_types[job_id] = task_type or "reminder"
+
+    def on_event(self, event):
+        now = time.time()
+        with self._lock:
+            task_type = self._job_types.get(event.job_id, "unknown")
+            if event.code == EVENT_JOB_SUBMITTED:
+                for run_time in event.scheduled_run_times:
+                    metrics.observe("scheduler_fire_lag_seconds", now - run_time.timestamp(), task_type)
+                self._started[event.job_id] = now
+                return
+            started = self._started.pop(event.job_id, None)
+        if started is not None:
+            metrics.observe("scheduler_job_seconds", now - started, task_type)
+
+
+JOB_TIMINGS = JobTimings()
+
+
+def track_job(job_id: str, task_type: str):
+    """Tell the pool and timing metrics which task type / pool a job id belongs to."""
+    POOL_METRICS.track(job_id, executor_for(task_type))
+    JOB_TIMINGS.track(job_id, task_type)
+
+
+def attach_pool_metrics(sched, pool_metrics=POOL_METRICS, timings=JOB_TIMINGS):
+    """Subscribe the pool depth and fire-lag/duration metrics to the scheduler's job events."""
+    sched.add_listener(
+        pool_metrics.on_event,
+        EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES,
+    )
+    sched.add_listener(timings.on_event, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+    return pool_metrics
+
+
+class SpreadTrigger(BaseTrigger):
+    """
+    Wraps another trigger and shifts every fire time by a fixed offset.
+
+    Jobs that share a wall-clock time (e.g. every digest at 09:00) get different
+    offsets inside the spread window, so they still fire within that window but
+    no longer all start in the same second.
+    """
+
+    def __init__(self, trigger, offset_seconds: int):
+        self.trigger = trigger
+        self.offset = timedelta(seconds=offset_seconds)
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        prev = previous_fire_time - self.offset if previous_fire_time else None
+        nxt = self.trigger.get_next_fire_time(prev, now - self.offset)
+        return nxt + self.offset if nxt else None
+
+    def __str__(self):
+        return f"{self.trigger} (+{int(self.offset.total_seconds())}s spread)"
+
+    def __repr__(self):
+        return f"<SpreadTrigger ({self.trigger!r}, offset={int(self.offset.total_seconds())}s)>"
+
+
+class TaskSync:
+    """
+    Keeps a scheduler's task jobs in step with the task table.
+
+    Tasks are created, replaced and cancelled by whichever process handled the
+    command, so a scheduler's own jobstore goes stale. Each call reads the live
+    rows and (re)adds the job of every task whose row changed since the last
+    call (``add_job(task_id, task_type, params_json, schedule_rule)``), and
+    removes jobs ("<prefix><task id>") of tasks that are no longer active.
+    """
+
+    def __init__(self, sched, add_job, prefix: str):
+        self.sched = sched
+        self.add_job = add_job
+        self.prefix = prefix
+        self._seen = {}  # task id -> (updated_at, schedule_rule, params_json) its job was built from
+        self._lock = threading.Lock()
+
+    def _live_rows(self, task_id=None):
+        conn = get_conn()
+        cur = conn.cursor()
+        query = "SELECT id, type, params_json, schedule_rule, updated_at FROM task WHERE status='active' AND enabled=1"
+        if task_id is not None:
+            cur.execute(query + " AND id=?", (task_id,))
+        else:
+            cur.execute(query)
+        rows = cur.fetchall()
+        conn.close()
+        return rows
+
+    def remember(self, task_id):
+        """Record that this process just scheduled ``task_id`` from its current row."""
+        with self._lock:
+            for tid, _, params_json, rule, updated_at in self._live_rows(task_id):
+                self._seen[tid] = (updated_at, rule, params_json)
+
+    def __call__(self):
+        """Sync once; returns (jobs added or replaced, jobs removed)."""
+        with self._lock:
+            live, added = {}, 0
+            for tid, task_type, params_json, rule, updated_at in self._live_rows():
+                live[tid] = (updated_at, rule, params_json)
+                if self._seen.get(tid) == live[tid]:
+                    continue
+                try:
+                    self.add_job(tid, task_type, params_json, rule)
+                    added += 1
+                except Exception as e:
+                    logger.error(f"⚠️ Could not sync task {tid}: {e}")
+                    del live[tid]  # retried on the next sync
+            removed = 0
+            for job in self.sched.get_jobs():
+                tid = job.id[len(self.prefix):] if job.id.startswith(self.prefix) else None
+                if tid is not None and tid.isdigit() and int(tid) not in live:
+                    job.remove()
+                    removed += 1
+            self._seen = live
+        if added or removed:
+            print(f"🔄 Synced jobs with the task table: {added} added/updated, {removed} removed")
+        return added, removed
+
+
+class SchedulerLeader:
+    """
+    Leader election over the ``scheduler_lease`` row.
+
+    Every process keeps its scheduler paused and heartbeats the lease every
+    ttl/3 seconds; whoever holds it resumes its scheduler, everyone else stays
+    paused. If the holder dies its lease expires after ``ttl`` seconds and the
+    next heartbeat of another process takes over (missed runs within the misfire
+    grace are then fired once, thanks to coalescing).
+
+    The task table, not any one jobstore, is the source of truth: the leader runs
+    ``sync`` (a TaskSync) before it resumes and on every renewal, so jobs created
+    or cancelled by other processes are picked up before they would fire.
+    """
+
+    def __init__(self, sched, name: str = "scheduler", holder: str = None, ttl: int = SCHEDULER_LEASE_TTL_SECONDS,
+                 sync=None):
+        self.sched = sched
+        self.name = name
+        self.holder = holder or SCHEDULER_INSTANCE_ID or f"{socket.gethostname()}:{os.getpid()}"
+        self.ttl = ttl
+        self.sync = sync
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def heartbeat(self):
+        """Renew/try the lease once, sync jobs if leading, and pause or resume the scheduler to match."""
+        try:
+            leader = acquire_lease(self.name, self.holder, self.ttl)
+        except Exception as e:
+            logger.error(f"⚠️ Lease heartbeat failed: {e}")
+            leader = False
+        if leader and self.sync is not None:
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"⚠️ Job sync failed: {e}")
+        if leader and not self.is_leader:
+            self.sched.resume()
+            print(f"👑 {self.holder} is now the scheduler leader")
+        elif not leader and self.is_leader:
+            self.sched.pause()
+            print(f"⏸️ {self.holder} lost the scheduler lease; jobs paused")
+        self.is_leader = leader
+        return leader
+
+    def _loop(self):
+        while not self._stop.wait(max(1.0, self.ttl / 3)):
+            self.heartbeat()
+
+    def start(self):
+        """Run one heartbeat now (so a lone process leads immediately), then keep renewing."""
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._loop, name="scheduler-lease", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self.is_leader:
+            self.sched.pause()
+            release_lease(self.name, self.holder)
+            self.is_leader = False
+
+
+def nominal_fire_time(trigger, run_time):
+    """
+    The fire time ``run_time`` was scheduled for before jitter: the same in every
+    process, whereas the jitter is drawn per process. Spread offsets are
+    deterministic and kept.
+    """
+    if isinstance(trigger, SpreadTrigger):
+        return nominal_fire_time(trigger.trigger, run_time - trigger.offset) + trigger.offset
+    jitter = getattr(trigger, "jitter", None)
+    if not jitter:
+        return run_time
+    plain = copy.copy(trigger)
+    plain.jitter = None
+    return plain.get_next_fire_time(None, run_time - timedelta(seconds=jitter)) or run_time
+
+
+def interval_start(task_id, interval_kwargs: dict):
+    """
+    First fire of an interval task: one interval after its schedule was last set
+    (task.updated_at). APScheduler would otherwise count from whenever each
+    process registered the job, so processes would disagree on the fire times.
+    None if the task row has no timestamp.
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT updated_at FROM task WHERE id = ?", (task_id,))
+    row = cur.fetchone()
+    conn.close()
+    if not row or not row[0]:
+        return None
+    try:
+        anchor = pytz.utc.localize(datetime.fromisoformat(row[0]))
+    except ValueError:
+        return None
+    return anchor + timedelta(**interval_kwargs)
+
+
+def jitter_for(task_type: str):
+    """
+    Jitter (seconds) for this task type, or None. APScheduler shifts each fire by
+    a random amount in [-jitter, +jitter], so a fire can also come that much early.
+    """
+    return SCHEDULER_JITTER_SECONDS.get(task_type or "reminder") or None
+
+
+def spread_offset(task_type: str, task_id) -> int:
+    """Stable per-task offset (seconds) inside the task type's spread window."""
+    minutes = SCHEDULER_SPREAD_MINUTES.get(task_type or "reminder", 0)
+    if minutes <= 0:
+        return 0
+    return int(short_hash(f"{task_type}:{task_id}"), 16) % (minutes * 60)
+
+
+def apply_spread(trigger, task_type: str, task_id):
+    """Return ``trigger`` shifted by the task's spread offset (unchanged if none)."""
+    offset = spread_offset(task_type, task_id)
+    return SpreadTrigger(trigger, offset) if offset else trigger
+
+
+def parse_run_at(rrule_str: str, timezone=IST):
+    """
+    Return the RUN_AT of a 'RRULE:FREQ=ONCE;RUN_AT=<iso>' rule as an aware datetime,
+    or None if the rule is not a one-shot or RUN_AT is missing/invalid.
+    """
+    if not rrule_str or "FREQ=ONCE" not in rrule_str.upper():
+        return None
+    for kv in rrule_str.replace("RRULE:", "").split(";"):
+        if "=" in kv:
+            k, v = kv.split("=", 1)
+            if k.strip().upper() == "RUN_AT":
+                try:
+                    dt = datetime.fromisoformat(v.strip())
+                except ValueError:
+                    return None
+                return timezone.localize(dt) if dt.tzinfo is None else dt
+    return None
+
+
+def build_trigger(trigger_type: str, kwargs: dict, task_type: str, task_id, timezone=IST):
+    """
+    Build an interval/cron trigger with the task type's jitter and spread applied.
+    One-shot ("date") triggers fire exactly at their run_date, or right away if overdue.
+    """
+    if trigger_type == "date":
+        run_date = max(kwargs["run_date"], datetime.now(timezone))
+        return DateTrigger(run_date=run_date, timezone=timezone)
+    jitter = jitter_for(task_type)
+    if trigger_type == "interval":
+        trigger = IntervalTrigger(timezone=timezone, jitter=jitter, start_date=interval_start(task_id, kwargs),
+                                  **kwargs)
+    else:
+        trigger = CronTrigger(timezone=timezone, jitter=jitter, **kwargs)
+    return apply_spread(trigger, task_type, task_id)
+
 
 def _extract_interval(parts, default=1):
     v = parts.get("INTERVAL")
@@ -32,11 +502,16 @@ def parse_rrule_to_kwargs(rrule_str: str):
     Converts an RRULE string into either:
       - ('interval', kwargs)  where kwargs are e.g. {"seconds": 5}
       - ('cron', kwargs)      where kwargs can be passed to CronTrigger (hour, minute, day_of_week)
+      - ('date', kwargs)      {"run_date": <aware datetime>} for FREQ=ONCE;RUN_AT=...
     Returns tuple (trigger_type, kwargs)
     """
     if not rrule_str or not isinstance(rrule_str, str):
         return "interval", {"minutes": 1}  # default
 
+    run_at = parse_run_at(rrule_str)
+    if run_at is not None:
+        return "date", {"run_date": run_at}
+
     try:
         rule = rrule_str.upper().replace("RRULE:", "")
         parts = {}
@@ -90,30 +565,57 @@ def parse_rrule_to_kwargs(rrule_str: str):
     return "interval", {"minutes": 1}
 
 
-def register_all_tasks(sched):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, schedule_rule FROM task WHERE enabled=1")
-    rows = cur.fetchall()
-    for tid, rule in rows:
-        try:
-            trigger_type, kwargs = parse_rrule_to_kwargs(rule)
-            if trigger_type == "interval":
-                sched.add_job(run_task, "interval", args=[tid], **kwargs)
-            else:  # cron
-                # Use CronTrigger to schedule at wall-clock times (respects timezone set on scheduler)
-                trigger = CronTrigger(**kwargs)
-                sched.add_job(run_task, trigger=trigger, args=[tid])
-            print(f"🕒 Registered task {tid} ({trigger_type}: {kwargs})")
-        except Exception as e:
-            logger.error(f"⚠️ Could not register task {tid}: {e}")
-    conn.close()
+def register_task(sched, tid, task_type, rule, enqueue: bool = False):
+    """
+    Add (or replace) the job of one task. With ``enqueue`` the job only writes
+    the due task into the job_queue table for worker processes instead of running it here.
+    """
+    trigger_type, kwargs = parse_rrule_to_kwargs(rule)
+    # Cron triggers fire at wall-clock times (respects timezone set on scheduler);
+    # both kinds get per-type jitter and a spread offset to avoid thundering herds
+    trigger = build_trigger(trigger_type, kwargs, task_type, tid)
+    if enqueue:
+        # Enqueueing is cheap, so it stays on the fast pool. One-shots are keyed by
+        # RUN_AT so a restart before a worker finishes them can't queue them twice.
+        run_at = kwargs["run_date"].isoformat() if trigger_type == "date" else None
+        func, args, pool = enqueue_task, [tid, run_at], "fast"
+    else:
+        func, args, pool = run_task_from_db, [tid, trigger_type == "date"], executor_for(task_type)
+    track_job(f"task-{tid}", task_type)
+    sched.add_job(func, trigger=trigger, args=args, kwargs=dict(FIRE_TIME), id=f"task-{tid}",
+                  executor=pool, replace_existing=True, **JOB_DEFAULTS)
+    print(f"🕒 Registered task {tid} ({trigger_type}: {kwargs}, trigger: {trigger})")
+
+
+def task_sync_for(sched, enqueue: bool = False) -> TaskSync:
+    """TaskSync that keeps the service scheduler's "task-<id>" jobs in step with the task table."""
+    return TaskSync(sched, lambda tid, task_type, _params, rule: register_task(sched, tid, task_type, rule, enqueue),
+                    "task-")
+
 
+def add_maintenance_jobs(sched, purge_hours: float = 6):
+    """Housekeeping jobs; like task jobs they only fire in the scheduler leader."""
+    sched.add_job(purge_history, "interval", hours=purge_hours, id="purge-history", replace_existing=True,
+                  next_run_time=datetime.now(IST))
 
-def start():
-    sched = BackgroundScheduler(timezone=IST)
-    register_all_tasks(sched)
-    sched.start()
+
+def start(enqueue: bool = False):
+    """
+    Run the scheduler until Ctrl+C. With ``enqueue`` it is a pure scheduler that
+    hands due tasks to worker processes (see src.job_queue.run_worker).
+    """
+    sched = BackgroundScheduler(timezone=IST, job_defaults=JOB_DEFAULTS, executors=build_executors())
+    attach_pool_metrics(sched)
+    if METRICS_PORT:
+        metrics.start_metrics_server(METRICS_PORT, METRICS_HOST)
+    # The first sync registers every live task; the leader re-runs it on each
+    # lease renewal so tasks other processes create or cancel are picked up
+    sync = task_sync_for(sched, enqueue)
+    sync()
+    add_maintenance_jobs(sched)
+    # Start paused: jobs only fire once this process holds the scheduler lease
+    sched.start(paused=True)
+    leader = SchedulerLeader(sched, sync=sync).start()
 
     # print detailed job list for quick verification
     jobs = sched.get_jobs()
@@ -130,9 +632,9 @@ def start():
     print("✅ Scheduler started. Press Ctrl+C to exit.")
 
     try:
-        import time
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
+        leader.stop()
         sched.shutdown()
         print("🛑 Scheduler stopped.")
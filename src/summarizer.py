@@ -0,0 +1,241 @@
+# src/summarizer.py
+"""
+Map-reduce email summarization.
+
+A batch that fits in one EMAIL_CHUNK_TOKENS prompt is summarized in a single
+call, as before. Larger batches are packed into token-budgeted chunks that
+the model summarizes concurrently, one line per message (map); the lines are
+then combined into one digest (reduce), condensing them in rounds first if
+they still don't fit. Per-message lines are kept in the email_summary_cache
+table (keyed by model + message text), so a repeated digest only sends mail
+it hasn't seen through the map step. A chunk whose model call fails is
+logged and left out of the digest instead of failing it, and the digest ends
+with a line saying how many emails could not be summarized; only a digest
+with nothing left to summarize raises.
+
+The map step runs on the "email_map" model tier and escalates a chunk to the
+large tier when its answer can't be split per message; the digest itself
+runs on the "email_digest" tier (see ollama_client.route).
+"""
+import asyncio
+import hashlib
+import json
+import time
+
+from src import ollama_client
+from src.db import get_conn
+from src.config import EMAIL_CHUNK_TOKENS, EMAIL_SUMMARY_CACHE_TTL_SECONDS
+
+DIGEST_PROMPT = (
+    "Summarize these emails briefly into key highlights — avoid exact details, "
+    "focus on what topics they cover and any important actions.\n\n"
+)
+MAP_PROMPT = (
+    "For each numbered email below, write a one-line summary of its topic and any action it asks for. "
+    "Answer as JSON {\"summaries\": [...]} with exactly one string per email, in order.\n\n"
+)
+CONDENSE_PROMPT = "Condense these email summaries into a few lines, keeping every action item.\n\n"
+MAP_SCHEMA = {
+    "type": "object",
+    "properties": {"summaries": {"type": "array", "items": {"type": "string"}}},
+    "required": ["summaries"],
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token); good enough to stay under the context window."""
+    return len(text) // 4 + 1
+
+
+def chunk(texts, budget: int):
+    """
+    Pack ``texts`` in order into groups whose estimated tokens fit ``budget``.
+    Returns lists of indices; a text larger than the budget gets a group of its own.
+    """
+    groups, current, used = [], [], 0
+    for i, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if current and used + cost > budget:
+            groups.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += cost
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _fit(text: str, budget: int) -> str:
+    return text if estimate_tokens(text) <= budget else text[: budget * 4]
+
+
+# -------------------- per-message cache --------------------
+def message_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def _ensure_table(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS email_summary_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """
+    )
+
+
+def cached_summaries(keys):
+    """{key: summary} for the keys that have a fresh cached line."""
+    if not keys:
+        return {}
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        _ensure_table(cur)
+        cur.execute(
+            f"SELECT key, summary FROM email_summary_cache "
+            f"WHERE key IN ({','.join('?' * len(keys))}) AND created_at > ?",
+            (*keys, time.time() - EMAIL_SUMMARY_CACHE_TTL_SECONDS),
+        )
+        found = dict(cur.fetchall())
+        conn.close()
+        return found
+    except Exception as e:
+        print(f"⚠️ Email summary cache read failed: {e}")
+        return {}
+
+
+def store_summaries(model: str, summaries: dict):
+    """Save {key: summary} lines and drop expired ones."""
+    if not summaries:
+        return
+    now = time.time()
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        _ensure_table(cur)
+        cur.executemany(
+            "INSERT OR REPLACE INTO email_summary_cache (key, model, summary, created_at) VALUES (?, ?, ?, ?)",
+            [(key, model, line, now) for key, line in summaries.items()],
+        )
+        cur.execute("DELETE FROM email_summary_cache WHERE created_at <= ?", (now - EMAIL_SUMMARY_CACHE_TTL_SECONDS,))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"⚠️ Email summary cache write failed: {e}")
+
+
+# -------------------- map / reduce --------------------
+def _split_lines(raw, count: int):
+    try:
+        lines = json.loads(raw)["summaries"]
+    except (ValueError, TypeError, KeyError):
+        return None
+    if not isinstance(lines, list) or len(lines) != count:
+        return None
+    return [" ".join(str(line).split()) for line in lines]
+
+
+async def _map_chunk(texts, tier: str, model: str):
+    """One-line summaries for ``texts`` (same order), or (None, raw) if no tier's answer could be split per message."""
+    body = "\n\n".join(f"[{i}] {text}" for i, text in enumerate(texts, 1))
+    while True:
+        raw = await ollama_client.agenerate(MAP_PROMPT + body, model=model, priority=ollama_client.BACKGROUND,
+                                            format=MAP_SCHEMA)
+        lines = _split_lines(raw, len(texts))
+        if lines is not None:
+            return lines, raw
+        bigger = ollama_client.escalation("email_map", tier)
+        if bigger is None:
+            return None, raw
+        tier, model = bigger
+
+
+async def _reduce(lines, model: str, budget: int):
+    prompt_budget = budget - estimate_tokens(DIGEST_PROMPT)
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > prompt_budget:
+        groups = chunk(lines, budget - estimate_tokens(CONDENSE_PROMPT))
+        if len(groups) >= len(lines):
+            break  # every line fills a chunk by itself; condensing can't shrink it further
+        condensed = await asyncio.gather(*(
+            ollama_client.agenerate(CONDENSE_PROMPT + "\n".join(lines[i] for i in group), model=model,
+                                    priority=ollama_client.BACKGROUND)
+            for group in groups
+        ), return_exceptions=True)
+        kept = []
+        for group, c in zip(groups, condensed):
+            if isinstance(c, Exception):
+                print(f"⚠️ Condensing {len(group)} email summaries failed: {c}")
+                kept.extend(lines[i] for i in group)  # keep them uncondensed
+            elif c and c.strip():
+                kept.append(c.strip())
+        if len(kept) >= len(lines):
+            failed = [c for c in condensed if isinstance(c, Exception)]
+            if failed:
+                raise failed[0]
+            break
+        lines = kept
+    text = _fit("\n".join(f"- {line}" for line in lines), prompt_budget)
+    return await ollama_client.agenerate(DIGEST_PROMPT + text, model=model, priority=ollama_client.BACKGROUND)
+
+
+async def _map_reduce(emails, budget: int):
+    tier, model = ollama_client.route("email_map")
+    keys = [message_key(model, e) for e in emails]
+    known = cached_summaries(keys)
+    todo = [i for i, key in enumerate(keys) if key not in known]
+    item_budget = budget - estimate_tokens(MAP_PROMPT)
+    texts = [_fit(emails[i], item_budget) for i in todo]
+    groups = chunk(texts, item_budget)
+
+    # return_exceptions: a failed chunk must neither cancel its siblings nor lose their lines
+    results = await asyncio.gather(*(_map_chunk([texts[j] for j in group], tier, model) for group in groups),
+                                   return_exceptions=True)
+    fresh, unattributed, failed = {}, [], []
+    missing = 0
+    for group, result in zip(groups, results):
+        if isinstance(result, Exception):
+            print(f"⚠️ Email map chunk of {len(group)} failed; leaving it out of the digest: {result}")
+            failed.append(result)
+            missing += len(group)
+            continue
+        lines, raw = result
+        if lines is None:
+            unattributed.append(" ".join((raw or "").split()))
+            continue
+        # Keyed by the tier's model even when escalated, so the next digest finds them
+        for j, line in zip(group, lines):
+            fresh[keys[todo[j]]] = line
+    store_summaries(model, fresh)
+    print(f"🧩 Email digest: {len(emails)} emails, {len(emails) - len(todo)} from cache, "
+          f"{len(groups)} map calls ({len(failed)} failed)")
+
+    lines = [known.get(key) or fresh.get(key) for key in keys]
+    lines = [line for line in lines if line] + [u for u in unattributed if u]
+    if not lines and failed:
+        raise failed[0]
+    digest = await _reduce(lines, ollama_client.route("email_digest")[1], budget)
+    if missing:
+        digest = f"{digest.rstrip()}\n\n⚠️ {missing} email{'s' if missing != 1 else ''} could not be summarized."
+    return digest
+
+
+async def _run(emails, budget: int):
+    try:
+        return await _map_reduce(emails, budget)
+    finally:
+        await ollama_client.close_async_session()
+
+
+def summarize_emails(emails, budget: int = EMAIL_CHUNK_TOKENS) -> str:
+    """Digest of ``emails`` (one text per message). Raises on model errors."""
+    if not emails:
+        return "No recent emails found."
+    prompt = DIGEST_PROMPT + "\n\n".join(emails)
+    if estimate_tokens(prompt) <= budget:
+        return ollama_client.generate(prompt, model=ollama_client.route("email_digest")[1],
+                                      priority=ollama_client.BACKGROUND)
+    return asyncio.run(_run(list(emails), budget))
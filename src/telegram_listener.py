@@ -2,15 +2,14 @@ import os
 import time
 import json
 import re
-import threading
 import datetime
 import requests
 import pytz
+import threading
 from dotenv import load_dotenv
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
-from src.tools.pdf_export import generate_notes_pdf
 from apscheduler.triggers.cron import CronTrigger
 
 # --- Load environment ---
@@ -20,6 +19,7 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), "../.env"))
 from src.db import (
     get_conn,
     create_task,
+    update_task_plan,
     init_db,
     create_note,
     list_notes,
@@ -29,14 +29,40 @@ from src.db import (
 )
 from src.tools.messaging import send_message
 from src.tools import orders
-from src.planner import call_ollama, extract_json_from_text
+from src.planner import correct_guessed_task, late_plan, plan_within, reminder_prompt
+from src import nl_rules
+from src import ollama_client
+from src.config import OLLAMA_WARMUP
 from src.tools import gmail_oauth
+from src.orchestrator import fire_key, run_recorded, run_one_shot, run_task_from_db, task_is_runnable
+from src import metrics
+from src import broadcast
+from src.plans import compile_plan, forget
+from src.resilience import breaker_states
+from src.config import BROADCAST_LEASE_SECONDS, METRICS_PORT, METRICS_HOST
+from src.scheduler import (
+    FIRE_TIME,
+    JOB_DEFAULTS,
+    POOL_METRICS,
+    SchedulerLeader,
+    TaskSync,
+    add_maintenance_jobs,
+    apply_spread,
+    attach_pool_metrics,
+    build_executors,
+    executor_for,
+    interval_start,
+    jitter_for,
+    parse_run_at,
+    track_job,
+)
 
-# --- Init DB and Scheduler ---
-init_db()
+# --- Scheduler ---
+# Built here, started by start_services(): the "cpu" pool's forkserver imports
+# this script again, and that import must not start a second bot
 TZ = pytz.timezone("Asia/Kolkata")
-scheduler = BackgroundScheduler(timezone=TZ)
-scheduler.start()
+scheduler = BackgroundScheduler(timezone=TZ, job_defaults=JOB_DEFAULTS, executors=build_executors())
+attach_pool_metrics(scheduler)
 
 # --- Environment and Telegram setup ---
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -84,6 +110,12 @@ def save_offset(offset):
         pass
 
 
+def is_admin(chat_id) -> bool:
+    """Admin commands belong to TELEGRAM_CHAT_ID; with it unset, nobody is admin."""
+    admin_id = os.getenv("TELEGRAM_CHAT_ID")
+    return bool(admin_id) and str(chat_id) == str(admin_id)
+
+
 def register_user(chat_id, name, username):
     """Auto-register/update a user."""
     conn = get_conn()
@@ -101,9 +133,12 @@ def register_user(chat_id, name, username):
     )
     conn.commit()
     now = datetime.datetime.now(TZ).isoformat()
+    # Upsert in place: REPLACE would give the chat a new id, and task.user_id points at it
     cur.execute("""
-        INSERT OR REPLACE INTO user_registry (chat_id, name, username, last_seen)
+        INSERT INTO user_registry (chat_id, name, username, last_seen)
         VALUES (?, ?, ?, ?)
+        ON CONFLICT(chat_id) DO UPDATE SET name=excluded.name, username=excluded.username,
+            last_seen=excluded.last_seen
     """,
         (str(chat_id), name, username, now),
     )
@@ -114,7 +149,10 @@ def register_user(chat_id, name, username):
 # ---------------------------------------------------
 # RRULE Parsing + Scheduling
 # ---------------------------------------------------
-def parse_rrule_to_interval_kwargs(rrule_str: str):
+WEEKDAY_NAMES = {"MO": "mon", "TU": "tue", "WE": "wed", "TH": "thu", "FR": "fri", "SA": "sat", "SU": "sun"}
+
+
+def parse_rrule_to_interval_kwargs(rrule_str: str, jitter=None):
     """Parses iCalendar RRULE strings and returns Interval or Cron triggers."""
     if not rrule_str or not rrule_str.startswith("RRULE:"):
         return None
@@ -136,8 +174,9 @@ def parse_rrule_to_interval_kwargs(rrule_str: str):
         if byhour or byminute or byday:
             hour = int(byhour) if byhour else 9
             minute = int(byminute) if byminute else 0
-            day_of_week = byday if byday else "*"
-            cron = CronTrigger(day_of_week=day_of_week, hour=hour, minute=minute, timezone=TZ)
+            # APScheduler wants mon,tue,... where RRULE says MO,TU,...
+            day_of_week = ",".join(WEEKDAY_NAMES.get(d.strip(), d.strip().lower()) for d in byday.split(",")) if byday else "*"
+            cron = CronTrigger(day_of_week=day_of_week, hour=hour, minute=minute, timezone=TZ, jitter=jitter)
             print(f"🗓️ CronTrigger parsed: {day_of_week} at {hour}:{minute}")
             return cron
 
@@ -159,40 +198,60 @@ def parse_rrule_to_interval_kwargs(rrule_str: str):
 def schedule_job_for_task(task_id: int, params: dict, schedule_rule: str):
     """Schedules a job with APScheduler and MCP execution."""
     job_id = f"reminder-{task_id}"
+    task_type = params.get("plan", "reminder")
+    jitter = jitter_for(task_type)
+    pool = executor_for(task_type)
+    track_job(job_id, task_type)
     existing = scheduler.get_job(job_id)
     if existing:
         scheduler.remove_job(job_id)
 
-    def _run_plan(p=params):
-        from src.mcp import run_call
+    # Compiled once here; every fire reuses the resolved tools and frozen args
+    compiled = compile_plan(params)
+
+    def _run_plan(p=compiled, fired_at=None):
+        if not task_is_runnable(task_id):
+            return
+        started = time.perf_counter()
         try:
-            for call in p.get("calls", []):
-                print(f"⚙️ Scheduler dispatching via MCP: {call}")
-                run_call(call)
+            print(f"⚙️ Scheduler dispatching via MCP: {[c.tool for c in p.calls]}")
+            # Keyed by the scheduled run time, so only a redelivery of this same fire is skipped
+            run_recorded(task_id, p.calls, run_key=fire_key(task_id, fired_at))
         except Exception as e:
             print(f"⚠️ _run_plan error: {e}")
+        finally:
+            metrics.observe("run_plan_seconds", time.perf_counter() - started, task_type)
+
+    # The process pool can't pickle the closure, so it gets the module-level runner
+    job = {"func": run_task_from_db, "args": [task_id]} if pool == "cpu" else {"func": _run_plan}
+    job.update(executor=pool, kwargs=dict(FIRE_TIME))
 
     print(f"🧩 Scheduling rule parsing: {schedule_rule}")
     try:
-        # One-time rule
+        # One-time rule: fire at RUN_AT (right away if overdue), then mark completed
         if "FREQ=ONCE" in schedule_rule:
-            run_dt = datetime.datetime.now(TZ) + datetime.timedelta(seconds=60)
-            scheduler.add_job(_run_plan, trigger=DateTrigger(run_date=run_dt), id=job_id, replace_existing=True)
+            now = datetime.datetime.now(TZ)
+            run_dt = parse_run_at(schedule_rule, TZ) or now + datetime.timedelta(seconds=60)
+            job.update(func=run_one_shot, args=[task_id, params if pool == "cpu" else compiled], kwargs={})
+            scheduler.add_job(trigger=DateTrigger(run_date=max(run_dt, now)), id=job_id, replace_existing=True, **job)
+            print(f"✅ One-shot job scheduled for {max(run_dt, now).isoformat()}")
             return True
 
-        kw = parse_rrule_to_interval_kwargs(schedule_rule)
+        kw = parse_rrule_to_interval_kwargs(schedule_rule, jitter=jitter)
         if isinstance(kw, CronTrigger):
-            scheduler.add_job(_run_plan, trigger=kw, id=job_id, replace_existing=True)
-            print(f"✅ Job scheduled (CronTrigger)")
+            trig = apply_spread(kw, task_type, task_id)
+            scheduler.add_job(trigger=trig, id=job_id, replace_existing=True, **job)
+            print(f"✅ Job scheduled (CronTrigger: {trig})")
             return True
         elif kw:
-            trig = IntervalTrigger(timezone=TZ, **kw)
-            scheduler.add_job(_run_plan, trigger=trig, id=job_id, replace_existing=True)
-            print(f"✅ Job scheduled (IntervalTrigger)")
+            trig = apply_spread(IntervalTrigger(timezone=TZ, jitter=jitter, start_date=interval_start(task_id, kw),
+                                                **kw), task_type, task_id)
+            scheduler.add_job(trigger=trig, id=job_id, replace_existing=True, **job)
+            print(f"✅ Job scheduled (IntervalTrigger: {trig})")
             return True
         else:
             run_dt = datetime.datetime.now(TZ) + datetime.timedelta(seconds=60)
-            scheduler.add_job(_run_plan, trigger=DateTrigger(run_date=run_dt), id=job_id, replace_existing=True)
+            scheduler.add_job(trigger=DateTrigger(run_date=run_dt), id=job_id, replace_existing=True, **job)
             print(f"⚙️ Fallback job scheduled in 60s")
             return True
     except Exception as e:
@@ -200,8 +259,8 @@ def schedule_job_for_task(task_id: int, params: dict, schedule_rule: str):
         return False
 
 
-def persist_task_and_schedule(user_chat_id: str, plan_obj: dict):
-    """Save the task to DB and schedule."""
+def task_params_for(user_chat_id: str, plan_obj: dict):
+    """The stored params (plan + MCP calls) for a planner-shaped plan."""
     internal = {
         "plan": plan_obj.get("task_type", "reminder"),
         "calls": [{
@@ -210,7 +269,10 @@ def persist_task_and_schedule(user_chat_id: str, plan_obj: dict):
         }]
     }
 
-    if plan_obj.get("task_type") == "order":
+    if plan_obj.get("task_type") == "notes_export":
+        internal["calls"][0] = {"tool": "notes.export_pdf", "args": {"chat_id": str(user_chat_id)}}
+
+    elif plan_obj.get("task_type") == "order":
         internal["calls"][0]["args"] = {
             "buyer_chat_id": str(user_chat_id),
             "store_identifier": plan_obj.get("extra", {}).get("store") or plan_obj.get("store") or plan_obj.get("store_name") or "",
@@ -222,13 +284,24 @@ def persist_task_and_schedule(user_chat_id: str, plan_obj: dict):
             "chat_id": str(user_chat_id),
             "text": plan_obj.get("text", "Reminder"),
         }
+    return internal
 
+
+def user_id_for(user_chat_id, default=1):
+    """task.user_id for a chat (its user_registry id; ``default`` if the chat never registered)."""
     conn = get_conn()
     cur = conn.cursor()
     cur.execute("SELECT id FROM user_registry WHERE chat_id=?", (str(user_chat_id),))
     r = cur.fetchone()
-    user_id = r[0] if r else 1
     conn.close()
+    return r[0] if r else default
+
+
+def persist_task_and_schedule(user_chat_id: str, plan_obj: dict, confirm: bool = True):
+    """Save the task to DB and schedule (``confirm`` tells the user the task id)."""
+    internal = task_params_for(user_chat_id, plan_obj)
+
+    user_id = user_id_for(user_chat_id)
 
     try:
         tid = create_task(user_id, plan_obj.get("task_type", "reminder"), internal,
@@ -248,48 +321,207 @@ def persist_task_and_schedule(user_chat_id: str, plan_obj: dict):
     rule = normalize_rrule(plan_obj.get("schedule_rule", ""))
     scheduled = schedule_job_for_task(tid, internal, rule)
     if scheduled:
+        task_sync.remember(tid)
+    if scheduled and confirm:
         send_message(user_chat_id, f"✅ Reminder scheduled and active (task id={tid}).")
     return tid if scheduled else None
+
+
+def replace_task_plan(user_chat_id: str, task_id: int, plan_obj: dict) -> bool:
+    """Swap an existing task's plan and schedule (same task id) and reschedule its job."""
+    internal = task_params_for(user_chat_id, plan_obj)
+    rule = normalize_rrule(plan_obj.get("schedule_rule", ""))
+    if not update_task_plan(task_id, plan_obj.get("task_type", "reminder"), internal, rule):
+        return False
+    forget(task_id)
+    if not schedule_job_for_task(task_id, internal, rule):
+        return False
+    task_sync.remember(task_id)
+    return True
+
+
+def apply_late_plan(user_chat_id: str, task_id: int, guessed: dict, future):
+    """Done-callback for a late /remind plan: planner.correct_guessed_task, rescheduling here."""
+    plan = correct_guessed_task(task_id, guessed, late_plan(future),
+                                replace=lambda tid, p: replace_task_plan(user_chat_id, tid, p))
+    if plan:
+        send_message(user_chat_id, f"🔁 Updated {plan['task_type'].replace('_', ' ')} {task_id}: the model read "
+                                   f"the schedule as `{plan['schedule_rule']}`.", parse_mode="Markdown")
+
+
+def create_late_task(user_chat_id: str, future):
+    """Done-callback for a late /remind plan when there was no guess to schedule."""
+    typed = late_plan(future)
+    if typed is None:
+        send_message(user_chat_id, "⚠️ I still couldn’t understand the timing. Please rephrase, e.g. "
+                                   "`/remind stretch every 2 hours`", parse_mode="Markdown")
+        return
+    tid = persist_task_and_schedule(user_chat_id, typed.to_dict())
+    if tid:
+        send_message(user_chat_id, f"✅ Created reminder (task id={tid}). I’ll remind you per the schedule.")
+
+
 def schedule_place_order(delay_seconds, buyer_chat_id, store_identifier, item):
     """
     Schedule a one-time order placement after a given delay (in seconds).
-    This runs in a background thread (non-persistent).
-    """
-    def job():
-        try:
-            print(f"🕒 Placing scheduled order for '{item}' from '{store_identifier}' after {delay_seconds}s delay.")
-            orders.place_order(str(buyer_chat_id), store_identifier, item)
-        except Exception as e:
-            print("⚠️ scheduled order failed:", e)
 
+    The order is persisted as a FREQ=ONCE task and queued on the scheduler, whose
+    job store keeps jobs ordered by run time and whose fixed "io" pool places
+    them, so pending orders survive restarts and cost no thread while waiting.
+    Returns the task id (cancel with cancel_scheduled_order), or None on failure.
+    """
     try:
         delay_seconds = max(0, int(delay_seconds))
     except Exception:
         delay_seconds = 0
 
-    t = threading.Timer(delay_seconds, job)
-    t.daemon = True
-    t.start()
-    print(f"✅ Scheduled one-time order for '{item}' in {delay_seconds} seconds.")
-    return t
+    run_at = (datetime.datetime.now(TZ) + datetime.timedelta(seconds=delay_seconds)).isoformat()
+    plan = {
+        "task_type": "order",
+        "schedule_rule": f"RRULE:FREQ=ONCE;RUN_AT={run_at}",
+        "text": f"Order {item} from {store_identifier}",
+        "extra": {"store": store_identifier, "item": item},
+    }
+    tid = persist_task_and_schedule(str(buyer_chat_id), plan)
+    if tid:
+        print(f"✅ Scheduled one-time order {tid} for '{item}' in {delay_seconds} seconds.")
+    return tid
+
+
+def schedule_notes_export(chat_id) -> int:
+    """
+    Queue a notes PDF export as a one-shot "notes_export" task. PDF rendering is
+    CPU-bound, so it runs on the scheduler's "cpu" process pool instead of the
+    polling loop. Returns the task id, or None on failure.
+    """
+    plan = {
+        "task_type": "notes_export",
+        "schedule_rule": f"RRULE:FREQ=ONCE;RUN_AT={datetime.datetime.now(TZ).isoformat()}",
+        "text": "Export notes to PDF",
+    }
+    return persist_task_and_schedule(str(chat_id), plan, confirm=False)
+
+
+def cancel_scheduled_order(order_task_id: int, chat_id) -> bool:
+    """
+    Cancel a pending delayed order by its task id, if ``chat_id`` placed it.
+    Returns True if it was still pending. An unregistered chat owns nothing (the
+    default user id is shared by every such chat), so it can't cancel anything.
+    """
+    owner = user_id_for(chat_id, default=None)
+    if owner is None:
+        return False
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE task SET enabled=0, updated_at=datetime('now') "
+        "WHERE id=? AND user_id=? AND type='order' AND status='active' AND enabled=1",
+        (order_task_id, owner),
+    )
+    cancelled = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+
+    if cancelled:
+        job = scheduler.get_job(f"reminder-{order_task_id}")
+        if job:
+            job.remove()
+    return cancelled
+
+
+def _sync_task_job(tid, task_type, params_json, rule):
+    params = json.loads(params_json) if isinstance(params_json, str) else params_json
+    if not schedule_job_for_task(tid, params, rule or ""):
+        raise ValueError(f"could not schedule rule {rule!r}")
+
+
+# The task table is the source of truth: tasks created or cancelled by another
+# listener process reach this scheduler's jobs through the leader's syncs
+task_sync = TaskSync(scheduler, _sync_task_job, "reminder-")
+# Several listener processes may share the task table: only the lease holder fires jobs
+scheduler_leader = SchedulerLeader(scheduler, sync=task_sync)
 
 
 def restore_saved_reminders_from_db():
     """Restore scheduled reminders from DB on startup."""
     try:
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT id, params_json, schedule_rule FROM task WHERE enabled=1")
-        rows = cur.fetchall()
-        conn.close()
-        for tid, params_json, rule in rows:
-            params = json.loads(params_json) if isinstance(params_json, str) else params_json
-            schedule_job_for_task(tid, params, rule or "")
+        task_sync()
     except Exception as e:
         print("⚠️ Failed to restore reminders:", e)
 
 
-restore_saved_reminders_from_db()
+def start_broadcast_thread(broadcast_id: int, admin_chat_id: str = None, on_exit=None):
+    """
+    Run a broadcast off the polling loop, reporting progress to the admin at most
+    every 30s. ``on_exit(broadcast_id)`` is called when the thread ends.
+    """
+    last_report = [time.monotonic()]
+
+    def _progress(b):
+        if admin_chat_id and time.monotonic() - last_report[0] >= 30:
+            last_report[0] = time.monotonic()
+            send_message(admin_chat_id, f"📣 Broadcast {b['id']}: {b['delivered']} delivered, "
+                                        f"{b['failed']} failed of {b['total']}")
+
+    def _run():
+        try:
+            b = broadcast.run_broadcast(broadcast_id, progress=_progress)
+            if admin_chat_id and b:
+                send_message(admin_chat_id, f"✅ Broadcast {b['id']} finished: {b['delivered']} delivered, "
+                                            f"{b['failed']} failed of {b['total']}.")
+        except Exception as e:
+            print(f"⚠️ Broadcast {broadcast_id} stopped: {e}")
+            if admin_chat_id:
+                send_message(admin_chat_id, f"⚠️ Broadcast {broadcast_id} stopped: {e}. It resumes automatically.")
+        finally:
+            if on_exit:
+                on_exit(broadcast_id)
+
+    threading.Thread(target=_run, name=f"broadcast-{broadcast_id}", daemon=True).start()
+
+
+_resuming = set()  # broadcast ids this process has a resume thread for
+
+
+def resume_unfinished_broadcasts():
+    """
+    Resume broadcasts a crash or restart interrupted, from their last finished page.
+    Every listener process tries this periodically; the broadcast claim (see
+    src.broadcast) leaves a broadcast alone while another run is still sending it.
+    """
+    try:
+        for bid in broadcast.unfinished_broadcasts(claimable=True):
+            if bid in _resuming:
+                continue
+            b = broadcast.get_broadcast(bid)
+            _resuming.add(bid)
+            print(f"📣 Resuming broadcast {bid}")
+            start_broadcast_thread(bid, b and b["created_by"], on_exit=_resuming.discard)
+    except Exception as e:
+        print("⚠️ Failed to resume broadcasts:", e)
+
+
+def _resume_broadcasts_loop():
+    # A claim left by a dead process only expires after BROADCAST_LEASE_SECONDS, so keep retrying
+    while True:
+        resume_unfinished_broadcasts()
+        time.sleep(BROADCAST_LEASE_SECONDS)
+
+
+def start_services():
+    """Init the DB, restore and start the scheduler, and start the listener's background threads."""
+    init_db()
+    scheduler.start(paused=True)
+    if METRICS_PORT:
+        metrics.start_metrics_server(METRICS_PORT, METRICS_HOST)
+    restore_saved_reminders_from_db()
+    add_maintenance_jobs(scheduler)
+    scheduler_leader.start()  # jobs only fire once this process holds the scheduler lease
+    threading.Thread(target=_resume_broadcasts_loop, name="broadcast-resume", daemon=True).start()
+    if OLLAMA_WARMUP:
+        # Load the model now so the first /remind doesn't pay for it
+        threading.Thread(target=ollama_client.warm_up, name="ollama-warmup", daemon=True).start()
+
 
 def process_message(msg):
     try:
@@ -427,20 +659,10 @@ def process_message(msg):
                     send_message(chat_id, "📭 You have no notes to export.")
                     return
 
-                pdf_path = f"notes_{chat_id}.pdf"
-                generate_notes_pdf(notes, pdf_path)
-
-                # Send the PDF file
-                files = {
-                    "document": open(pdf_path, "rb")
-                }
-                data = {
-                    "chat_id": chat_id,
-                    "caption": "📄 Here is your exported notes PDF."
-                }
-
-                requests.post(f"{TG_BASE}/sendDocument", data=data, files=files)
-                send_message(chat_id, "✅ Notes exported successfully!")
+                if not schedule_notes_export(chat_id):
+                    send_message(chat_id, "⚠️ Failed to export notes: could not queue the export.")
+                    return
+                send_message(chat_id, "🖨️ Exporting your notes — the PDF will arrive in a moment.")
 
             except Exception as e:
                 send_message(chat_id, f"⚠️ Failed to export notes: {e}")
@@ -461,7 +683,7 @@ def process_message(msg):
                 cur = conn.cursor()
                 # Same approach as /list_reminders (no per-user filter yet)
                 cur.execute(
-                    "SELECT id, params_json, schedule_rule, enabled "
+                    "SELECT id, type, text, schedule_rule "
                     "FROM task WHERE enabled=1"
                 )
                 task_rows = cur.fetchall()
@@ -473,14 +695,8 @@ def process_message(msg):
             # Format reminders / tasks
             task_lines = []
             if task_rows:
-                for tid, params_json, rule, enabled in task_rows:
-                    try:
-                        params = json.loads(params_json)
-                        msg_text = params["calls"][0]["args"].get("text", "")
-                        plan = params.get("plan", "")
-                    except Exception:
-                        msg_text = "(unreadable)"
-                        plan = "unknown"
+                for tid, plan, msg_text, rule in task_rows:
+                    plan, msg_text = plan or "unknown", msg_text or ""
                     task_lines.append(f"• [{tid}] ({plan}) {msg_text}  ⏱ {rule}")
             else:
                 task_lines.append("• No active reminders or scheduled tasks.")
@@ -533,6 +749,7 @@ def process_message(msg):
                 "🛒 *Orders*\n"
                 "• `/remind order milk from Capital Store` — place an immediate order\n"
                 "• `/remind order milk in 2 hours from Capital Store` — one-time delayed order\n"
+                "• `/cancel_order <id>` — cancel a pending delayed order\n"
                 "• `/remind order milk every 2 days from Capital Store` — recurring order\n"
                 "• Chat continues until `/endchat`\n\n"
                 "📝 *Notes*\n"
@@ -602,13 +819,20 @@ def process_message(msg):
 
             # 4️⃣ Scheduler check
             try:
-                if scheduler.running:
+                if scheduler.running and not scheduler_leader.is_leader:
+                    results["Scheduler"] = f"⏸️ Standby (leader elsewhere, this is {scheduler_leader.holder})"
+                elif scheduler.running:
                     results["Scheduler"] = "✅ Active"
                 else:
                     results["Scheduler"] = "⚠️ Not running"
             except Exception:
                 results["Scheduler"] = "❌ Unknown state"
 
+            # Circuit breakers (only dependencies used since startup are listed)
+            for dep, state in breaker_states().items():
+                icon = {"closed": "✅", "half-open": "🟡"}.get(state, "🔌")
+                results[f"Circuit {dep}"] = f"{icon} {state}"
+
             # 5️⃣ Database connectivity
             try:
                 conn = get_conn()
@@ -668,11 +892,16 @@ def process_message(msg):
                 jobs = scheduler.get_jobs()
                 job_count = len(jobs)
 
+                pool_lines = "".join(
+                    f"   • {name}: {st['in_flight']}/{st['size']} busy, {st['queued']} queued (peak {st['peak']})\n"
+                    for name, st in POOL_METRICS.snapshot().items()
+                )
                 status_msg = (
                     f"🧾 *System Status:*\n\n"
                     f"👥 Total Users: {total_users}\n"
                     f"🕒 Active Tasks: {active_tasks}\n"
                     f"🗓️ Scheduled Jobs: {job_count}\n"
+                    f"⚙️ Executor Pools:\n{pool_lines}"
                     f"🕰️ Server Time: {datetime.datetime.now(TZ).strftime('%Y-%m-%d %H:%M:%S')}\n"
                 )
                 send_message(chat_id, status_msg, parse_mode="Markdown")
@@ -684,8 +913,9 @@ def process_message(msg):
             try:
                 conn = get_conn()
                 cur = conn.cursor()
+                # tool/text are denormalized columns, so listing never decodes params_json
                 cur.execute(
-                    "SELECT id, params_json, schedule_rule, enabled "
+                    "SELECT id, type, text, schedule_rule "
                     "FROM task WHERE enabled=1"
                 )
                 rows = cur.fetchall()
@@ -696,14 +926,8 @@ def process_message(msg):
                     return
 
                 lines = []
-                for tid, params_json, rule, enabled in rows:
-                    try:
-                        params = json.loads(params_json)
-                        msg_text = params["calls"][0]["args"].get("text", "")
-                        plan = params.get("plan", "")
-                    except Exception:
-                        msg_text = "(unreadable)"
-                        plan = "unknown"
+                for tid, plan, msg_text, rule in rows:
+                    plan, msg_text = plan or "unknown", msg_text or ""
                     lines.append(
                         f"🆔 *{tid}* → ({plan}) {msg_text}\n   ⏱ {rule}"
                     )
@@ -718,6 +942,26 @@ def process_message(msg):
                 send_message(chat_id, f"⚠️ Failed to list reminders: {e}")
             return
 
+        # ❌ --- cancel a pending delayed order ---
+        if text_lower.startswith("/cancel_order"):
+            parts = text.split()
+            if len(parts) < 2 or not parts[1].isdigit():
+                send_message(chat_id, "Usage: /cancel_order <order_task_id>")
+                return
+            oid = int(parts[1])
+            if user_id_for(chat_id, default=None) is None:
+                send_message(chat_id, "⚠️ This chat isn’t registered, so I can’t tell which orders are yours. "
+                                      "Send /start and try again.")
+                return
+            try:
+                if cancel_scheduled_order(oid, chat_id):
+                    send_message(chat_id, f"✅ Scheduled order *{oid}* cancelled.", parse_mode="Markdown")
+                else:
+                    send_message(chat_id, f"⚠️ No pending scheduled order {oid}.")
+            except Exception as e:
+                send_message(chat_id, f"⚠️ Could not cancel order {oid}: {e}")
+            return
+
         # ❌ --- delete reminder ---
         if text_lower.startswith("/delete_reminder"):
             parts = text.split()
@@ -811,6 +1055,7 @@ def process_message(msg):
                 "🛒 *Orders*\n"
                 "• `/remind order milk from Capital Store` — immediate order\n"
                 "• `/remind order milk in 2 hours from Capital Store` — one-time delayed order\n"
+                "• `/cancel_order <id>` — cancel a pending delayed order\n"
                 "• `/remind order milk every 2 days from Capital Store` — recurring order\n"
                 "• Use `/endchat` to finish a buyer<->store chat\n\n"
                 "📝 *Notes*\n"
@@ -831,6 +1076,85 @@ def process_message(msg):
             send_message(chat_id, manual_text, parse_mode="Markdown")
             return
 
+        # --- /broadcast (admin): send a message to every registered chat ---
+        if text_lower.startswith("/broadcast_status"):
+            if not is_admin(chat_id):
+                send_message(chat_id, "⚠️ /broadcast_status is only available to the bot admin.")
+                return
+            parts = text.split()
+            bid = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+            if bid is None:
+                pending = broadcast.unfinished_broadcasts()
+                bid = pending[-1] if pending else None
+            b = broadcast.get_broadcast(bid) if bid else None
+            if not b:
+                send_message(chat_id, "ℹ️ Usage: /broadcast_status <id> (no running broadcast found)")
+                return
+            send_message(chat_id, f"📣 Broadcast {b['id']} ({b['status']}): {b['delivered']} delivered, "
+                                  f"{b['failed']} failed of {b['total']}")
+            return
+
+        if text_lower.startswith("/broadcast"):
+            if not is_admin(chat_id):
+                send_message(chat_id, "⚠️ /broadcast is only available to the bot admin.")
+                return
+            body = text[len("/broadcast"):].strip()
+            if not body:
+                send_message(chat_id, "Usage: /broadcast <message>")
+                return
+            bid = broadcast.create_broadcast(body, created_by=str(chat_id))
+            b = broadcast.get_broadcast(bid)
+            send_message(chat_id, f"📣 Broadcast {bid} started to {b['total']} chats. "
+                                  f"Check progress with /broadcast_status {bid}.")
+            start_broadcast_thread(bid, str(chat_id))
+            return
+
+        # --- /metrics (admin): scheduler lag + duration histograms ---
+        if text_lower.startswith("/metrics"):
+            if not is_admin(chat_id):
+                send_message(chat_id, "⚠️ /metrics is only available to the bot admin.")
+                return
+            snap = metrics.snapshot()
+            if not snap:
+                send_message(chat_id, "ℹ️ No jobs have run yet.")
+                return
+            # Labels (email_summary, parse_command, ...) go in backticks: a bare "_" breaks Markdown
+            lines = ["📈 *Scheduler Metrics* (seconds)"]
+            for name, by_type in snap.items():
+                lines.append(f"\n`{name}`")
+                for task_type, st in by_type.items():
+                    lines.append(
+                        f"• `{task_type}`: n={st['count']} avg={st['avg']} "
+                        f"p50≤{st['p50']} p95≤{st['p95']} max={st['max']}"
+                    )
+            from src.mcp import RESULT_CACHE
+            cs = RESULT_CACHE.stats()
+            lines.append(
+                f"\n🗃 *Tool cache:* {cs['entries']} entries, hits={cs['hits']} "
+                f"misses={cs['misses']} shared={cs['shared']} hit rate={cs['hit_rate']}"
+            )
+            from src.llm_cache import all_stats
+            for model, ls in all_stats().items():
+                lines.append(
+                    f"🧠 *LLM plan cache* (`{model}`): memory hits={ls['memory_hits']} "
+                    f"disk hits={ls['disk_hits']} misses={ls['misses']}"
+                )
+            tiers = ", ".join(f"`{tier}`=`{model}`" for tier, model in ollama_client.TIERS.items())
+            escalated = ", ".join(f"`{task}`={n}" for task, n in ollama_client.ESCALATIONS.items()) or "none"
+            lines.append(f"🪜 *Model tiers:* {tiers}; escalations: {escalated}")
+            from src.planner import DEADLINE_STATS
+            lines.append(
+                f"⏱️ *Planner deadline:* in time={DEADLINE_STATS['in_time']} "
+                f"late (answered with a guess)={DEADLINE_STATS['late']}"
+            )
+            for source, ns in nl_rules.stats().items():
+                lines.append(
+                    f"⚡ *Fast path* (`{source}`): hits={ns['hits']} "
+                    f"LLM fallbacks={ns['fallbacks']} hit rate={ns['hit_rate']}"
+                )
+            send_message(chat_id, "\n".join(lines), parse_mode="Markdown")
+            return
+
         # --- /list_jobs command ---
         if text_lower.startswith("/list_jobs"):
             try:
@@ -876,94 +1200,27 @@ def process_message(msg):
                     )
                     return
 
-                # daily schedule: "emailsummary every day at 11am"
-                m_daily = re.search(
-                    r"every\s+day\s+at\s+(\d{1,2})(?::(\d{2}))?\s*(am|pm)?",
-                    text_lower,
-                )
-                if m_daily:
-                    hour = int(m_daily.group(1))
-                    minute = int(m_daily.group(2) or 0)
-                    ampm = m_daily.group(3)
-                    if ampm == "pm" and hour < 12:
-                        hour += 12
-                    elif ampm == "am" and hour == 12:
-                        hour = 0
-                    rrule = (
-                        f"RRULE:FREQ=DAILY;BYHOUR={hour};BYMINUTE={minute}"
-                    )
+                # scheduled digest: "every day at 11am", "weekly on mon at 9am", "on weekdays at 8", ...
+                rest = text[len("/emailsummary"):].strip()
+                match = nl_rules.parse_schedule(rest) if rest else None
+                if rest:
+                    nl_rules.record("emailsummary", bool(match), match.kind if match else None)
+                if match:
+                    when = "once" if match.one_shot else "recurring"
                     plan = {
                         "task_type": "email_summary",
-                        "schedule_rule": rrule,
-                        "text": "Daily Gmail summary",
+                        "schedule_rule": match.rule,
+                        "text": f"Gmail summary ({when})",
                     }
                     tid = persist_task_and_schedule(chat_id, plan)
                     if tid:
                         send_message(
                             chat_id,
-                            f"✅ Scheduled Gmail summary every day at {hour:02d}:{minute:02d}. (task id={tid})",
+                            f"✅ Scheduled Gmail summary: `{match.rule}` (task id={tid})",
+                            parse_mode="Markdown",
                         )
                     else:
-                        send_message(
-                            chat_id,
-                            "⚠️ Failed to schedule daily Gmail summary.",
-                        )
-                    return
-
-                # weekly schedule: "emailsummary every week on monday at 9am"
-                weekday_map = {
-                    "monday": "MO",
-                    "mon": "MO",
-                    "tuesday": "TU",
-                    "tue": "TU",
-                    "wednesday": "WE",
-                    "wed": "WE",
-                    "thursday": "TH",
-                    "thu": "TH",
-                    "friday": "FR",
-                    "fri": "FR",
-                    "saturday": "SA",
-                    "sat": "SA",
-                    "sunday": "SU",
-                    "sun": "SU",
-                }
-                m_weekly = re.search(
-                    r"(?:every|weekly)\s*(?:week)?(?:\s*on)?\s*"
-                    r"(mon|monday|tue|tuesday|wed|wednesday|thu|thursday|fri|friday|sat|saturday|sun|sunday)\b"
-                    r"\s*(?:at\s*(\d{1,2})(?::(\d{2}))?\s*(am|pm)?)?",
-                    text_lower,
-                )
-                if m_weekly:
-                    day_token = m_weekly.group(1).lower()
-                    hour = int(m_weekly.group(2) or 9)
-                    minute = int(m_weekly.group(3) or 0)
-                    ampm = m_weekly.group(4)
-                    if ampm == "pm" and hour < 12:
-                        hour += 12
-                    elif ampm == "am" and hour == 12:
-                        hour = 0
-                    byday = weekday_map.get(day_token, day_token.upper()[:2])
-                    rrule = (
-                        f"RRULE:FREQ=WEEKLY;BYDAY={byday};"
-                        f"BYHOUR={hour};BYMINUTE={minute}"
-                    )
-                    plan = {
-                        "task_type": "email_summary",
-                        "schedule_rule": rrule,
-                        "text": f"Weekly Gmail summary ({byday})",
-                    }
-                    tid = persist_task_and_schedule(chat_id, plan)
-                    if tid:
-                        send_message(
-                            chat_id,
-                            f"✅ Scheduled weekly Gmail summary on "
-                            f"{day_token.title()} at {hour:02d}:{minute:02d}. (task id={tid})",
-                        )
-                    else:
-                        send_message(
-                            chat_id,
-                            "⚠️ Failed to schedule weekly Gmail summary.",
-                        )
+                        send_message(chat_id, "⚠️ Failed to schedule Gmail summary.")
                     return
 
                 # default immediate fetch
@@ -1024,19 +1281,10 @@ def process_message(msg):
 
                     # Convert to seconds for timestamp calculation
                     delay_seconds = num if "second" in unit else num * 60 if "minute" in unit else num * 3600
-                    run_at = (datetime.datetime.now(TZ) + datetime.timedelta(seconds=delay_seconds)).isoformat()
-
-                    # Build plan for MCP + DB
-                    plan = {
-                        "task_type": "order",
-                        "schedule_rule": f"RRULE:FREQ=ONCE;RUN_AT={run_at}",
-                        "text": f"Order {item_part} from {store_part}",
-                        "extra": {"store": store_part, "item": item_part}
-                    }
 
-                    tid = persist_task_and_schedule(chat_id, plan)
+                    tid = schedule_place_order(delay_seconds, chat_id, store_part, item_part)
                     if tid:
-                        send_message(chat_id, f"✅ Scheduled one-time order (task id={tid}) for *{item_part}* from *{store_part}* in {num} {unit}.")
+                        send_message(chat_id, f"✅ Scheduled one-time order (task id={tid}) for *{item_part}* from *{store_part}* in {num} {unit}.\nUse /cancel_order {tid} to cancel it.")
                     else:
                         send_message(chat_id, "⚠️ Failed to schedule order.")
                     return
@@ -1046,32 +1294,13 @@ def process_message(msg):
                 return
 
             # ----- REMINDER branch -----
-            # Try pattern-based parsing first (simple interval reminders)
-            explicit = re.search(r"(?P<action>.+?)\s+every\s+(?P<num>\d+)\s*(?P<unit>second|seconds|minute|minutes|hour|hours|day|days)\b", nl)
-            if explicit:
-                action = explicit.group("action").strip()
-                num = int(explicit.group("num"))
-                unit = explicit.group("unit")
-
-                if "second" in unit:
-                    rrule = f"RRULE:FREQ=SECONDLY;INTERVAL={num}"
-                elif "minute" in unit:
-                    rrule = f"RRULE:FREQ=MINUTELY;INTERVAL={num}"
-                elif "hour" in unit:
-                    rrule = f"RRULE:FREQ=HOURLY;INTERVAL={num}"
-                elif "day" in unit:
-                    rrule = f"RRULE:FREQ=DAILY;INTERVAL={num}"
-                else:
-                    rrule = "RRULE:FREQ=HOURLY;INTERVAL=1"
-
-                plan = {
-                    "task_type": "reminder",
-                    "schedule_rule": rrule,
-                    "text": action.capitalize()
-                }
+            # Rule-based fast path first (see src/nl_rules.py); only unknown phrasings reach Ollama
+            plan = nl_rules.parse_reminder(nl_original, source="remind")
+            if plan:
+                action = plan["text"]
                 tid = persist_task_and_schedule(chat_id, plan)
                 if tid:
-                    send_message(chat_id, f"✅ Created reminder (task id={tid}). I’ll remind you to {action} per the schedule.")
+                    send_message(chat_id, f"✅ Created reminder (task id={tid}). I’ll remind you to {action.lower()} per the schedule.")
                 else:
                     send_message(chat_id, "⚠️ Failed to create reminder.")
                 return
@@ -1079,33 +1308,37 @@ def process_message(msg):
             # If no explicit time pattern → call Ollama
             send_message(chat_id, f"Got it — I'll create a reminder for: \"{nl_original}\". Processing with Ollama...")
 
-            system_prompt = (
-                "You are a JSON-only generator. Convert the user's instruction into a "
-                "single JSON object and output only that JSON object and nothing else. "
-                "The JSON must have exactly these keys: "
-                "\"task_type\" (one of 'reminder'|'bill_link'|'email_summary'), "
-                "\"schedule_rule\" (an iCalendar RRULE string like "
-                "'RRULE:FREQ=DAILY;BYHOUR=9;BYMINUTE=0'), "
-                "\"text\" (the message to send).\n\n"
-                f"Input: {nl_original}\nOutput:"
-            )
+            system_prompt = reminder_prompt(nl_original)
 
-            raw = None
+            plan, late = None, None
             try:
-                raw = call_ollama(system_prompt)
+                # Schema-constrained and validated; waits at most PLANNER_DEADLINE_SECONDS
+                typed, late = plan_within(system_prompt)
+                plan = typed.to_dict() if typed else None
             except Exception as e:
                 print("⚠️ Ollama call failed:", e)
 
-            plan = None
-            if raw:
-                try:
-                    print("🔎 Model raw response preview:")
-                    print(raw[:500])
-                    plan = extract_json_from_text(raw)
-                except Exception as e:
-                    print("⚠️ Failed to parse LLM response:", e)
+            if late is not None:
+                # The model is slow: answer now, let its late plan correct or create the task
+                guess = nl_rules.guess_reminder(nl_original)
+                if guess:
+                    tid = persist_task_and_schedule(chat_id, guess)
+                    if tid:
+                        send_message(chat_id,
+                            f"⏱️ The model is slow right now, so I scheduled my best reading: "
+                            f"`{guess['schedule_rule']}` (task id={tid}). I’ll adjust it if the model reads it differently.",
+                            parse_mode="Markdown")
+                        late.add_done_callback(lambda f: apply_late_plan(chat_id, tid, guess, f))
+                        return
+                send_message(chat_id,
+                    "⏱️ The model is slow right now and I couldn’t place the timing myself. "
+                    "I’ll create the reminder as soon as it answers — or say it more clearly, e.g. "
+                    "`/remind stretch every 2 hours`",
+                    parse_mode="Markdown")
+                late.add_done_callback(lambda f: create_late_task(chat_id, f))
+                return
 
-            if not plan or not isinstance(plan, dict):
+            if not plan:
                 send_message(chat_id,
                     "⚠️ I couldn’t understand the timing. Please say it clearly, e.g.\n"
                     "`/remind drink water every 15 seconds`\n"
@@ -1171,4 +1404,5 @@ def main_loop():
 
 
 if __name__ == "__main__":
+    start_services()
     main_loop()
@@ -0,0 +1,101 @@
+# src/tool_cache.py
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_key(tool: str, args: dict) -> str:
+    """Cache key for a call: tool name plus its args in a canonical JSON form."""
+    return tool + ":" + json.dumps(dict(args or {}), sort_keys=True, separators=(",", ":"), default=str)
+
+
+class _Flight:
+    """One in-progress computation that concurrent identical callers wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResultCache:
+    """
+    Bounded LRU of tool results with a per-entry TTL.
+
+    Concurrent calls for the same key are single-flighted: the first caller runs
+    the tool and the others wait for its result instead of repeating the fetch.
+    Only successful results are cached; a failure is raised to every waiter.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0  # callers served by another caller's in-flight call
+        self.evictions = 0
+
+    def get_or_call(self, key: str, ttl: float, fn):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            if entry:
+                del self._entries[key]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result)
+
+        try:
+            flight.result = fn()
+        except BaseException as e:  # an interrupted call must not be cached as a None result either
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                if flight.error is None:
+                    self._entries[key] = (time.monotonic() + ttl, flight.result)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+            flight.done.set()
+        return copy.deepcopy(flight.result)
+
+    def invalidate(self, tool: str = None):
+        """Drop every entry, or only those of one tool."""
+        with self._lock:
+            if tool is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k.startswith(tool + ":")]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.shared
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.shared) / lookups, 3) if lookups else None,
+            }
@@ -2,14 +2,13 @@ import os
 import json
 import datetime
 import base64
-import requests
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from google.auth.transport.requests import Request
 from dotenv import load_dotenv
 from src.tools.messaging import send_message
-from src.config import OLLAMA_URL, OLLAMA_MODEL
+from src.summarizer import summarize_emails
+from src.tools.gmail_batch import build_service, fetch_inbox
 
 load_dotenv()
 
@@ -36,55 +35,50 @@ def get_gmail_service(chat_id: str):
         with open(token_path, 'w') as token:
             token.write(creds.to_json())
 
-    return build('gmail', 'v1', credentials=creds)
+    return build_service(creds)
 
 
 def fetch_recent_emails(chat_id: str, limit=5):
     """Fetch recent Gmail messages for the user."""
     service = get_gmail_service(chat_id)
-    results = service.users().messages().list(userId='me', maxResults=limit, labelIds=['INBOX']).execute()
-    messages = results.get('messages', [])
     emails = []
 
-    for msg in messages:
-        m = service.users().messages().get(userId='me', id=msg['id'], format='metadata').execute()
-        headers = {h['name']: h['value'] for h in m['payload']['headers']}
-        subject = headers.get('Subject', '(no subject)')
-        sender = headers.get('From', '(unknown)')
-        snippet = m.get('snippet', '')[:150]
-        emails.append(f"📩 *{subject}*\nFrom: {sender}\n→ {snippet}")
+    # One list call plus one batched metadata fetch, instead of a GET per message
+    for e in fetch_inbox(service, max_results=limit, bodies=True):
+        preview = (e['snippet'] or e['body'])[:150]
+        emails.append(f"📩 *{e['subject']}*\nFrom: {e['from']}\n→ {preview}")
 
     return emails
 
 
 def summarize_emails_via_ollama(emails):
-    """Summarize the given emails using Ollama model."""
+    """Summarize the given emails using Ollama model (chunked map-reduce for large batches)."""
     if not emails:
         return "No recent emails found."
 
-    text = "\n\n".join(emails)
-    prompt = (
-        f"Summarize these emails briefly into key highlights — avoid exact details, "
-        f"focus on what topics they cover and any important actions.\n\n{text}"
-    )
-
     try:
-        response = requests.post(
-            f"{OLLAMA_URL}/api/generate",
-            json={"model": OLLAMA_MODEL, "prompt": prompt},
-            timeout=90
-        )
-        data = response.json()
-        return data.get("response", "No summary available.")
+        # Background priority inside: interactive planner calls go ahead of digests
+        return summarize_emails(emails) or "No summary available."
     except Exception as e:
         return f"⚠️ Ollama summarization failed: {e}"
 
 
+def build_email_digest(chat_id: str, max_results: int = 5):
+    """Fetch and summarize recent email without sending it (MCP "email.digest", cacheable)."""
+    emails = fetch_recent_emails(chat_id, limit=max_results)
+    summary = summarize_emails_via_ollama(emails)
+    if summary.startswith("⚠️"):
+        raise RuntimeError(summary)  # don't let the result cache keep a failure
+    return summary
+
+
 def send_daily_email_summary(chat_id: str):
     """Fetch, summarize, and send email summary for that user."""
+    from src.mcp import run_call
+
     try:
-        emails = fetch_recent_emails(chat_id)
-        summary = summarize_emails_via_ollama(emails)
+        # Through MCP so overlapping triggers reuse one fetch (see TOOL_CACHE_TTLS)
+        summary = run_call({"tool": "email.digest", "args": {"chat_id": chat_id}})
         send_message(chat_id, f"📬 *Your Email Summary for Today:*\n\n{summary}")
     except Exception as e:
         send_message(chat_id, f"⚠️ Could not fetch email summary: {e}")
@@ -1,11 +1,10 @@
 import os
 import json
-import base64
 import datetime
 from email import message_from_bytes
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from src.tools.gmail_batch import build_service, fetch_inbox
 from src.tools.messaging import send_message
 
 # ───────────────────────────────
@@ -56,40 +55,16 @@ def load_credentials(chat_id: str):
 # FETCH EMAILS (Improved)
 # ───────────────────────────────
 def fetch_recent_emails(creds, max_results=5):
-    """Fetch recent unread emails with sender, subject, and snippet."""
-    service = build("gmail", "v1", credentials=creds)
-    results = service.users().messages().list(
-        userId="me", maxResults=max_results, labelIds=["INBOX"]
-    ).execute()
-
-    messages = results.get("messages", [])
+    """Fetch recent emails with sender, subject, and a preview (batched; see gmail_batch)."""
+    service = build_service(creds)
     summaries = []
-
-    for msg in messages:
-        m = service.users().messages().get(userId="me", id=msg["id"], format="full").execute()
-        headers = m.get("payload", {}).get("headers", [])
-        subject = next((h["value"] for h in headers if h["name"] == "Subject"), "(no subject)")
-        sender = next((h["value"] for h in headers if h["name"] == "From"), "(unknown sender)")
-        snippet = m.get("snippet", "").strip()
-
-        # Try to decode the message body for richer preview
-        body = ""
-        parts = m.get("payload", {}).get("parts", [])
-        for part in parts:
-            data = part.get("body", {}).get("data")
-            if data:
-                try:
-                    body = base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
-                    body = " ".join(body.split())[:200]
-                    break
-                except Exception:
-                    pass
-
+    for e in fetch_inbox(service, max_results=max_results, bodies=True):
+        # The snippet is Gmail's own preview; the body is only decoded when there is no snippet
         summaries.append({
-            "from": sender,
-            "subject": subject,
-            "snippet": snippet[:100] + "...",
-            "body": body or snippet
+            "from": e["from"],
+            "subject": e["subject"],
+            "snippet": e["snippet"][:100] + "...",
+            "body": e["snippet"] or e["body"]
         })
     return summaries
 
@@ -3,9 +3,14 @@ import os
 import asyncio
 import aiohttp
 import logging
+import weakref
 import requests
+import time
 from dotenv import load_dotenv
 
+from src.config import SEND_MANY_CONCURRENCY, SEND_MANY_RATE_PER_SECOND
+from src.resilience import RetryPolicy, acall_with_retry
+
 # Force-load environment variables from project root
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), "../../.env"))
 
@@ -15,6 +20,26 @@ BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
 
+class TelegramError(Exception):
+    """Telegram rejected the message (bad chat id, blocked bot, ...); retrying won't help."""
+
+
+class TelegramTransientError(TelegramError):
+    """Connection failure, rate limit (429) or Telegram 5xx; the message wasn't sent, so retrying is safe."""
+
+
+class TelegramUncertainError(TelegramError):
+    """The request may have reached Telegram (e.g. a read timeout); retrying could send it twice."""
+
+
+def _check_status(status: int, body: str):
+    if status == 200:
+        return
+    if status == 429 or status >= 500:
+        raise TelegramTransientError(f"Telegram error {status}: {body}")
+    raise TelegramError(f"Telegram error {status}: {body}")
+
+
 async def _send_async(chat_id: str, text: str, parse_mode: str | None = None):
     """Send a Telegram message asynchronously with optional parse mode."""
     url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
@@ -32,26 +57,151 @@ async def _send_async(chat_id: str, text: str, parse_mode: str | None = None):
                 print(f"✅ Telegram message sent to {chat_id}: {text}")
 
 
-def send_message(chat_id: str, text: str, parse_mode: str | None = None):
+# One pooled aiohttp session per event loop, shared by every async send on that loop
+_sessions = weakref.WeakKeyDictionary()
+
+
+async def get_async_session() -> aiohttp.ClientSession:
+    """Return the shared aiohttp session for the running event loop."""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        _sessions[loop] = session
+    return session
+
+
+async def close_async_session():
+    """Close the running loop's shared session (call before the loop shuts down)."""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+async def send_message_async(chat_id: str, text: str, parse_mode: str | None = None, session=None):
+    """
+    Async-native deliver_message for MCP's arun_call. Reuses a pooled session so
+    many sends can be in flight on one loop. Returns True, or raises TelegramError.
+    """
+    payload = {"chat_id": chat_id, "text": text}
+    if parse_mode:
+        payload["parse_mode"] = parse_mode
+    session = session or await get_async_session()
     try:
-        payload = {
-            "chat_id": chat_id,
-            "text": text
-        }
-        if parse_mode:
-            payload["parse_mode"] = parse_mode
+        async with session.post(f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage", json=payload) as resp:
+            body = await resp.text()
+            status = resp.status
+    except aiohttp.ClientConnectorError as e:
+        raise TelegramTransientError(f"Telegram unreachable: {e}") from e
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise TelegramUncertainError(f"Telegram request failed after sending: {e}") from e
+    print("📤 Sent:", status, body)
+    _check_status(status, body)
+    return True
+
 
+def deliver_message(chat_id: str, text: str, parse_mode: str | None = None):
+    """
+    Strict send used by the MCP "messaging.send_message" tool: returns True, or
+    raises TelegramError / TelegramTransientError so MCP can retry or trip its breaker.
+    Only failures before the request went out are transient; a timeout waiting for
+    the answer raises TelegramUncertainError, which is not retried.
+    """
+    payload = {
+        "chat_id": chat_id,
+        "text": text
+    }
+    if parse_mode:
+        payload["parse_mode"] = parse_mode
+
+    try:
         response = requests.post(
             f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage",
             json=payload,
             timeout=10
         )
+    except requests.ConnectionError as e:  # includes ConnectTimeout
+        raise TelegramTransientError(f"Telegram unreachable: {e}") from e
+    except requests.RequestException as e:
+        raise TelegramUncertainError(f"Telegram request failed after sending: {e}") from e
+
+    print("📤 Sent:", response.status_code, response.text)
+    _check_status(response.status_code, response.text)
+    return True
 
-        print("📤 Sent:", response.status_code, response.text)
 
+def send_message(chat_id: str, text: str, parse_mode: str | None = None):
+    """Best-effort send for bot replies: failures are printed, never raised."""
+    try:
+        deliver_message(chat_id, text, parse_mode)
     except Exception as e:
         print("❌ Telegram send error:", e)
 
 
+class _RateLimiter:
+    """Spaces out acquisitions so at most ``rate`` happen per second on one loop."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# 429s and network errors during a bulk send are retried per recipient
+_SEND_MANY_RETRY = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=10.0, retry_on=("TelegramTransientError",))
+
+
+async def send_many_async(chat_ids, text: str, parse_mode: str | None = None,
+                          rate_per_second: float = None, concurrency: int = None, on_result=None):
+    """
+    Send one message to many chats over the loop's pooled session, at most
+    ``concurrency`` requests in flight and ``rate_per_second`` started per second.
+    ``on_result(chat_id, error_or_None)`` is called as each send finishes.
+    Returns {"delivered": n, "failed": [[chat_id, error], ...]}.
+    """
+    limiter = _RateLimiter(rate_per_second or SEND_MANY_RATE_PER_SECOND)
+    sem = asyncio.Semaphore(concurrency or SEND_MANY_CONCURRENCY)
+    session = await get_async_session()
+    result = {"delivered": 0, "failed": []}
+
+    async def _one(cid):
+        async with sem:
+            await limiter.wait()
+            try:
+                await acall_with_retry(lambda: send_message_async(cid, text, parse_mode, session=session), _SEND_MANY_RETRY)
+                error = None
+                result["delivered"] += 1
+            except Exception as e:
+                error = str(e)
+                result["failed"].append([cid, error])
+        if on_result:
+            on_result(cid, error)
+
+    await asyncio.gather(*(_one(str(cid)) for cid in chat_ids))
+    return result
+
+
+def send_many(chat_ids, text: str, parse_mode: str | None = None,
+              rate_per_second: float = None, concurrency: int = None):
+    """Blocking send_many_async for the MCP "messaging.send_many" tool and sync callers."""
+    async def _run():
+        try:
+            return await send_many_async(chat_ids, text, parse_mode, rate_per_second, concurrency)
+        finally:
+            await close_async_session()
+
+    return asyncio.run(_run())
+
+
 if __name__ == "__main__":
     send_message(CHAT_ID, "✅ Hello Nishtha! Test message from AI Micro Agent.", parse_mode="Markdown")
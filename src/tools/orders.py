@@ -1,10 +1,11 @@
 import os
 import json
+import asyncio
 import requests
 import datetime
 from dotenv import load_dotenv
 from src.db import get_conn
-from src.tools.messaging import send_message
+from src.tools.messaging import send_message, send_message_async, get_async_session
 
 # Load environment variables
 load_dotenv()
@@ -28,17 +29,8 @@ def get_chat_id_by_name(name: str):
 # ────────────────────────────────────────────────
 # 🛒 Place an order (Buyer → Store)
 # ────────────────────────────────────────────────
-def place_order(buyer_chat_id: str, store_identifier: str, item: str):
-    """Sends an order message to the store with inline buttons."""
-    store_chat_id = get_chat_id_by_name(store_identifier)
-    if not store_chat_id:
-        send_message(
-            buyer_chat_id,
-            f"⚠️ I couldn't find *{store_identifier}* in the user registry.\n"
-            f"Ask them to start this bot first using /start."
-        )
-        return
-
+def _insert_order(buyer_chat_id: str, store_chat_id: str, store_identifier: str, item: str) -> int:
+    """Create the pending order_status row and return its id."""
     # Create order_status table if not exists
     conn = get_conn()
     cur = conn.cursor()
@@ -76,9 +68,12 @@ def place_order(buyer_chat_id: str, store_identifier: str, item: str):
     conn.commit()
     order_id = cur.lastrowid
     conn.close()
+    return order_id
 
-    # Send order message to store
-    payload = {
+
+def _store_order_payload(store_chat_id: str, item: str, order_id: int) -> dict:
+    """Telegram sendMessage payload asking the store to accept the order."""
+    return {
         "chat_id": store_chat_id,
         "text": f"🛒 *New Order from Customer*\n\n📦 Item: *{item}*\nWould you like to accept it?",
         "parse_mode": "Markdown",
@@ -92,6 +87,22 @@ def place_order(buyer_chat_id: str, store_identifier: str, item: str):
         })
     }
 
+
+def place_order(buyer_chat_id: str, store_identifier: str, item: str):
+    """Sends an order message to the store with inline buttons."""
+    store_chat_id = get_chat_id_by_name(store_identifier)
+    if not store_chat_id:
+        send_message(
+            buyer_chat_id,
+            f"⚠️ I couldn't find *{store_identifier}* in the user registry.\n"
+            f"Ask them to start this bot first using /start."
+        )
+        return
+
+    order_id = _insert_order(buyer_chat_id, store_chat_id, store_identifier, item)
+
+    # Send order message to store
+    payload = _store_order_payload(store_chat_id, item, order_id)
     res = requests.post(f"{TG_BASE}/sendMessage", data=payload)
     if res.status_code == 200:
         send_message(buyer_chat_id, f"✅ Order sent to *{store_identifier}* for *{item}*.")
@@ -100,6 +111,41 @@ def place_order(buyer_chat_id: str, store_identifier: str, item: str):
         print("❌ Telegram API error:", res.text)
 
 
+async def place_order_async(buyer_chat_id: str, store_identifier: str, item: str):
+    """
+    Async-native place_order for MCP's arun_call: SQLite work runs in a thread,
+    the Telegram calls go through the shared aiohttp session.
+    """
+    store_chat_id = await asyncio.to_thread(get_chat_id_by_name, store_identifier)
+    if not store_chat_id:
+        try:
+            await send_message_async(
+                buyer_chat_id,
+                f"⚠️ I couldn't find *{store_identifier}* in the user registry.\n"
+                f"Ask them to start this bot first using /start."
+            )
+        except Exception as e:
+            print("❌ Telegram send error:", e)
+        return
+
+    order_id = await asyncio.to_thread(_insert_order, buyer_chat_id, store_chat_id, store_identifier, item)
+
+    session = await get_async_session()
+    payload = _store_order_payload(store_chat_id, item, order_id)
+    async with session.post(f"{TG_BASE}/sendMessage", data=payload) as res:
+        ok = res.status == 200
+        body = await res.text()
+    try:
+        if ok:
+            await send_message_async(buyer_chat_id, f"✅ Order sent to *{store_identifier}* for *{item}*.", session=session)
+        else:
+            await send_message_async(buyer_chat_id, f"⚠️ Failed to deliver order to *{store_identifier}*.", session=session)
+            print("❌ Telegram API error:", body)
+    except Exception as e:
+        # The order itself went out; a failed confirmation must not make MCP retry it
+        print("❌ Telegram send error:", e)
+
+
 # ────────────────────────────────────────────────
 # 🏪 Store-side button handling
 # ────────────────────────────────────────────────
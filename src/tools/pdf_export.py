@@ -3,6 +3,8 @@ from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import inch
 from datetime import datetime
 from pathlib import Path
+import os
+import requests
 
 def generate_notes_pdf(notes, output_path="notes_export.pdf"):
     """
@@ -51,3 +53,30 @@ def generate_notes_pdf(notes, output_path="notes_export.pdf"):
 
     c.save()
     return output_path
+
+
+def export_notes(chat_id: str):
+    """
+    MCP tool "notes.export_pdf": render the chat's notes to a PDF and send it as a
+    Telegram document. Runs as a one-shot "notes_export" task on the scheduler's
+    "cpu" process pool, so rendering never blocks the polling loop.
+    """
+    from src.db import list_notes
+    from src.tools.messaging import BOT_TOKEN, send_message
+
+    notes = list_notes(str(chat_id))
+    if not notes:
+        send_message(chat_id, "📭 You have no notes to export.")
+        return None
+
+    pdf_path = generate_notes_pdf(notes, f"notes_{chat_id}.pdf")
+    with open(pdf_path, "rb") as f:
+        resp = requests.post(
+            f"https://api.telegram.org/bot{BOT_TOKEN}/sendDocument",
+            data={"chat_id": chat_id, "caption": "📄 Here is your exported notes PDF."},
+            files={"document": f},
+            timeout=30,
+        )
+    resp.raise_for_status()
+    os.remove(pdf_path)
+    return pdf_path
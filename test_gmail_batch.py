@@ -0,0 +1,101 @@
+"""
+test_gmail_batch.py — batched Gmail reads (src/tools/gmail_batch.py) against a local fake Gmail
+Run: python -m pytest -q test_gmail_batch.py
+"""
+
+import email
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import googleapiclient
+import pytest
+from google.oauth2.credentials import Credentials
+
+from src.tools import gmail_batch
+
+DISCOVERY = os.path.join(os.path.dirname(googleapiclient.__file__), "discovery_cache", "documents", "gmail.v1.json")
+
+
+class FakeGmail(BaseHTTPRequestHandler):
+    """Serves the Gmail discovery document and answers message batches; ``fail`` maps id → statuses to return first."""
+
+    messages = {}
+    fail = {}
+    batches = []
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, content_type, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with open(DISCOVERY, encoding="utf-8") as f:
+            doc = json.load(f)
+        doc["rootUrl"] = f"http://127.0.0.1:{self.server.server_port}/"
+        self._send(200, "application/json", json.dumps(doc).encode())
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers["Content-Length"]))
+        request = email.message_from_bytes(b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + raw)
+        ids, parts = [], []
+        for part in request.get_payload():
+            msg_id = re.search(r"/messages/([^?\s]+)", part.get_payload()).group(1)
+            ids.append(msg_id)
+            pending = self.fail.get(msg_id) or []
+            if pending:
+                status = pending.pop(0)
+                body = json.dumps({"error": {"code": status, "message": "failed",
+                                             "errors": [{"reason": "rateLimitExceeded" if status in (403, 429)
+                                                         else "backendError"}]}})
+            else:
+                status, body = 200, json.dumps(self.messages[msg_id])
+            parts.append(
+                f"--BOUNDARY\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{part['Content-ID'].strip('<>')}>\r\n\r\n"
+                f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n\r\n{body}\r\n"
+            )
+        self.batches.append(ids)
+        self._send(200, 'multipart/mixed; boundary="BOUNDARY"', ("".join(parts) + "--BOUNDARY--\r\n").encode())
+
+
+@pytest.fixture
+def gmail(monkeypatch):
+    FakeGmail.messages = {f"m{i}": {"id": f"m{i}", "snippet": f"hello {i}",
+                                    "payload": {"headers": [{"name": "Subject", "value": f"S{i}"}]}}
+                          for i in range(5)}
+    FakeGmail.fail, FakeGmail.batches = {}, []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGmail)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(gmail_batch, "GMAIL_DISCOVERY_URL", f"http://127.0.0.1:{server.server_port}/discovery")
+    monkeypatch.setattr(gmail_batch.time, "sleep", lambda s: None)
+    yield gmail_batch.build_service(Credentials(token="test"))
+    server.shutdown()
+
+
+def test_all_messages_in_one_batch(gmail):
+    found = gmail_batch.batch_get(gmail, ["m0", "m1", "m2"], gmail_batch.METADATA_FIELDS, format="metadata")
+    assert sorted(found) == ["m0", "m1", "m2"]
+    assert FakeGmail.batches == [["m0", "m1", "m2"]]
+
+
+def test_rate_limited_parts_are_retried(gmail):
+    FakeGmail.fail = {"m1": [429], "m3": [403, 503]}
+    found = gmail_batch.batch_get(gmail, ["m0", "m1", "m2", "m3"], gmail_batch.METADATA_FIELDS, format="metadata")
+    assert sorted(found) == ["m0", "m1", "m2", "m3"]
+    assert FakeGmail.batches == [["m0", "m1", "m2", "m3"], ["m1", "m3"], ["m3"]]
+
+
+def test_permanent_failures_are_not_retried(gmail):
+    FakeGmail.fail = {"m1": [404], "m2": [429] * 10}
+    found = gmail_batch.batch_get(gmail, ["m0", "m1", "m2"], gmail_batch.METADATA_FIELDS,
+                                  policy=gmail_batch.RetryPolicy(max_attempts=3), format="metadata")
+    assert sorted(found) == ["m0"]
+    assert FakeGmail.batches == [["m0", "m1", "m2"], ["m2"], ["m2"]]
@@ -0,0 +1,127 @@
+"""
+test_job_queue.py — claim / ack / fail / lease checks for the durable job queue (src/job_queue.py)
+Run: python -m pytest -q test_job_queue.py
+"""
+
+import time
+
+import pytest
+
+from src import job_queue, mcp
+from src.db import claim_execution, finish_execution, get_conn, purge_history, record_run
+
+
+def job_row(job_id):
+    conn = get_conn()
+    row = conn.execute(
+        "SELECT status, attempts, worker, lease_until, last_error FROM job_queue WHERE id = ?", (job_id,)
+    ).fetchone()
+    conn.close()
+    return row
+
+
+def test_enqueue_same_run_twice_is_a_noop(tmp_db):
+    assert job_queue.enqueue_task(1, "2026-10-19T09:00:00+05:30")
+    assert not job_queue.enqueue_task(1, "2026-10-19T09:00:00+05:30")
+    assert job_queue.queue_depth() == {"queued": 1}
+
+
+def test_claim_takes_oldest_and_holds_it(tmp_db):
+    job_queue.enqueue_task(1, "2026-10-19T10:00:00+05:30")
+    job_queue.enqueue_task(2, "2026-10-19T09:00:00+05:30")
+    job_id, task_id, _, attempts = job_queue.claim_job("w1")
+    assert (task_id, attempts) == (2, 1)
+    assert job_queue.claim_job("w2")[1] == 1
+    assert job_queue.claim_job("w3") is None  # both leased
+    assert job_row(job_id)[:3] == ("running", 1, "w1")
+
+
+def test_ack_only_by_the_lease_holder(tmp_db):
+    job_queue.enqueue_task(1, "t1")
+    job_id = job_queue.claim_job("w1")[0]
+    assert not job_queue.ack_job(job_id, "w2")
+    assert job_queue.ack_job(job_id, "w1")
+    assert job_row(job_id)[0] == "done"
+    assert job_queue.claim_job("w2") is None
+
+
+def test_fail_requeues_then_parks(tmp_db):
+    job_queue.enqueue_task(1, "t1")
+    for attempt in (1, 2):
+        job_id, _, _, attempts = job_queue.claim_job("w1", max_attempts=2)
+        assert attempts == attempt
+        job_queue.fail_job(job_id, "w1", "boom", max_attempts=2)
+    assert job_row(job_id)[0] == "failed"
+    assert job_row(job_id)[4] == "boom"
+    assert job_queue.claim_job("w1", max_attempts=2) is None
+
+
+def test_expired_lease_is_redelivered(tmp_db):
+    job_queue.enqueue_task(1, "t1")
+    job_id = job_queue.claim_job("dead", lease_seconds=-1)[0]
+    again = job_queue.claim_job("w2")
+    assert again[0] == job_id and again[3] == 2
+    assert not job_queue.ack_job(job_id, "dead")  # the crashed worker lost it
+    assert job_queue.ack_job(job_id, "w2")
+
+
+def test_crashing_on_every_attempt_parks_the_job(tmp_db):
+    job_queue.enqueue_task(1, "t1")
+    for _ in range(3):
+        assert job_queue.claim_job("dead", lease_seconds=-1, max_attempts=3)
+    assert job_queue.claim_job("w2", max_attempts=3) is None
+    status, attempts, _, _, error = job_row(1)
+    assert (status, attempts) == ("failed", 3)
+    assert "lease expired" in error
+
+
+def test_heartbeat_keeps_a_long_job_leased(tmp_db):
+    job_queue.enqueue_task(1, "t1")
+    job_id = job_queue.claim_job("w1", lease_seconds=3)[0]
+    first_lease = job_row(job_id)[3]
+    with job_queue.LeaseHeartbeat(job_id, "w1", lease_seconds=3):
+        time.sleep(3.5)  # longer than the lease itself
+        assert job_queue.claim_job("w2", lease_seconds=3) is None
+    assert job_row(job_id)[3] > first_lease
+    assert job_queue.ack_job(job_id, "w1")
+
+
+def test_renew_fails_once_the_lease_moved(tmp_db):
+    job_queue.enqueue_task(1, "t1")
+    job_id = job_queue.claim_job("w1", lease_seconds=-1)[0]
+    job_queue.claim_job("w2")
+    assert not job_queue.renew_lease(job_id, "w1")
+    assert job_queue.renew_lease(job_id, "w2")
+
+
+def test_call_still_running_fails_the_job_instead_of_skipping(tmp_db):
+    assert claim_execution("7@t1:0", 7, "messaging.send_message")[0]  # a worker died mid-call
+    with pytest.raises(mcp.ExecutionInProgress):
+        mcp.run_call_with_attempts({"tool": "messaging.send_message", "args": {}}, "7@t1:0", 7)
+
+
+def test_stale_running_call_is_reclaimed(tmp_db):
+    assert claim_execution("7@t1:0")[0]
+    assert claim_execution("7@t1:0", stale_after=60) == (False, "running", None)
+    assert claim_execution("7@t1:0", stale_after=-1)[0]  # older than the lease: its process is gone
+
+
+def test_purge_history_keeps_live_rows(tmp_db):
+    claim_execution("old")
+    finish_execution("old", True, "x")
+    claim_execution("live")
+    record_run(1, "2020-01-01T00:00:00", "2020-01-01T00:00:01", True)
+    job_queue.enqueue_task(1, "t1")
+    done = job_queue.claim_job("w1")[0]
+    job_queue.ack_job(done, "w1")
+    job_queue.enqueue_task(2, "t2")
+
+    conn = get_conn()
+    conn.execute("UPDATE tool_execution SET finished_at = 0 WHERE idempotency_key = 'old'")
+    conn.execute("UPDATE job_queue SET finished_at = 0 WHERE id = ?", (done,))
+    conn.commit()
+    conn.close()
+
+    assert purge_history(30) == {"tool_execution": 1, "run": 1, "job_queue": 1}
+    assert job_queue.queue_depth() == {"queued": 1}
+    assert purge_history(0) == {}
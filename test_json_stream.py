@@ -0,0 +1,63 @@
+"""
+test_json_stream.py — checks for early-terminating JSON extraction (planner.JSONStreamExtractor)
+Run: python -m pytest -q test_json_stream.py
+"""
+
+import json
+
+import pytest
+
+from src import ollama_client, planner
+
+PLAN = '{"task_type": "reminder", "schedule_rule": "RRULE:FREQ=DAILY;INTERVAL=1", "text": "Drink water"}'
+
+
+def feed_in_pieces(text, size):
+    ex = planner.JSONStreamExtractor()
+    found = [ex.feed(text[i:i + size]) for i in range(0, len(text), size)]
+    return [f for f in found if f is not None]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_object_is_returned_once_whatever_the_chunking(size):
+    assert feed_in_pieces('Sure! Here it is:\n' + PLAN + '\nHope this helps {"x": 1}', size) == [PLAN]
+
+
+def test_braces_inside_strings_are_ignored():
+    text = '{"text": "reply with } or {{ to stop", "n": {"inner": "}"}} trailing'
+    assert feed_in_pieces(text, 2) == [text[:text.rindex("}") + 1]]
+    assert json.loads(feed_in_pieces(text, 2)[0])["n"] == {"inner": "}"}
+
+
+def test_escaped_quotes_do_not_end_the_string():
+    text = r'{"text": "say \"} done\" now", "path": "C:\\"} after'
+    obj = feed_in_pieces(text, 1)[0]
+    assert json.loads(obj) == {"text": 'say "} done" now', "path": "C:\\"}
+
+
+def test_incomplete_object_is_not_returned():
+    ex = planner.JSONStreamExtractor()
+    assert ex.feed('{"text": "no closing brace"') is None
+    assert ex.feed('  ') is None
+
+
+def test_extract_json_from_text_repairs_trailing_commas():
+    assert planner.extract_json_from_text('noise {"a": [1, 2,], "b": 1,} more') == {"a": [1, 2], "b": 1}
+
+
+def test_generate_hangs_up_once_the_plan_is_complete(monkeypatch):
+    tokens = [PLAN[i:i + 4] for i in range(0, len(PLAN), 4)] + [" Hope", " this", " helps", "!"]
+    state = {"sent": 0, "closed": False}
+
+    def fake_stream(prompt, **kwargs):
+        try:
+            for t in tokens:
+                state["sent"] += 1
+                yield t
+        finally:
+            state["closed"] = True
+
+    monkeypatch.setattr(ollama_client, "iter_generate", fake_stream)
+    assert planner._generate("prompt") == PLAN
+    assert state["closed"]
+    assert state["sent"] == len(tokens) - 4  # the filler after the object was never pulled
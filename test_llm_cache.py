@@ -0,0 +1,56 @@
+"""
+test_llm_cache.py — checks that planner.call_ollama only caches plans that validate
+Run: python -m pytest -q test_llm_cache.py
+"""
+
+import pytest
+
+from src import llm_cache, ollama_client, planner
+
+PLAN = '{"task_type": "reminder", "schedule_rule": "RRULE:FREQ=DAILY;INTERVAL=1", "text": "Drink water"}'
+NOT_A_PLAN = '{"task_type": "reminder", "schedule_rule": "every day", "text": "Drink water"}'
+
+
+@pytest.fixture
+def model(tmp_db, monkeypatch):
+    """Fake Ollama: pops answers[model] in order and records which model each call went to."""
+    monkeypatch.setattr(llm_cache, "_caches", {})
+    monkeypatch.setattr(ollama_client, "TIERS", {"small": "small-m", "large": "large-m"})
+    monkeypatch.setattr(ollama_client, "route", lambda task: ("small", "small-m"))
+    monkeypatch.setattr(ollama_client, "OLLAMA_ESCALATE", True)
+    calls = []
+    answers = {}
+
+    def generate(prompt, format=None, model=None):
+        calls.append(model)
+        return answers[model].pop(0)
+
+    monkeypatch.setattr(planner, "_generate", generate)
+    return answers, calls
+
+
+def test_invalid_plan_is_not_cached(model):
+    answers, calls = model
+    answers.update({"small-m": [NOT_A_PLAN, NOT_A_PLAN], "large-m": [PLAN, PLAN]})
+    assert planner.plan_from_llm("drink water daily").text == "Drink water"
+    # The small model's bad answer wasn't stored, so it is asked (and escalated) again
+    assert planner.plan_from_llm("drink water daily").text == "Drink water"
+    assert calls == ["small-m", "large-m", "small-m"]
+
+
+def test_valid_plan_is_served_from_cache(model):
+    answers, calls = model
+    answers.update({"small-m": [PLAN]})
+    planner.plan_from_llm("drink water daily")
+    assert planner.plan_from_llm("Drink  water daily").text == "Drink water"
+    assert calls == ["small-m"]
+
+
+def test_cache_key_includes_format_and_tier(model):
+    answers, calls = model
+    answers.update({"small-m": [PLAN, PLAN, PLAN]})
+    planner.call_ollama("drink water daily", format=planner.PLAN_SCHEMA, model="small-m", tier="small")
+    planner.call_ollama("drink water daily", format="json", model="small-m", tier="small")
+    planner.call_ollama("drink water daily", format=planner.PLAN_SCHEMA, model="small-m", tier="large")
+    planner.call_ollama("drink water daily", format=planner.PLAN_SCHEMA, model="small-m", tier="small")
+    assert len(calls) == 3
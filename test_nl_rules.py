@@ -0,0 +1,97 @@
+"""
+test_nl_rules.py — checks for the deterministic schedule fast path (src/nl_rules.py)
+Run: python -m pytest -q test_nl_rules.py   (or: python test_nl_rules.py)
+"""
+
+import datetime
+
+from src import nl_rules
+
+# Monday 2026-10-19, 10:00 local time
+NOW = nl_rules.TZ.localize(datetime.datetime(2026, 10, 19, 10, 0))
+
+
+def once_at(day, hour, minute=0):
+    return f"RRULE:FREQ=ONCE;RUN_AT={NOW.replace(day=day, hour=hour, minute=minute).isoformat()}"
+
+
+def test_every_weekday_is_recurring():
+    for text in ("call mom every friday at 5pm", "call mom each friday at 5pm", "call mom weekly on friday at 5pm"):
+        m = nl_rules.parse_schedule(text, NOW)
+        assert m.rule == "RRULE:FREQ=WEEKLY;BYDAY=FR;BYHOUR=17;BYMINUTE=0", text
+        assert m.text == "call mom"
+
+
+def test_on_weekday_is_one_shot():
+    m = nl_rules.parse_schedule("call mom on friday at 5pm", NOW)
+    assert m.one_shot and m.rule == once_at(23, 17)
+    assert m.text == "call mom"
+
+
+def test_on_weekday_already_past_today_means_next_week():
+    assert nl_rules.parse_schedule("standup on monday at 9am", NOW).rule == once_at(26, 9)
+    assert nl_rules.parse_schedule("standup on monday at 11am", NOW).rule == once_at(19, 11)
+
+
+def test_weekday_with_bare_time_is_not_today():
+    m = nl_rules.parse_schedule("call mom friday 5pm", NOW)
+    assert m.rule == once_at(23, 17)
+
+
+def test_weekday_apart_from_time_falls_back_to_model():
+    assert nl_rules.parse_schedule("friday, call mom at 5pm", NOW) is None
+    assert nl_rules.parse_schedule("gym on mondays at 6pm", NOW) is None
+
+
+def test_time_alone_is_today_or_tomorrow():
+    assert nl_rules.parse_schedule("call mom at 5pm", NOW).rule == once_at(19, 17)
+    assert nl_rules.parse_schedule("call mom at 7am", NOW).rule == once_at(20, 7)
+
+
+def test_weekend_recurs_only_when_said_so():
+    for text in ("water the lawn every weekend at 7am", "water the lawn on weekends at 7am"):
+        m = nl_rules.parse_schedule(text, NOW)
+        assert m.rule == "RRULE:FREQ=WEEKLY;BYDAY=SA,SU;BYHOUR=7;BYMINUTE=0", text
+        assert m.text == "water the lawn"
+    # Without every/each/on + plural it isn't a recurring rule; the model decides
+    assert nl_rules.parse_schedule("gym weekends at 7am", NOW) is None
+    assert nl_rules.parse_schedule("meet on weekday at 8am", NOW) is None
+
+
+def test_this_weekend_is_one_shot():
+    m = nl_rules.parse_schedule("clean the house this weekend", NOW)
+    assert m.one_shot and m.rule == once_at(24, 8)
+    assert m.text == "clean the house"
+    assert nl_rules.parse_schedule("clean the house this weekend at 5pm", NOW).rule == once_at(24, 17)
+    saturday_night = NOW.replace(day=24, hour=20)
+    assert nl_rules.parse_schedule("clean the house this weekend", saturday_night).rule == once_at(25, 8)
+    sunday_night = NOW.replace(day=25, hour=20)
+    assert nl_rules.parse_schedule("clean the house this weekend", sunday_night) is None
+
+
+def test_weekend_word_is_never_read_as_today():
+    assert nl_rules.parse_schedule("weekend at 5pm call mom", NOW) is None
+
+
+def test_tonight_and_evening_mean_pm():
+    evening = NOW.replace(hour=19)
+    assert nl_rules.parse_schedule("call mom tonight at 9", evening).rule == once_at(19, 21)
+    assert nl_rules.parse_schedule("call mom tonight at 8", evening).rule == once_at(19, 20)
+    assert nl_rules.parse_schedule("call mom at 8:30 tonight", evening).rule == once_at(19, 20, 30)
+    assert nl_rules.parse_schedule("call mom tomorrow evening at 7", NOW).rule == once_at(20, 19)
+    assert nl_rules.parse_schedule("run tomorrow morning at 6", NOW).rule == once_at(20, 6)
+
+
+def test_parse_time_with_part_of_day():
+    assert nl_rules.parse_time("9", "tonight") == (21, 0)
+    assert nl_rules.parse_time("7:30", "evening") == (19, 30)
+    assert nl_rules.parse_time("1am", "tonight") == (1, 0)
+    assert nl_rules.parse_time("5", "morning") == (5, 0)
+    assert nl_rules.parse_time("5") == (17, 0)
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✅ {name}")
@@ -0,0 +1,89 @@
+"""
+test_orchestrator.py — checks for the plan DAG in orchestrator.run_calls ($from / depends_on)
+Run: python -m pytest -q test_orchestrator.py
+"""
+
+import threading
+
+import pytest
+
+from src import orchestrator
+
+
+@pytest.fixture
+def tools(monkeypatch):
+    """Replace MCP dispatch: each call's "tool" names a function in this dict."""
+    ran = []
+    registry = {
+        "echo": lambda **args: args,
+        "fail": lambda **args: (_ for _ in ()).throw(RuntimeError("tool failed")),
+    }
+
+    def fake_run(call, key=None, task_id=None):
+        ran.append(call.get("tool"))
+        return registry[call.get("tool")](**dict(call.get("args", {}))), 1
+
+    monkeypatch.setattr(orchestrator, "run_call_with_attempts", fake_run)
+    registry["ran"] = ran
+    return registry
+
+
+def test_calls_without_dependencies_run_in_order(tools):
+    calls = [{"tool": "echo", "args": {"n": i}} for i in range(4)]
+    assert orchestrator.run_calls(calls) == {str(i): {"n": i} for i in range(4)}
+
+
+def test_from_passes_a_dependency_output(tools):
+    calls = [
+        {"id": "a", "tool": "echo", "args": {"item": "milk", "store": "Capital"}},
+        {"id": "b", "tool": "echo", "depends_on": ["a"],
+         "args": {"item": {"$from": "a", "key": "item"}, "whole": {"$from": "a"}, "list": [{"$from": "a", "key": "store"}]}},
+    ]
+    out = orchestrator.run_calls(calls)
+    assert out["b"] == {"item": "milk", "whole": {"item": "milk", "store": "Capital"}, "list": ["Capital"]}
+
+
+def test_independent_calls_run_concurrently(tools):
+    barrier = threading.Barrier(3, timeout=5)  # deadlocks (BrokenBarrierError) if run one at a time
+    tools["wait"] = lambda **args: barrier.wait()
+    calls = [{"id": str(i), "tool": "wait", "depends_on": []} for i in range(3)]
+    calls.append({"id": "last", "tool": "echo", "depends_on": ["0", "1", "2"]})
+    out = orchestrator.run_calls(calls, max_workers=3)
+    assert sorted(out) == ["0", "1", "2", "last"]
+
+
+def test_cycle_is_rejected_before_anything_runs(tools):
+    calls = [
+        {"id": "a", "tool": "echo", "depends_on": ["c"]},
+        {"id": "b", "tool": "echo", "depends_on": ["a"]},
+        {"id": "c", "tool": "echo", "depends_on": ["b"]},
+        {"id": "free", "tool": "echo"},
+    ]
+    with pytest.raises(ValueError, match="cycle"):
+        orchestrator.run_calls(calls)
+    assert tools["ran"] == []
+
+
+def test_self_dependency_is_a_cycle(tools):
+    with pytest.raises(ValueError, match="cycle"):
+        orchestrator.run_calls([{"id": "a", "tool": "echo", "depends_on": ["a"]}])
+
+
+def test_unknown_and_duplicate_ids_are_rejected(tools):
+    with pytest.raises(ValueError, match="unknown"):
+        orchestrator.run_calls([{"id": "a", "tool": "echo", "depends_on": ["nope"]}])
+    with pytest.raises(ValueError, match="Duplicate"):
+        orchestrator.run_calls([{"id": "a", "tool": "echo"}, {"id": "a", "tool": "echo", "depends_on": []},
+                                {"id": "b", "tool": "echo", "depends_on": ["a"]}])
+    assert tools["ran"] == []
+
+
+def test_failure_stops_dependents_and_is_raised(tools):
+    calls = [
+        {"id": "a", "tool": "fail"},
+        {"id": "b", "tool": "echo", "depends_on": ["a"]},
+        {"id": "c", "tool": "echo", "depends_on": ["b"]},
+    ]
+    with pytest.raises(RuntimeError, match="tool failed"):
+        orchestrator.run_calls(calls)
+    assert tools["ran"] == ["fail"]
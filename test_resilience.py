@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+import requests
+
+from src import resilience
+from src.resilience import CircuitBreaker, RetryPolicy, acall_with_retry, call_with_retry
+from src.tools import messaging
+
+
+def _half_open_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "half-open"
+    return breaker
+
+
+def test_interrupted_trial_releases_half_open_breaker():
+    breaker = _half_open_breaker()
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        call_with_retry(interrupted, RetryPolicy(max_attempts=1), breaker)
+    # The next call is let through as a new trial instead of failing fast forever
+    assert call_with_retry(lambda: "ok", RetryPolicy(max_attempts=1), breaker) == ("ok", 1)
+
+
+def test_cancelled_async_trial_releases_half_open_breaker():
+    breaker = _half_open_breaker()
+
+    async def cancelled():
+        raise asyncio.CancelledError
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(acall_with_retry(cancelled, RetryPolicy(max_attempts=1), breaker))
+
+    async def ok():
+        return "ok"
+
+    assert asyncio.run(acall_with_retry(ok, RetryPolicy(max_attempts=1), breaker)) == ("ok", 1)
+
+
+@pytest.mark.parametrize("error, expected", [
+    (requests.ConnectionError("refused"), messaging.TelegramTransientError),
+    (requests.ConnectTimeout("connect timeout"), messaging.TelegramTransientError),
+    (requests.ReadTimeout("read timeout"), messaging.TelegramUncertainError),
+])
+def test_deliver_message_only_marks_undelivered_failures_transient(monkeypatch, error, expected):
+    def post(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(messaging.requests, "post", post)
+    with pytest.raises(messaging.TelegramError) as info:
+        messaging.deliver_message("1", "hi")
+    assert type(info.value) is expected
+
+
+def test_send_message_is_not_retried_after_a_read_timeout(monkeypatch):
+    from src.mcp import TOOL_RETRY_POLICIES
+
+    calls = []
+
+    def post(*args, **kwargs):
+        calls.append(1)
+        raise requests.ReadTimeout("read timeout")
+
+    monkeypatch.setattr(messaging.requests, "post", post)
+    monkeypatch.setattr(resilience.time, "sleep", lambda s: None)
+    policy = TOOL_RETRY_POLICIES["messaging.send_message"]
+    with pytest.raises(messaging.TelegramUncertainError):
+        call_with_retry(lambda: messaging.deliver_message("1", "hi"), policy)
+    assert len(calls) == 1
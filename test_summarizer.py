@@ -0,0 +1,67 @@
+"""
+test_summarizer.py — map-reduce email digests (src/summarizer.py) against a stubbed model
+Run: python -m pytest -q test_summarizer.py
+"""
+
+import json
+import re
+
+import pytest
+
+from src import ollama_client, summarizer
+
+# ~100 estimated tokens each, so a 300-token budget maps them two per chunk
+EMAILS = [f"Email {i}: " + ("quarterly report numbers " * 16) for i in range(6)]
+
+
+@pytest.fixture
+def model(tmp_db, monkeypatch):
+    """Stub agenerate: map calls answer one line per email, or raise for an email marked BOOM."""
+    monkeypatch.setattr(ollama_client, "route", lambda task: ("small", "small-m"))
+    monkeypatch.setattr(ollama_client, "OLLAMA_ESCALATE", False)
+    calls = {"map": [], "digest": 0}
+
+    async def agenerate(prompt, model=None, priority=None, format=None, **extra):
+        if format == summarizer.MAP_SCHEMA:
+            emails = re.findall(r"^\[\d+\] (Email \d+)", prompt, re.MULTILINE)
+            calls["map"].append(emails)
+            if "BOOM" in prompt:
+                raise RuntimeError("model crashed")
+            return json.dumps({"summaries": [f"{e} is about the report" for e in emails]})
+        calls["digest"] += 1
+        return "Digest of:\n" + prompt[len(summarizer.DIGEST_PROMPT):]
+
+    monkeypatch.setattr(ollama_client, "agenerate", agenerate)
+    return calls
+
+
+def test_large_batch_is_mapped_in_chunks(model):
+    digest = summarizer.summarize_emails(EMAILS, budget=300)
+    assert model["map"] == [["Email 0", "Email 1"], ["Email 2", "Email 3"], ["Email 4", "Email 5"]]
+    assert model["digest"] == 1
+    assert all(f"Email {i} is about the report" in digest for i in range(6))
+    assert "could not be summarized" not in digest
+
+
+def test_failed_chunk_is_reported_in_the_digest(model):
+    emails = list(EMAILS)
+    emails[2] += " BOOM"
+    digest = summarizer.summarize_emails(emails, budget=300)
+    assert "Email 2 is about" not in digest and "Email 4 is about the report" in digest
+    assert digest.endswith("⚠️ 2 emails could not be summarized.")
+
+
+def test_only_unseen_or_failed_emails_are_mapped_again(model):
+    emails = list(EMAILS)
+    emails[2] += " BOOM"
+    summarizer.summarize_emails(emails, budget=300)
+    model["map"].clear()
+    emails[2] = EMAILS[2]  # the model recovered
+    digest = summarizer.summarize_emails(emails, budget=300)
+    assert model["map"] == [["Email 2", "Email 3"]]
+    assert "could not be summarized" not in digest
+
+
+def test_nothing_summarized_raises(model):
+    with pytest.raises(RuntimeError):
+        summarizer.summarize_emails([e + " BOOM" for e in EMAILS], budget=300)
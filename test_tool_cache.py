@@ -0,0 +1,106 @@
+"""
+test_tool_cache.py — checks for the TTL / single-flight result cache (src/tool_cache.py)
+Run: python -m pytest -q test_tool_cache.py
+"""
+
+import threading
+import time
+
+import pytest
+
+from src.tool_cache import ResultCache, make_key
+
+
+def test_key_ignores_arg_order():
+    assert make_key("gmail.list", {"a": 1, "b": 2}) == make_key("gmail.list", {"b": 2, "a": 1})
+    assert make_key("gmail.list", {"a": 1}) != make_key("gmail.other", {"a": 1})
+
+
+def test_hit_until_ttl_expires():
+    cache, calls = ResultCache(), []
+    fn = lambda: calls.append(1) or len(calls)
+    assert cache.get_or_call("k", 0.2, fn) == 1
+    assert cache.get_or_call("k", 0.2, fn) == 1
+    time.sleep(0.25)
+    assert cache.get_or_call("k", 0.2, fn) == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_results_are_copies():
+    cache = ResultCache()
+    first = cache.get_or_call("k", 60, lambda: {"items": [1]})
+    first["items"].append(2)
+    assert cache.get_or_call("k", 60, lambda: None) == {"items": [1]}
+
+
+def test_concurrent_callers_share_one_call():
+    cache, release, calls = ResultCache(), threading.Event(), []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "inbox"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_call("k", 60, slow))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    while cache.stats()["shared"] < 4:  # everyone but the leader is waiting on its flight
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert results == ["inbox"] * 5
+    assert len(calls) == 1
+
+
+def test_failure_reaches_every_waiter_and_is_not_cached():
+    cache, release = ResultCache(), threading.Event()
+
+    def broken():
+        release.wait(5)
+        raise RuntimeError("gmail down")
+
+    errors = []
+
+    def caller():
+        try:
+            cache.get_or_call("k", 60, broken)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=caller) for _ in range(3)]
+    for t in threads:
+        t.start()
+    while cache.stats()["shared"] < 2:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert errors == ["gmail down"] * 3
+    assert cache.get_or_call("k", 60, lambda: "ok") == "ok"
+
+
+def test_interrupted_call_is_not_cached_and_frees_waiters():
+    cache = ResultCache()
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        cache.get_or_call("k", 60, interrupted)
+    assert cache.stats()["entries"] == 0
+    assert cache.get_or_call("k", 60, lambda: "ok") == "ok"
+
+
+def test_lru_eviction_and_invalidate():
+    cache = ResultCache(max_entries=2)
+    cache.get_or_call("a:1", 60, lambda: 1)
+    cache.get_or_call("b:1", 60, lambda: 2)
+    cache.get_or_call("a:1", 60, lambda: None)  # touch a, so b is the oldest
+    cache.get_or_call("c:1", 60, lambda: 3)
+    assert cache.stats()["evictions"] == 1
+    assert cache.get_or_call("a:1", 60, lambda: "miss") == 1
+    assert cache.get_or_call("b:1", 60, lambda: "miss") == "miss"
+    cache.invalidate("a")
+    assert cache.get_or_call("a:1", 60, lambda: "fresh") == "fresh"